@@ -0,0 +1,484 @@
+"""
+Webtoons Scan Scraper - офлайн-бенчмарк
+
+Запускає справжній конвеєр (JSON API -> аналіз зображень -> Google Drive)
+проти локальних замінників CDN pstatic.net та Drive API v3, без мережі
+і без браузера. Виводить images/s, MB/s, пікову RSS та p50/p95 стадій.
+
+    python benchmark.py --episodes 5 --images 40 --latency-ms 20 --bandwidth-kbps 4000
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import webtoons_scraper as scraper
+
+WEBTOON_NO = '9999'
+CDN_PREFIX = '/webtoon-phinf.pstatic.net'
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+
+
+# ============================================================================
+# SYNTHETIC IMAGES
+# ============================================================================
+
+def make_image(rng, width, height, fmt):
+    """Зображення з шумом (реалістичний розмір після стиснення) та смугами."""
+    from PIL import Image, ImageDraw
+
+    image = Image.merge('RGB', [Image.effect_noise((width, height), rng.randint(20, 60)) for _ in range(3)])
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 8)):
+        top = rng.randint(0, height - 1)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        draw.rectangle([0, top, width, min(height, top + rng.randint(20, 200))], fill=color)
+
+    buffer = io.BytesIO()
+    if fmt == 'jpg':
+        image.save(buffer, 'JPEG', quality=85)
+    else:
+        image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def build_episode_images(args, episode_no):
+    """
+    Returns:
+        list: [(шлях, байти)] у порядку сторінки - скани та дрібні UI-зображення
+    """
+    rng = random.Random(f"{args.seed}/{episode_no}")
+    images = []
+    for index in range(args.images):
+        if rng.random() < args.scan_ratio:
+            fmt = args.format if args.format != 'mixed' else rng.choice(['jpg', 'png'])
+            data = make_image(rng, 800, rng.randint(1500, 3000), fmt)
+        else:
+            # Іконки, аватари, банери інтерфейсу
+            fmt = 'png'
+            width, height = rng.choice([(64, 64), (120, 120), (800, 200), (300, 80)])
+            data = make_image(rng, width, height, fmt)
+        images.append((f"{CDN_PREFIX}/{WEBTOON_NO}/{episode_no}/{index:03d}_{uuid.UUID(int=rng.getrandbits(128)).hex[:12]}.{fmt}", data))
+    return images
+
+
+# ============================================================================
+# FAKE CDN + JSON API
+# ============================================================================
+
+def throttled_write(wfile, data, bandwidth_kbps):
+    """Пише відповідь частинами, обмежуючи швидкість одного з'єднання."""
+    if not bandwidth_kbps:
+        wfile.write(data)
+        return
+
+    chunk_size = 16 * 1024
+    bytes_per_second = bandwidth_kbps * 1024 / 8
+    for offset in range(0, len(data), chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        wfile.write(chunk)
+        time.sleep(len(chunk) / bytes_per_second)
+
+
+def make_cdn_handler(images, episodes_json, latency, bandwidth_kbps):
+    class CDNHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = urlparse(self.path).path
+
+            if path in episodes_json:
+                body = episodes_json[path].replace(b'{host}', self.headers['Host'].encode())
+                content_type = 'application/json'
+            elif path in images:
+                body = images[path]
+                content_type = 'image/jpeg' if path.endswith('.jpg') else 'image/png'
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                throttled_write(self.wfile, body, bandwidth_kbps if content_type != 'application/json' else 0)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клієнт перервав завантаження після заголовка - так і задумано
+                pass
+
+    return CDNHandler
+
+
+# ============================================================================
+# FAKE DRIVE API v3
+# ============================================================================
+
+class FakeDrive:
+    """Мінімальний стан Drive: файли та папки в пам'яті (без вмісту)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.sessions = {}
+        self.counter = 0
+
+    def add(self, metadata, data=None):
+        with self.lock:
+            self.counter += 1
+            file_id = f"file{self.counter}"
+            self.files[file_id] = {
+                'id': file_id,
+                'name': metadata.get('name', ''),
+                'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                'parents': metadata.get('parents') or ['root'],
+                'createdTime': f"2024-01-01T00:00:00.{self.counter:09d}Z",
+                'trashed': False
+            }
+            if data is not None:
+                self.files[file_id]['size'] = str(len(data))
+                self.files[file_id]['md5Checksum'] = hashlib.md5(data).hexdigest()
+            return dict(self.files[file_id])
+
+    def update(self, file_id, metadata, data):
+        """files.update з новим вмістом: ID і папка не змінюються."""
+        with self.lock:
+            file = self.files[file_id]
+            file['name'] = metadata.get('name', file['name'])
+            file['size'] = str(len(data))
+            file['md5Checksum'] = hashlib.md5(data).hexdigest()
+            return dict(file)
+
+    def query(self, q):
+        """Підтримує лише запити, які формує webtoons_scraper."""
+        name = re.search(r"name='((?:[^'\\]|\\.)*)'", q)
+        parent = re.search(r"'([^']+)' in parents", q)
+        folders_only = f"mimeType='{FOLDER_MIMETYPE}'" in q
+        no_folders = f"mimeType!='{FOLDER_MIMETYPE}'" in q
+
+        with self.lock:
+            result = []
+            for file in self.files.values():
+                is_folder = file['mimeType'] == FOLDER_MIMETYPE
+                if file['trashed'] or (folders_only and not is_folder) or (no_folders and is_folder):
+                    continue
+                if parent and parent.group(1) not in file['parents']:
+                    continue
+                if name and file['name'] != re.sub(r"\\(.)", r"\1", name.group(1)):
+                    continue
+                result.append(dict(file))
+        return sorted(result, key=lambda file: file['createdTime'])
+
+
+def parse_multipart_related(body, content_type):
+    boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+    parts = body.split(b'--' + boundary)
+    metadata_part, media_part = parts[1], parts[2]
+    separator = b'\r\n\r\n' if b'\r\n\r\n' in media_part else b'\n\n'
+    metadata = json.loads(metadata_part.split(separator, 1)[1].strip())
+    media = media_part.split(separator, 1)[1]
+    for line_end in (b'\r\n', b'\n'):
+        if media.endswith(line_end):
+            media = media[:-len(line_end)]
+            break
+    return metadata, media
+
+
+def make_drive_handler(drive, latency):
+    class DriveHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload, status=200, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def do_GET(self):
+            time.sleep(latency)
+            parsed = urlparse(self.path)
+            if parsed.path == '/drive/v3/files':
+                query = parse_qs(parsed.query).get('q', [''])[0]
+                self._send_json({'files': drive.query(query)})
+                return
+
+            file_id = parsed.path.rsplit('/', 1)[-1]
+            file = drive.files.get(file_id)
+            if file is None:
+                self._send_json({'error': {'code': 404, 'message': 'File not found'}}, 404)
+            else:
+                self._send_json(file)
+
+        def do_DELETE(self):
+            time.sleep(latency)
+            drive.files.pop(urlparse(self.path).path.rsplit('/', 1)[-1], None)
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            time.sleep(latency)
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            body = self._body()
+
+            if parsed.path == '/drive/v3/files':
+                self._send_json(drive.add(json.loads(body or b'{}')))
+                return
+
+            upload_type = params.get('uploadType', [''])[0]
+            if upload_type == 'multipart':
+                metadata, media = parse_multipart_related(body, self.headers['Content-Type'])
+                self._send_json(drive.add(metadata, media))
+            elif upload_type == 'resumable':
+                session_id = uuid.uuid4().hex
+                drive.sessions[session_id] = (json.loads(body or b'{}'), bytearray(), None)
+                location = f"http://{self.headers['Host']}{parsed.path}?uploadType=resumable&upload_id={session_id}"
+                self._send_json({}, headers={'Location': location})
+            else:
+                self._send_json({'error': {'code': 400, 'message': 'bad uploadType'}}, 400)
+
+        def do_PATCH(self):
+            time.sleep(latency)
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            body = self._body()
+            file_id = parsed.path.rsplit('/', 1)[-1]
+            if file_id not in drive.files:
+                self._send_json({'error': {'code': 404, 'message': 'File not found'}}, 404)
+                return
+
+            upload_type = params.get('uploadType', [''])[0]
+            if upload_type == 'multipart':
+                metadata, media = parse_multipart_related(body, self.headers['Content-Type'])
+                self._send_json(drive.update(file_id, metadata, media))
+            elif upload_type == 'resumable':
+                session_id = uuid.uuid4().hex
+                drive.sessions[session_id] = (json.loads(body or b'{}'), bytearray(), file_id)
+                location = f"http://{self.headers['Host']}{parsed.path}?uploadType=resumable&upload_id={session_id}"
+                self._send_json({}, headers={'Location': location})
+            else:
+                self._send_json({'error': {'code': 400, 'message': 'bad uploadType'}}, 400)
+
+        def do_PUT(self):
+            time.sleep(latency)
+            params = parse_qs(urlparse(self.path).query)
+            metadata, data, file_id = drive.sessions[params['upload_id'][0]]
+            data.extend(self._body())
+
+            # Content-Range: bytes 0-999/5000 або bytes */5000
+            total = self.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            if total.isdigit() and len(data) >= int(total):
+                if file_id:
+                    self._send_json(drive.update(file_id, metadata, bytes(data)))
+                else:
+                    self._send_json(drive.add(metadata, bytes(data)))
+                return
+
+            self.send_response(308)
+            if data:
+                self.send_header('Range', f"bytes=0-{len(data) - 1}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return DriveHandler
+
+
+# ============================================================================
+# SERVERS PROCESS
+# ============================================================================
+
+def serve(args, ready):
+    """Окремий процес: пікова RSS конвеєра не включає синтетичні дані."""
+    images = {}
+    episodes_json = {}
+    for episode_no in range(1, args.episodes + 1):
+        episode_images = build_episode_images(args, episode_no)
+        images.update(episode_images)
+        # Відповідь у дусі JSON інструменту перекладу; {host} підставляється при запиті
+        payload = {'episodeNo': episode_no, 'imageInfo': [
+            {'url': 'http://{host}' + path} for path, _ in episode_images
+        ]}
+        episodes_json[f"/api/episodes/{episode_no}"] = json.dumps(payload).encode()
+
+    cdn = ThreadingHTTPServer(('127.0.0.1', 0), make_cdn_handler(
+        images, episodes_json, args.latency_ms / 1000, args.bandwidth_kbps
+    ))
+    cdn.daemon_threads = True
+
+    drive = ThreadingHTTPServer(('127.0.0.1', 0), make_drive_handler(FakeDrive(), args.drive_latency_ms / 1000))
+    drive.daemon_threads = True
+
+    threading.Thread(target=drive.serve_forever, daemon=True).start()
+    ready.put({
+        'cdn_port': cdn.server_address[1],
+        'drive_port': drive.server_address[1],
+        'images': len(images),
+        'bytes': sum(len(data) for data in images.values())
+    })
+    cdn.serve_forever()
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def build_config(args, servers, workdir):
+    return {
+        'fast_path': {
+            'enabled': True,
+            'endpoint_template': f"http://127.0.0.1:{servers['cdn_port']}/api/episodes/{{episode_no}}",
+            'cache_file': os.path.join(workdir, 'fast_path.json')
+        },
+        'performance': {
+            'io_backend': args.io_backend,
+            'resumable_upload_threshold_mb': args.resumable_threshold_mb,
+            'pipeline': {'enabled': not args.sequential}
+        },
+        'transform': {'mode': args.transform},
+        'output': {'mode': args.output},
+        'sync': {'enabled': args.sync},
+        'storage': {
+            'backends': args.storage.split(','),
+            'local': {'root': os.path.join(workdir, 'local_storage')}
+        },
+        'image_cache': {'enabled': args.cache, 'dir': os.path.join(workdir, 'image_cache')},
+        'resume': {'enabled': True, 'manifest_file': os.path.join(workdir, 'run_manifest.sqlite')},
+        'classifier': {'model_file': os.path.join(workdir, 'scan_classifier.json')},
+        'metrics': {'report_file': None, 'progress_line': False},
+        'google_drive': {
+            'token_file': os.path.join(workdir, 'token.json'),
+            'folder_cache_file': os.path.join(workdir, 'folder_cache.json'),
+            'folder_path': 'benchmark',
+            'api_endpoint': f"http://127.0.0.1:{servers['drive_port']}/"
+        }
+    }
+
+
+def run_benchmark(args, servers):
+    from google.oauth2.credentials import Credentials
+
+    workdir = tempfile.mkdtemp(prefix='webtoons_bench_')
+    scraper.configure(config=build_config(args, servers, workdir))
+    scraper.FAST_PATH.set_cookies({'benchmark': '1'})
+
+    storage = scraper.create_storage(Credentials(token='benchmark'))
+
+    episodes = list(range(1, args.episodes + 1))
+    started = time.perf_counter()
+    try:
+        success, failed = scraper.run_job(None, storage, None, WEBTOON_NO, episodes, wait_for_login=False)
+    finally:
+        storage.close()
+        scraper.shutdown_async_engine()
+        scraper.shutdown_transform_pool()
+    elapsed = time.perf_counter() - started
+
+    summary = scraper.METRICS.summary()
+    downloaded = summary['stages'].get('image_fetch', {}).get('bytes', 0)
+    uploaded = summary['stages'].get('upload', {}).get('bytes', 0)
+    images = sum(episode['images'] for episode in summary['episodes'])
+
+    return {
+        'episodes_ok': success,
+        'episodes_failed': failed,
+        'elapsed_s': round(elapsed, 3),
+        'images': images,
+        'images_per_s': round(images / elapsed, 2),
+        'download_mb_per_s': round(downloaded / 1024 / 1024 / elapsed, 2),
+        'upload_mb_per_s': round(uploaded / 1024 / 1024 / elapsed, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': summary['stages']
+    }
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвеєра webtoons_scraper")
+    parser.add_argument('--episodes', type=int, default=3, help='кількість епізодів')
+    parser.add_argument('--images', type=int, default=30, help='зображень в епізоді')
+    parser.add_argument('--scan-ratio', type=float, default=0.7, help='частка сканів серед зображень')
+    parser.add_argument('--format', choices=['jpg', 'png', 'mixed'], default='mixed', help='формат сканів')
+    parser.add_argument('--latency-ms', type=float, default=20, help='затримка CDN на запит')
+    parser.add_argument('--bandwidth-kbps', type=int, default=0, help='швидкість одного з\'єднання CDN (0 - без обмеження)')
+    parser.add_argument('--drive-latency-ms', type=float, default=30, help='затримка Drive API на запит')
+    parser.add_argument('--io-backend', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--resumable-threshold-mb', type=float, default=5,
+                        help='з якого розміру завантажувати на Drive resumable-сесією')
+    parser.add_argument('--transform', choices=scraper.TRANSFORM_MODES, default='original',
+                        help='перекодування сканів перед завантаженням')
+    parser.add_argument('--output', choices=['files', 'cbz', 'zip'], default='files',
+                        help='окремі файли чи один архів на епізод')
+    parser.add_argument('--storage', default='drive',
+                        help='сховища через кому: drive, local (S3 потребує справжнього сервера)')
+    parser.add_argument('--sync', action='store_true', help='синхронізація папок епізодів (sync.enabled)')
+    parser.add_argument('--sequential', action='store_true', help='без конвеєра')
+    parser.add_argument('--cache', action='store_true', help='з дисковим кешем зображень')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='PATH', help='зберегти результат у JSON')
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    ready = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=serve, args=(args, ready), daemon=True)
+    server_process.start()
+
+    print("Генерація синтетичних зображень...")
+    servers = ready.get(timeout=600)
+    print(f"✓ {servers['images']} зображень, {servers['bytes'] / 1024 / 1024:.1f} MB")
+
+    try:
+        result = run_benchmark(args, servers)
+    finally:
+        server_process.terminate()
+
+    print("\n" + "=" * 70)
+    print("РЕЗУЛЬТАТ")
+    print("=" * 70)
+    print(f"Епізодів: {result['episodes_ok']} успішно, {result['episodes_failed']} з помилками")
+    print(f"Час: {result['elapsed_s']:.2f} с")
+    print(f"Зображень/с: {result['images_per_s']}")
+    print(f"Завантаження з CDN: {result['download_mb_per_s']} MB/s")
+    print(f"Завантаження на Drive: {result['upload_mb_per_s']} MB/s")
+    print(f"Пікова RSS: {result['peak_rss_mb']} MB")
+    scraper.METRICS.print_summary(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    return 0 if not result['episodes_failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Швидкий шлях (JSON API) на записаних відповідях translate.webtoons.com.
+
+tests/fixtures/translate_tool - записані XHR-відповіді сторінки епізоду 130
+(requests.json: requestId, URL, файл з тілом), відповіді API для епізодів
+130/131 та список зображень, який браузер зібрав для епізоду 131.
+У відповіді для 131 немає сканів (лише мініатюра й аватар) - промах
+швидкого шляху, після якого епізод має бути зібраний браузером.
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webtoons_scraper as scraper  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'translate_tool')
+WEBTOON_NO = '174'
+SITE = 'https://translate.webtoons.com'
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class RecordedDriver:
+    """Драйвер, що віддає записані тіла відповідей через Network.getResponseBody."""
+
+    def __init__(self):
+        self.bodies = {
+            entry['request_id']: read_fixture(entry['file'])
+            for entry in json.loads(read_fixture('requests.json'))
+        }
+
+    def execute_cdp_cmd(self, command, params):
+        assert command == 'Network.getResponseBody'
+        return {'body': self.bodies[params['requestId']], 'base64Encoded': False}
+
+
+class RecordedTracker:
+    def __init__(self):
+        self.json_responses = [
+            (entry['request_id'], entry['url']) for entry in json.loads(read_fixture('requests.json'))
+        ]
+
+
+class RecordedApiHandler(BaseHTTPRequestHandler):
+    """API епізодів: /api/v1/translate/episode?episodeNo=N -> episode_N.json."""
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        episode_no = parse_qs(parsed.query).get('episodeNo', [''])[0]
+        path = os.path.join(FIXTURES, f'episode_{episode_no}.json')
+        if parsed.path != '/api/v1/translate/episode' or not os.path.exists(path):
+            self.send_error(404)
+            return
+        body = read_fixture(os.path.basename(path)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def configured(tmp_path):
+    scraper.configure(config={
+        'fast_path': {'enabled': True, 'cache_file': str(tmp_path / 'fast_path.json')},
+        'resume': {'enabled': True, 'manifest_file': str(tmp_path / 'run_manifest.sqlite')},
+        'image_cache': {'enabled': False},
+        'dedup': {'enabled': False},
+        'metrics': {'report_file': None, 'progress_line': False},
+        'classifier': {'model_file': str(tmp_path / 'scan_classifier.json')},
+        'google_drive': {
+            'token_file': str(tmp_path / 'token.json'),
+            'folder_cache_file': str(tmp_path / 'folder_cache.json')
+        }
+    })
+    yield tmp_path
+    scraper.RUN_MANIFEST = None
+
+
+def use_recorded_api(api_server):
+    """Шаблон з discover, але з хостом локального сервера записаних відповідей."""
+    scraper.FAST_PATH.template = scraper.FAST_PATH.template.replace(SITE, api_server)
+    scraper.FAST_PATH.set_cookies({'NEO_SES': 'recorded'})
+
+
+def test_discover_picks_episode_endpoint(configured):
+    captured = scraper.extract_image_urls_from_json(read_fixture('episode_130.json'))
+    captured += scraper.extract_image_urls_from_json(read_fixture('profile.json'))
+
+    assert scraper.FAST_PATH.discover(RecordedDriver(), RecordedTracker(), WEBTOON_NO, 130, captured)
+    assert scraper.FAST_PATH.template == (
+        f'{SITE}/api/v1/translate/episode?webtoonNo={{webtoon_no}}&episodeNo={{episode_no}}'
+        '&language=UKR&teamVersion=0'
+    )
+    with open(configured / 'fast_path.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['endpoint_template'] == scraper.FAST_PATH.template
+
+
+def test_resolve_reads_recorded_episode(configured, api_server):
+    scraper.FAST_PATH.template = f'{SITE}/api/v1/translate/episode?webtoonNo={{webtoon_no}}&episodeNo={{episode_no}}'
+    use_recorded_api(api_server)
+
+    urls = scraper.FAST_PATH.resolve(WEBTOON_NO, 130)
+
+    assert [url.rsplit('/', 1)[1] for url in urls] == [
+        '174_130_001.jpg?type=q90', '174_130_002.jpg?type=q90', '174_130_003.jpg?type=q90',
+        'thumb_174_130.jpg?type=q90'
+    ]
+    assert scraper.FAST_PATH.resolve(WEBTOON_NO, 999) is None
+    assert scraper.FAST_PATH.failures == 1
+
+
+def test_list_without_scans_falls_back_to_browser(configured, api_server, monkeypatch):
+    scraper.FAST_PATH.template = f'{SITE}/api/v1/translate/episode?webtoonNo={{webtoon_no}}&episodeNo={{episode_no}}'
+    use_recorded_api(api_server)
+
+    browser_urls = json.loads(read_fixture('capture_131.json'))
+    browser_loads = []
+    uploaded = []
+
+    def collect_image_urls(driver, url, wait_for_login=False, tracker=None):
+        browser_loads.append(url)
+        return browser_urls, {'NEO_SES': 'recorded'}
+
+    def analyze_images(all_urls, cookies_dict, pending_urls, webtoon_no, episode_no, *args, **kwargs):
+        # Скан - усе, крім мініатюр і аватарів; не-скани записуються як skipped
+        scans = []
+        for idx, url in enumerate(all_urls, 1):
+            if pending_urls is not None and url not in pending_urls:
+                continue
+            if '/thumb_' in url or '/avatar_' in url:
+                scraper.RUN_MANIFEST.record_image(webtoon_no, episode_no, url, 'skipped', index=idx)
+            else:
+                scans.append({'url': url, 'index': idx, 'filename': f'{idx:03d}.jpg'})
+        return scans
+
+    def upload_episode_scans(storage, episode_no, scan_images, folder_id=None, webtoon_no=None, remote_files=None):
+        for scan in scan_images:
+            scraper.RUN_MANIFEST.record_image(webtoon_no, episode_no, scan['url'], 'uploaded', index=scan['index'])
+        uploaded.extend(scan['url'] for scan in scan_images)
+        return len(scan_images)
+
+    monkeypatch.setattr(scraper, 'prepare_episode_folder', lambda storage, webtoon_no, episode_no: ('folder', {}))
+    monkeypatch.setattr(scraper, 'collect_image_urls', collect_image_urls)
+    monkeypatch.setattr(scraper, 'analyze_images', analyze_images)
+    monkeypatch.setattr(scraper, 'upload_episode_scans', upload_episode_scans)
+    monkeypatch.setattr(scraper, 'CAPTURE_MODE', 'polling')
+
+    assert scraper.process_episode(None, None, WEBTOON_NO, 131)
+
+    assert len(browser_loads) == 1
+    assert uploaded == browser_urls[1:]
+    assert scraper.FAST_PATH.failures == 1
+    assert scraper.RUN_MANIFEST.episode_status(WEBTOON_NO, 131) == 'done'
+
+
+def test_episode_without_scans_is_not_done(configured):
+    scraper.RUN_MANIFEST.record_image(WEBTOON_NO, 131, 'https://webtoon-phinf.pstatic.net/thumb.jpg', 'skipped')
+
+    scraper.finish_episode(WEBTOON_NO, 131, 0, 0)
+
+    assert scraper.RUN_MANIFEST.episode_status(WEBTOON_NO, 131) == 'empty'
+    assert not scraper.is_episode_done(WEBTOON_NO, 131)
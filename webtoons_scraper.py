@@ -6,37 +6,45 @@ Webtoons Scan Scraper - GitHub Release v3.1
 
 import os
 import re
+import sys
 import time
 import json
+import math
+import queue
+import argparse
+import shutil
+import asyncio
+import base64
+import hashlib
+import sqlite3
+import tempfile
+import random
+import csv
+import threading
+import zipfile
 import requests
 from io import BytesIO
-from PIL import Image
-from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-
-from webdriver_manager.chrome import ChromeDriverManager
+# Selenium, Google API, PIL та webdriver-manager імпортуються в місці
+# використання: імпорт модуля має бути швидким і без побічних ефектів
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
-def load_config():
-    """Завантажує конфігурацію з config.json"""
-    config_file = 'config.json'
+def load_config(config_file='config.json', interactive=None):
+    """
+    Завантажує конфігурацію з config.json
+
+    Без терміналу (cron, планувальник) не чекає на редагування config.json,
+    а одразу завершується з помилкою.
+    """
+    if interactive is None:
+        interactive = sys.stdin.isatty()
 
     if not os.path.exists(config_file):
         if os.path.exists('config.example.json'):
@@ -48,6 +56,8 @@ def load_config():
                 json.dump(example, f, indent=2, ensure_ascii=False)
             print("✓ config.json створено!")
             print("\n⚠ УВАГА: Відредагуйте config.json перед запуском!")
+            if not interactive:
+                raise FileNotFoundError("config.json створено з прикладу - відредагуйте його та запустіть знову")
             input("\nНатисніть Enter після редагування config.json...")
         else:
             raise FileNotFoundError(
@@ -58,522 +68,5341 @@ def load_config():
     with open(config_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-CONFIG = load_config()
-
-# Chrome налаштування
-CHROME_USER_DATA_DIR = os.path.expanduser(CONFIG['chrome']['user_data_dir'])
-CHROME_PROFILE = CONFIG['chrome']['profile']
+# False у пакетному режимі (CLI): жодних input(), помилки входу завершують запуск
+INTERACTIVE = True
 
-# Фільтри зображень
-MIN_IMAGE_HEIGHT = CONFIG['image_filters']['min_height']
-MIN_IMAGE_WIDTH = CONFIG['image_filters']['min_width']
-MIN_ASPECT_RATIO = CONFIG['image_filters']['min_aspect_ratio']
-MIN_FILE_SIZE_KB = CONFIG['image_filters']['min_file_size_kb']
+# Коди завершення для планувальників
+EXIT_OK = 0
+EXIT_EPISODES_FAILED = 1
+EXIT_USAGE = 2
+EXIT_SESSION_EXPIRED = 3
+EXIT_FAILURE = 4
+EXIT_INTERRUPTED = 130
 
-# Паралельна обробка
-MAX_PARALLEL_DOWNLOADS = CONFIG['performance']['max_parallel_downloads']
-
-# Google Drive налаштування
-SCOPES = ['https://www.googleapis.com/auth/drive.file']
-CREDENTIALS_FILE = CONFIG['google_drive']['credentials_file']
-TOKEN_FILE = CONFIG['google_drive']['token_file']
+# Шаблони Network.setBlockedURLs для легкого профілю: шрифти, аналітика, медіа.
+# Зображення pstatic.net не блокуються - саме їхні запити ми збираємо.
+DEFAULT_BLOCKED_URLS = [
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*connect.facebook.com*', '*analytics.tiktok.com*',
+    '*lcs.naver.com*', '*wcs.naver.net*', '*nelo2-col*', '*sentry.io*',
+]
 
-# ⭐ НОВА СПРОЩЕНА СТРУКТУРА
-FOLDER_PATH = CONFIG['google_drive'].get('folder_path', 'скани')  # За замовчуванням "скани"
 
-# ============================================================================
-# WebDriver Setup
-# ============================================================================
+class SessionExpiredError(Exception):
+    """Сесія Webtoons або Google недійсна, а ввійти без користувача неможливо."""
 
-try:
-    print("Ініціалізація webdriver-manager...")
-    service = Service(ChromeDriverManager().install())
-    print("✓ ChromeDriver готовий")
-except Exception as e:
-    print(f"✗ Помилка: {e}")
-    service = None
+def apply_settings(config):
+    """
+    Встановлює константи модуля з конфігурації.
 
-# ============================================================================
-# GOOGLE DRIVE FUNCTIONS
-# ============================================================================
+    Відсутні ключі отримують значення за замовчуванням (як у
+    config.example.json), тож apply_settings({}) не читає жодних файлів.
+    """
+    global CHROME_USER_DATA_DIR, CHROME_PROFILE, CHROME_DEBUG_PORT, CHROME_WORKERS
+    global CHROME_WORKERS_HEADLESS, CHROME_WORKER_PROFILES_DIR, CHROME_DRIVER_PATH
+    global CHROME_DRIVER_CACHE_FILE, CAPTURE_CONFIG, CAPTURE_MODE, CAPTURE_SETTLE_TIME
+    global CAPTURE_FIRST_IMAGE_TIMEOUT, CAPTURE_POLL_INTERVAL, CAPTURE_LEAN, CAPTURE_BLOCKED_URLS
+    global CAPTURE_REUSE_BODIES, CAPTURE_BODY_BUFFER
+    global FAST_PATH_CONFIG, FAST_PATH_ENABLED
+    global FAST_PATH_TEMPLATE, FAST_PATH_CACHE_FILE, FAST_PATH_MAX_FAILURES, MIN_IMAGE_HEIGHT
+    global MIN_IMAGE_WIDTH, MIN_ASPECT_RATIO, MIN_FILE_SIZE_KB, MAX_PARALLEL_DOWNLOADS
+    global HEADER_PROBE_ENABLED, PROBE_CHUNK_SIZE, PROBE_MAX_BYTES, SCAN_MEMORY_LIMIT
+    global SCAN_SPOOL_DIR, PIPELINE_CONFIG, PIPELINE_ENABLED, PIPELINE_ANALYSIS_WORKERS
+    global PIPELINE_UPLOAD_WORKERS, PIPELINE_ANALYSIS_QUEUE_SIZE, PIPELINE_UPLOAD_QUEUE_SIZE
+    global IO_BACKEND, ASYNC_MAX_IN_FLIGHT, ASYNC_PER_HOST_LIMIT, MAX_PARALLEL_UPLOADS
+    global RETRY_CONFIG, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, ADAPTIVE_CONCURRENCY
+    global ADAPTIVE_MAX_CONCURRENCY
+    global RESUMABLE_UPLOAD_THRESHOLD, CREDENTIALS_FILE, TOKEN_FILE, DRIVE_API_ENDPOINT, DRIVE_UPLOAD_URL
+    global DRIVE_FILES_URL
+    global FOLDER_PATH
+    global FOLDER_CACHE_FILE, PREFETCH_FOLDERS, RESUME_CONFIG, RESUME_ENABLED, MANIFEST_FILE
+    global SEED_FROM_DRIVE, IMAGE_CACHE_CONFIG, IMAGE_CACHE_ENABLED, IMAGE_CACHE_DIR
+    global IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_REVALIDATE, METRICS_CONFIG, METRICS_REPORT_FILE
+    global PROGRESS_LINE, DEDUP_CONFIG, DEDUP_ENABLED, DEDUP_INDEX_FILE, DEDUP_SCOPE
+    global DEDUP_PERCEPTUAL, DEDUP_MAX_DISTANCE, TRANSFORM_CONFIG, TRANSFORM_MODE, TRANSFORM_WORKERS
+    global TRANSFORM_MIN_SAVING, OUTPUT_CONFIG, OUTPUT_MODE, ARCHIVE_OUTPUT, STORAGE_CONFIG
+    global STORAGE_BACKENDS, STORAGE_LOCAL_ROOT, STORAGE_S3, SYNC_CONFIG, SYNC_ENABLED, SYNC_PRUNE
+    global CLASSIFIER_CONFIG, CLASSIFIER_MODEL_FILE, CLASSIFIER_EXCLUDE_URLS
+
+    chrome = config.get('chrome', {})
+    image_filters = config.get('image_filters', {})
+    performance = config.get('performance', {})
+    google_drive = config.get('google_drive', {})
+
+    # Chrome налаштування
+    CHROME_USER_DATA_DIR = os.path.expanduser(chrome.get('user_data_dir', '~/.config/google-chrome-selenium'))
+    CHROME_PROFILE = chrome.get('profile', 'Default')
+    CHROME_DEBUG_PORT = chrome.get('debug_port', 9222)
+    CHROME_WORKERS = chrome.get('workers', 1)
+    CHROME_WORKERS_HEADLESS = chrome.get('workers_headless', True)
+    CHROME_WORKER_PROFILES_DIR = chrome.get('worker_profiles_dir')
+    CHROME_DRIVER_PATH = chrome.get('driver_path')
+    CHROME_DRIVER_CACHE_FILE = chrome.get('driver_cache_file', 'chromedriver_path.json')
+
+    # Збір URL зображень: "events" (CDP-події Network) або "polling" (старий режим)
+    CAPTURE_CONFIG = config.get('capture', {})
+    CAPTURE_MODE = CAPTURE_CONFIG.get('mode', 'events')
+    CAPTURE_SETTLE_TIME = CAPTURE_CONFIG.get('settle_time', 0.5)
+    CAPTURE_FIRST_IMAGE_TIMEOUT = CAPTURE_CONFIG.get('first_image_timeout', 10)
+    CAPTURE_POLL_INTERVAL = CAPTURE_CONFIG.get('poll_interval', 0.1)
+    # Легкий профіль: блокування зайвих запитів і мінімум фонової роботи Chrome
+    CAPTURE_LEAN = CAPTURE_CONFIG.get('lean', False)
+    CAPTURE_BLOCKED_URLS = CAPTURE_CONFIG.get('blocked_urls', DEFAULT_BLOCKED_URLS)
+    # Брати вміст зображень, уже отриманий браузером, замість повторного завантаження
+    CAPTURE_REUSE_BODIES = CAPTURE_CONFIG.get('reuse_browser_bodies', False)
+    CAPTURE_BODY_BUFFER = int(CAPTURE_CONFIG.get('body_buffer_mb', 256) * 1024 * 1024)
+
+    # Швидкий шлях: список зображень з JSON API замість завантаження сторінки
+    FAST_PATH_CONFIG = config.get('fast_path', {})
+    FAST_PATH_ENABLED = FAST_PATH_CONFIG.get('enabled', True)
+    FAST_PATH_TEMPLATE = FAST_PATH_CONFIG.get('endpoint_template')
+    FAST_PATH_CACHE_FILE = FAST_PATH_CONFIG.get('cache_file', 'fast_path.json')
+    FAST_PATH_MAX_FAILURES = FAST_PATH_CONFIG.get('max_failures', 3)
+
+    # Фільтри зображень
+    MIN_IMAGE_HEIGHT = image_filters.get('min_height', 1000)
+    MIN_IMAGE_WIDTH = image_filters.get('min_width', 400)
+    MIN_ASPECT_RATIO = image_filters.get('min_aspect_ratio', 1.5)
+    MIN_FILE_SIZE_KB = image_filters.get('min_file_size_kb', 100)
+
+    # Класифікатор сканів: пороги з --calibrate (model_file) замінюють image_filters
+    CLASSIFIER_CONFIG = config.get('classifier', {})
+    CLASSIFIER_MODEL_FILE = CLASSIFIER_CONFIG.get('model_file', 'scan_classifier.json')
+    CLASSIFIER_EXCLUDE_URLS = CLASSIFIER_CONFIG.get('exclude_url_patterns', [])
+
+    # Паралельна обробка
+    MAX_PARALLEL_DOWNLOADS = performance.get('max_parallel_downloads', 5)
+
+    # Визначення розмірів зображення за заголовком, без повного завантаження
+    HEADER_PROBE_ENABLED = performance.get('header_probe', True)
+    PROBE_CHUNK_SIZE = 16 * 1024
+    PROBE_MAX_BYTES = int(performance.get('probe_max_kb', 256) * 1024)
+
+    # Скільки даних сканів тримати в RAM; решта пишеться у тимчасові файли
+    SCAN_MEMORY_LIMIT = int(performance.get('scan_memory_limit_mb', 256) * 1024 * 1024)
+    SCAN_SPOOL_DIR = performance.get('spool_dir') or None
+
+    # Конвеєр: збір URL -> аналіз -> завантаження на Drive
+    PIPELINE_CONFIG = performance.get('pipeline', {})
+    PIPELINE_ENABLED = PIPELINE_CONFIG.get('enabled', True)
+    PIPELINE_ANALYSIS_WORKERS = max(1, PIPELINE_CONFIG.get('analysis_workers', 1))
+    PIPELINE_UPLOAD_WORKERS = max(1, PIPELINE_CONFIG.get('upload_workers', 2))
+    PIPELINE_ANALYSIS_QUEUE_SIZE = max(1, PIPELINE_CONFIG.get('analysis_queue_size', 2))
+    PIPELINE_UPLOAD_QUEUE_SIZE = max(1, PIPELINE_CONFIG.get('upload_queue_size', 2))
+
+    # I/O рушій: "threads" (requests + потоки) або "asyncio" (httpx, HTTP/2)
+    IO_BACKEND = performance.get('io_backend', 'threads')
+    ASYNC_MAX_IN_FLIGHT = max(1, performance.get('async_max_in_flight', 64))
+    ASYNC_PER_HOST_LIMIT = max(1, performance.get('async_per_host_limit', 32))
+
+    # Повтори при 429/5xx та адаптивна (AIMD) кількість паралельних запитів до хоста
+    RETRY_CONFIG = performance.get('retry', {})
+    RETRY_MAX_ATTEMPTS = max(1, RETRY_CONFIG.get('max_attempts', 5))
+    RETRY_BASE_DELAY = RETRY_CONFIG.get('base_delay', 0.5)
+    RETRY_MAX_DELAY = RETRY_CONFIG.get('max_delay', 60)
+    ADAPTIVE_CONCURRENCY = RETRY_CONFIG.get('adaptive_concurrency', True)
+    ADAPTIVE_MAX_CONCURRENCY = max(1, RETRY_CONFIG.get('max_concurrency', 16))
+
+    # Паралельні завантаження на Google Drive
+    MAX_PARALLEL_UPLOADS = max(1, performance.get('max_parallel_uploads', 4))
+    RESUMABLE_UPLOAD_THRESHOLD = int(performance.get('resumable_upload_threshold_mb', 5) * 1024 * 1024)
+
+    # Google Drive налаштування
+    CREDENTIALS_FILE = google_drive.get('credentials_file', 'credentials.json')
+    TOKEN_FILE = google_drive.get('token_file', 'token.json')
+
+    # Адреса Drive API (null - googleapis.com; інша - для benchmark.py)
+    DRIVE_API_ENDPOINT = google_drive.get('api_endpoint')
+    DRIVE_UPLOAD_URL = (DRIVE_API_ENDPOINT or 'https://www.googleapis.com/').rstrip('/') + '/upload/drive/v3/files'
+    DRIVE_FILES_URL = (DRIVE_API_ENDPOINT or 'https://www.googleapis.com/').rstrip('/') + '/drive/v3/files'
+
+    # ⭐ НОВА СПРОЩЕНА СТРУКТУРА
+    FOLDER_PATH = google_drive.get('folder_path', 'скани')  # За замовчуванням "скани"
+
+    # Кеш ID папок Drive (за замовчуванням поруч з token.json)
+    FOLDER_CACHE_FILE = google_drive.get(
+        'folder_cache_file',
+        os.path.join(os.path.dirname(TOKEN_FILE), 'folder_cache.json')
+    )
+    PREFETCH_FOLDERS = google_drive.get('prefetch_folders', True)
+
+    # Відновлення перерваних запусків
+    RESUME_CONFIG = config.get('resume', {})
+    RESUME_ENABLED = RESUME_CONFIG.get('enabled', True)
+    MANIFEST_FILE = RESUME_CONFIG.get(
+        'manifest_file',
+        os.path.join(os.path.dirname(TOKEN_FILE), 'run_manifest.sqlite')
+    )
+    SEED_FROM_DRIVE = RESUME_CONFIG.get('seed_from_drive', True)
+
+    # Локальний кеш завантажених зображень
+    IMAGE_CACHE_CONFIG = config.get('image_cache', {})
+    IMAGE_CACHE_ENABLED = IMAGE_CACHE_CONFIG.get('enabled', False)
+    IMAGE_CACHE_DIR = os.path.expanduser(IMAGE_CACHE_CONFIG.get('dir', 'image_cache'))
+    IMAGE_CACHE_MAX_BYTES = int(IMAGE_CACHE_CONFIG.get('max_size_mb', 2048) * 1024 * 1024)
+    IMAGE_CACHE_REVALIDATE = IMAGE_CACHE_CONFIG.get('revalidate', True)
+
+    # Метрики запуску: звіт JSON/CSV та рядок прогресу
+    METRICS_CONFIG = config.get('metrics', {})
+    METRICS_REPORT_FILE = METRICS_CONFIG.get('report_file', 'run_report.json')
+    PROGRESS_LINE = METRICS_CONFIG.get('progress_line', False)
+
+    # Дедуплікація сканів за вмістом (md5 та, за бажанням, перцептивним хешем)
+    DEDUP_CONFIG = config.get('dedup', {})
+    DEDUP_ENABLED = DEDUP_CONFIG.get('enabled', False)
+    DEDUP_INDEX_FILE = DEDUP_CONFIG.get(
+        'index_file',
+        os.path.join(os.path.dirname(TOKEN_FILE), 'dedup_index.sqlite')
+    )
+    DEDUP_SCOPE = DEDUP_CONFIG.get('scope', 'folder')
+    DEDUP_PERCEPTUAL = DEDUP_CONFIG.get('perceptual', False)
+    DEDUP_MAX_DISTANCE = DEDUP_CONFIG.get('max_distance', 4)
+
+    # Перекодування сканів перед завантаженням (пул процесів)
+    TRANSFORM_CONFIG = config.get('transform', {})
+    TRANSFORM_MODE = TRANSFORM_CONFIG.get('mode', 'original')
+    TRANSFORM_WORKERS = max(1, TRANSFORM_CONFIG.get('workers') or os.cpu_count() or 1)
+    TRANSFORM_MIN_SAVING = TRANSFORM_CONFIG.get('min_saving', 0.05)
+
+    # Формат результату: окремі файли в папці епізоду або один CBZ/ZIP на епізод
+    OUTPUT_CONFIG = config.get('output', {})
+    OUTPUT_MODE = OUTPUT_CONFIG.get('mode', 'files')
+    ARCHIVE_OUTPUT = OUTPUT_MODE in ('cbz', 'zip')
+
+    # Сховища сканів: "drive", "local", "s3"; кілька - запис в усі за один прохід
+    STORAGE_CONFIG = config.get('storage', {})
+    STORAGE_BACKENDS = STORAGE_CONFIG.get('backends', ['drive'])
+    STORAGE_LOCAL_ROOT = os.path.expanduser(STORAGE_CONFIG.get('local', {}).get('root', 'scans'))
+    STORAGE_S3 = STORAGE_CONFIG.get('s3', {})
+
+    # Синхронізація папки епізоду: пропуск незмінених, оновлення змінених, видалення зайвих
+    SYNC_CONFIG = config.get('sync', {})
+    SYNC_ENABLED = SYNC_CONFIG.get('enabled', False)
+    SYNC_PRUNE = SYNC_CONFIG.get('prune', False)
 
-def get_google_drive_service():
-    """Автентифікація та повернення Google Drive API service."""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"Файл '{CREDENTIALS_FILE}' не знайдено!\n"
-                    f"Завантажте credentials.json з Google Cloud Console.\n"
-                    f"Див. інструкцію в SETUP.md"
-                )
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-    return build('drive', 'v3', credentials=creds)
 
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
 
-def find_or_create_folder(service, folder_name, parent_id=None):
-    """Знаходить або створює папку в Google Drive."""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    else:
-        query += " and 'root' in parents"
+# ⭐ Імпорт модуля не читає файлів і не звертається до мережі: до виклику
+# configure() діють значення за замовчуванням, а спільні кеші не створені
+CONFIG = {}
+apply_settings(CONFIG)
 
-    results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-    files = results.get('files', [])
+FOLDER_CACHE = None
+RUN_MANIFEST = None
+IMAGE_CACHE = None
+DEDUP_INDEX = None
+FAST_PATH = None
+_CONFIGURED = False
 
-    if files:
-        print(f"  ✓ Знайдено: {folder_name}")
-        return files[0]['id']
 
-    file_metadata = {
-        'name': folder_name,
-        'mimeType': 'application/vnd.google-apps.folder'
-    }
-    if parent_id:
-        file_metadata['parents'] = [parent_id]
+def configure(config_file='config.json', config=None, interactive=None):
+    """
+    Завантажує конфігурацію та створює спільні кеші модуля.
 
-    folder = service.files().create(body=file_metadata, fields='id').execute()
-    print(f"  ✓ Створено: {folder_name}")
-    return folder['id']
+    Викликається точками входу (main) автоматично; інструменти, що
+    імпортують модуль, можуть передати власний словник config. Без
+    виклику configure() публічні функції (run_job, analyze_images,
+    find_or_create_folder, ...) читають config.json через ensure_configured.
+    """
+    global CONFIG, SCAN_MEMORY, FOLDER_CACHE, RUN_MANIFEST, IMAGE_CACHE, DEDUP_INDEX, FAST_PATH, METRICS
+    global SCAN_CLASSIFIER, _CONFIGURED
 
+    if config is None:
+        config = load_config(config_file, interactive)
 
-def create_folder_structure(service, episode_no):
-    """
-    ⭐ СПРОЩЕНА ВЕРСІЯ: Створює структуру папок за шляхом з config.json
+    CONFIG = config
+    apply_settings(config)
 
-    Приклади шляхів:
-    - "скани" -> створює папку "скани" в корені
-    - "TOG/скани" -> створює TOG/скани
-    - "TOG/нові розділи/скани" -> створює TOG/нові розділи/скани
+    SCAN_MEMORY = MemoryBudget(SCAN_MEMORY_LIMIT)
+    FOLDER_CACHE = FolderCache(FOLDER_CACHE_FILE)
+    RUN_MANIFEST = RunManifest(MANIFEST_FILE) if RESUME_ENABLED else None
+    IMAGE_CACHE = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_ENABLED else None
+    DEDUP_INDEX = DedupIndex(DEDUP_INDEX_FILE) if DEDUP_ENABLED else None
+    FAST_PATH = FastPathResolver(FAST_PATH_CACHE_FILE, FAST_PATH_TEMPLATE) if FAST_PATH_ENABLED else None
+    METRICS = RunMetrics()
+    SCAN_CLASSIFIER = ScanClassifier.load(CLASSIFIER_MODEL_FILE)
+    RATE_LIMITERS.clear()
+    _CONFIGURED = True
 
-    Завжди додає підпапку з номером епізоду: шлях/{episode_no}/
-    """
-    print(f"Налаштування папок для епізоду {episode_no}...")
 
-    # Розбиваємо шлях на частини
-    path_parts = [part.strip() for part in FOLDER_PATH.split('/') if part.strip()]
+def ensure_configured():
+    """configure() з config.json, якщо модуль ще не налаштовано."""
+    if not _CONFIGURED:
+        configure()
 
-    if not path_parts:
-        # Якщо шлях порожній, використовуємо корінь
-        parent_id = None
-    else:
-        # Створюємо/знаходимо кожну папку в шляху
-        parent_id = None
-        for folder_name in path_parts:
-            parent_id = find_or_create_folder(service, folder_name, parent_id)
 
-    # Створюємо папку з номером епізоду
-    episode_folder_id = find_or_create_folder(service, str(episode_no), parent_id)
+# ============================================================================
+# WebDriver Setup
+# ============================================================================
 
-    return episode_folder_id
+_CHROME_SERVICE = None
+_CHROME_SERVICE_LOCK = threading.Lock()
 
 
-def verify_uploaded_file(service, file_id, original_size):
+def get_chrome_service():
     """
-    ⭐ НОВА ФУНКЦІЯ: Перевіряє правильність завантаженого файлу
+    Повертає Service ChromeDriver, встановлюючи драйвер лише за потреби.
 
-    Returns:
-        bool: True якщо файл валідний
+    Шлях до драйвера береться з chrome.driver_path або з файлу
+    CHROME_DRIVER_CACHE_FILE; webdriver-manager (мережа + диск)
+    запускається тільки якщо збереженого драйвера більше немає.
     """
-    try:
-        # Отримуємо метадані файлу з Drive
-        file_metadata = service.files().get(fileId=file_id, fields='size,md5Checksum').execute()
+    global _CHROME_SERVICE
 
-        uploaded_size = int(file_metadata.get('size', 0))
+    with _CHROME_SERVICE_LOCK:
+        if _CHROME_SERVICE:
+            return _CHROME_SERVICE
 
-        # Перевіряємо розмір (допускаємо відхилення 1%)
-        size_diff = abs(uploaded_size - original_size) / original_size
-        if size_diff > 0.01:
-            print(f"    ⚠ Розмір не співпадає: {uploaded_size} != {original_size}")
-            return False
+        from selenium.webdriver.chrome.service import Service
 
-        return True
+        driver_path = CHROME_DRIVER_PATH
+        if not driver_path and os.path.exists(CHROME_DRIVER_CACHE_FILE):
+            try:
+                with open(CHROME_DRIVER_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    driver_path = json.load(f).get('driver_path')
+            except (OSError, ValueError):
+                driver_path = None
 
-    except Exception as e:
-        print(f"    ⚠ Помилка перевірки: {e}")
-        return False
+        if not driver_path or not os.path.exists(driver_path):
+            from webdriver_manager.chrome import ChromeDriverManager
 
+            try:
+                print("Ініціалізація webdriver-manager...")
+                driver_path = ChromeDriverManager().install()
+                print("✓ ChromeDriver готовий")
+            except Exception as e:
+                raise Exception(f"ChromeDriver не ініціалізовано: {e}")
 
-def upload_to_drive(service, file_data, filename, folder_id):
-    """Завантажує файл на Google Drive з перевіркою."""
-    file_metadata = {'name': filename, 'parents': [folder_id]}
+            try:
+                with open(CHROME_DRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+                    json.dump({'driver_path': driver_path}, f, indent=2)
+            except OSError as e:
+                print(f"⚠ Не вдалося зберегти шлях до ChromeDriver: {e}")
 
-    mimetype = 'image/png'
-    if file_data.startswith(b'\xff\xd8'):
-        mimetype = 'image/jpeg'
+        _CHROME_SERVICE = Service(driver_path)
+        return _CHROME_SERVICE
 
-    media = MediaIoBaseUpload(BytesIO(file_data), mimetype=mimetype, resumable=True)
 
-    try:
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,size'
-        ).execute()
-
-        file_id = file.get('id')
-        original_size = len(file_data)
-
-        # ⭐ Перевірка завантаження
-        if verify_uploaded_file(service, file_id, original_size):
-            print(f"  ✓ Завантажено: {filename} ({original_size/1024:.1f} KB)")
-        else:
-            print(f"  ⚠ Завантажено з попередженням: {filename}")
+def reset_chrome_service(stale_service):
+    """
+    Забуває збережений ChromeDriver, який не запустив сесію (Chrome оновився).
 
-        return file_id
+    Якщо інший потік уже замінив stale_service, нічого не робить, тож
+    драйвер перевстановлюється один раз.
+    """
+    global _CHROME_SERVICE
 
-    except Exception as e:
-        print(f"  ✗ Помилка завантаження {filename}: {e}")
-        raise
+    with _CHROME_SERVICE_LOCK:
+        if _CHROME_SERVICE is not stale_service:
+            return
+        _CHROME_SERVICE = None
+        try:
+            os.remove(CHROME_DRIVER_CACHE_FILE)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠ Не вдалося видалити {CHROME_DRIVER_CACHE_FILE}: {e}")
 
 
 # ============================================================================
-# WEB SCRAPING FUNCTIONS
+# METRICS
 # ============================================================================
 
-def setup_selenium_driver():
-    """Налаштування Selenium WebDriver."""
-    chrome_options = Options()
-
-    chrome_options.add_argument(f"user-data-dir={CHROME_USER_DATA_DIR}")
-    chrome_options.add_argument(f"profile-directory={CHROME_PROFILE}")
-
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--remote-debugging-port=9222")
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_argument("--window-size=1920,1080")
+class RunMetrics:
+    """
+    ⭐ Спани стадій запуску та підсумки по епізодах.
 
-    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    Кожен спан - словник з назвою стадії, тривалістю, байтами, кількістю
+    повторів та помилкою. В кінці запуску write_report зводить їх у
+    p50/p95 по стадіях і пропускну здатність по епізодах (JSON або CSV).
+    """
 
-    if not service:
-        raise Exception("ChromeDriver не ініціалізовано")
+    STAGES = ('page_load', 'network_idle', 'api_resolve', 'image_fetch', 'classify',
+              'transform', 'folder', 'upload', 'verify')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.spans = []
+        self.episodes = {}
+        self.counters = {'images': 0, 'scans': 0, 'uploaded': 0, 'bytes': 0}
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """
+        Вимірює блок коду. Блок може доповнити спан: span['bytes'] = ...,
+        span['retries'] += 1. Виняток записується як error і прокидається далі.
+        """
+        record = {'stage': stage, 'bytes': 0, 'retries': 0, 'error': None}
+        record.update(attrs)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['duration'] = time.perf_counter() - start
+            with self._lock:
+                self.spans.append(record)
+
+    def add_span(self, stage, duration, **attrs):
+        """Спан, виміряний поза блоком with (напр. робота в пулі процесів)."""
+        record = {'stage': stage, 'bytes': 0, 'retries': 0, 'error': None, 'duration': duration}
+        record.update(attrs)
+        with self._lock:
+            self.spans.append(record)
+
+    def _episode(self, webtoon_no, episode_no):
+        key = f"{webtoon_no}/{episode_no}"
+        if key not in self.episodes:
+            self.episodes[key] = {
+                'webtoon_no': str(webtoon_no), 'episode_no': episode_no,
+                'started': time.time(), 'finished': None,
+                'images': 0, 'scans': 0, 'uploaded': 0, 'duplicates': 0,
+                'bytes_downloaded': 0, 'bytes_uploaded': 0
+            }
+        return self.episodes[key]
+
+    def episode_started(self, webtoon_no, episode_no):
+        with self._lock:
+            self._episode(webtoon_no, episode_no)
+
+    def episode_add(self, webtoon_no, episode_no, **counts):
+        """Додає лічильники епізоду (images, scans, uploaded, bytes_*)."""
+        with self._lock:
+            episode = self._episode(webtoon_no, episode_no)
+            for name, value in counts.items():
+                episode[name] += value
+
+    def episode_finished(self, webtoon_no, episode_no):
+        with self._lock:
+            self._episode(webtoon_no, episode_no)['finished'] = time.time()
+
+    def progress(self, images=0, scans=0, uploaded=0, nbytes=0):
+        """Оновлює лічильники та (з PROGRESS_LINE) перемальовує рядок прогресу."""
+        with self._lock:
+            self.counters['images'] += images
+            self.counters['scans'] += scans
+            self.counters['uploaded'] += uploaded
+            self.counters['bytes'] += nbytes
+            counters = dict(self.counters)
+
+        if PROGRESS_LINE:
+            elapsed = max(time.time() - self.started, 1e-6)
+            mb = counters['bytes'] / 1024 / 1024
+            print(f"\r📊 Зображень: {counters['images']} | сканів: {counters['scans']} | "
+                  f"завантажено: {counters['uploaded']} | {mb:.1f} MB, {mb / elapsed:.2f} MB/s   ",
+                  end="", flush=True)
+
+    @staticmethod
+    def percentile(values, pct):
+        """Перцентиль за найближчим рангом (values відсортовано)."""
+        if not values:
+            return 0.0
+        rank = max(0, min(len(values) - 1, math.ceil(pct * len(values) / 100) - 1))
+        return values[rank]
+
+    def summary(self):
+        """
+        Returns:
+            dict: {'duration', 'stages': {стадія: {...}}, 'episodes': [...]}
+        """
+        with self._lock:
+            spans = list(self.spans)
+            episodes = [dict(episode) for episode in self.episodes.values()]
+
+        stages = {}
+        for stage in self.STAGES + tuple(sorted({span['stage'] for span in spans} - set(self.STAGES))):
+            stage_spans = [span for span in spans if span['stage'] == stage]
+            if not stage_spans:
+                continue
+            durations = sorted(span['duration'] for span in stage_spans)
+            total_bytes = sum(span['bytes'] for span in stage_spans)
+            total_time = sum(durations)
+            stages[stage] = {
+                'count': len(stage_spans),
+                'total_s': round(total_time, 3),
+                'p50_ms': round(self.percentile(durations, 50) * 1000, 1),
+                'p95_ms': round(self.percentile(durations, 95) * 1000, 1),
+                'bytes': total_bytes,
+                'mb_per_s': round(total_bytes / 1024 / 1024 / total_time, 2) if total_time else 0.0,
+                'retries': sum(span['retries'] for span in stage_spans),
+                'errors': sum(1 for span in stage_spans if span['error'])
+            }
+
+        for episode in episodes:
+            elapsed = (episode['finished'] or time.time()) - episode['started']
+            episode['duration_s'] = round(elapsed, 3)
+            episode['images_per_s'] = round(episode['images'] / elapsed, 2) if elapsed else 0.0
+            episode['mb_per_s'] = round(episode['bytes_downloaded'] / 1024 / 1024 / elapsed, 2) if elapsed else 0.0
+            del episode['started'], episode['finished']
 
-    print(f"Використання Chrome профілю: {CHROME_USER_DATA_DIR}/{CHROME_PROFILE}")
-    print("Запуск Chrome драйвера...")
+        return {
+            'duration_s': round(time.time() - self.started, 3),
+            'stages': stages,
+            'episodes': episodes
+        }
 
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    print("✓ Chrome драйвер запущено успішно")
-    return driver
+    def write_report(self, path):
+        """Зберігає підсумок у JSON або CSV (за розширенням файлу)."""
+        summary = self.summary()
+
+        if path.lower().endswith('.csv'):
+            fields = ['kind', 'name', 'count', 'total_s', 'p50_ms', 'p95_ms', 'bytes', 'mb_per_s',
+                      'retries', 'errors', 'images', 'scans', 'uploaded', 'duplicates', 'duration_s',
+                      'images_per_s']
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+                writer.writeheader()
+                for stage, row in summary['stages'].items():
+                    writer.writerow({'kind': 'stage', 'name': stage, **row})
+                for episode in summary['episodes']:
+                    writer.writerow({
+                        'kind': 'episode',
+                        'name': f"{episode['webtoon_no']}/{episode['episode_no']}",
+                        'bytes': episode['bytes_downloaded'],
+                        **episode
+                    })
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
 
+        return summary
 
-def wait_for_network_idle_and_collect_images(driver, timeout=30, idle_time=2):
-    """Очікує завершення Network запитів та збирає URLs зображень."""
-    print(f"Очікування завершення завантаження (макс {timeout}с)...", end=" ", flush=True)
+    def print_summary(self, summary):
+        print("\nСтадія           к-сть     p50 мс     p95 мс    MB/s  помилки")
+        for stage, row in summary['stages'].items():
+            print(f"{stage:15s} {row['count']:6d} {row['p50_ms']:10.1f} {row['p95_ms']:10.1f} "
+                  f"{row['mb_per_s']:7.2f} {row['errors']:8d}")
 
-    import json
 
-    start_time = time.time()
-    last_request_time = start_time
-    previous_count = 0
+METRICS = RunMetrics()
 
-    image_urls = []
-    seen_urls = set()
 
-    while time.time() - start_time < timeout:
-        logs = driver.get_log('performance')
-        current_count = len(logs)
+# ============================================================================
+# RETRY / RATE LIMITING
+# ============================================================================
 
-        for entry in logs:
-            try:
-                log = entry.get('message', '')
+# 503 теж означає перевантаження: на нього, як і на 429, зменшуємо паралельність
+THROTTLE_STATUSES = (429, 503)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
 
-                if 'Network.responseReceived' in log:
-                    log_data = json.loads(log)
-                    response = log_data.get('message', {}).get('params', {}).get('response', {})
-                    url = response.get('url', '')
-                    mime_type = response.get('mimeType', '')
 
-                    if 'image' in mime_type and 'pstatic.net' in url:
-                        if url not in seen_urls:
-                            seen_urls.add(url)
-                            image_urls.append(url)
+class RetryableError(Exception):
+    """Тимчасова помилка сервера: запит варто повторити пізніше."""
 
-            except:
-                continue
+    def __init__(self, message, retry_after=None, throttled=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.throttled = throttled
 
-        if current_count > previous_count:
-            last_request_time = time.time()
-            previous_count = current_count
 
-        if time.time() - last_request_time >= idle_time:
-            elapsed = time.time() - start_time
-            print(f"✓ Завершено за {elapsed:.1f}с (знайдено {len(image_urls)} зображень)")
-            return image_urls
+def parse_retry_after(value):
+    """Retry-After у секундах (число або HTTP-дата). None, якщо не задано."""
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
-        time.sleep(0.5)
 
-    elapsed = time.time() - start_time
-    print(f"⚠ Timeout через {elapsed:.1f}с (знайдено {len(image_urls)} зображень)")
-    return image_urls
+def classify_status(status, headers=None, body=''):
+    """
+    Returns:
+        RetryableError або None, якщо відповідь не потребує повтору
+    """
+    throttled = status in THROTTLE_STATUSES
+    if status == 403 and any(reason in (body or '') for reason in RATE_LIMIT_REASONS):
+        # Квота Drive: 403 userRateLimitExceeded / rateLimitExceeded
+        throttled = True
+    elif status not in RETRYABLE_STATUSES:
+        return None
 
+    retry_after = parse_retry_after((headers or {}).get('Retry-After') or (headers or {}).get('retry-after'))
+    return RetryableError(f"HTTP {status}", retry_after=retry_after, throttled=throttled)
 
-def extract_filename_from_url(url):
-    """Витягує оригінальну назву файлу з URL."""
-    parsed = urlparse(url)
-    filename = os.path.basename(parsed.path)
 
-    if not filename or len(filename) < 5:
-        match = re.search(r'/([a-zA-Z0-9_-]{10,})\.(jpg|jpeg|png|gif)', url, re.IGNORECASE)
-        if match:
-            filename = f"{match.group(1)}.{match.group(2)}"
-        else:
-            import hashlib
-            url_hash = hashlib.md5(url.encode()).hexdigest()[:12]
-            filename = f"scan_{url_hash}.jpg"
+def check_response(response):
+    """raise_for_status, але 429/5xx/квота Drive стають RetryableError (requests і httpx)."""
+    if response.status_code >= 400:
+        body = response.text if response.status_code == 403 else ''
+        error = classify_status(response.status_code, response.headers, body)
+        if error:
+            raise error
+    response.raise_for_status()
 
-    return filename
 
+def as_retryable(error):
+    """
+    Перетворює виняток HTTP-клієнта на RetryableError, якщо запит варто повторити.
 
-def get_image_dimensions_and_size(img_url, cookies_dict):
-    """Завантажує зображення та отримує його властивості."""
-    try:
-        response = requests.get(img_url, cookies=cookies_dict, timeout=20)
+    Returns:
+        RetryableError або None
+    """
+    if isinstance(error, RetryableError):
+        return error
 
-        if response.status_code == 200:
-            img_data = response.content
+    # googleapiclient.errors.HttpError: статус у resp, тіло в content
+    resp = getattr(error, 'resp', None)
+    if resp is not None and hasattr(resp, 'status'):
+        content = getattr(error, 'content', b'') or b''
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        return classify_status(int(resp.status), resp, content)
 
-            try:
-                img = Image.open(BytesIO(img_data))
-                width, height = img.size
-                size_kb = len(img_data) / 1024
-                filename = extract_filename_from_url(img_url)
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return RetryableError(str(error))
 
-                return width, height, size_kb, img_data, filename
-            except:
-                return None
+    httpx = sys.modules.get('httpx')
+    if httpx and isinstance(error, httpx.TransportError):
+        return RetryableError(str(error))
 
-    except:
-        pass
     return None
 
 
-def analyze_single_image(img_url, cookies_dict, index, total):
-    """Аналізує одне зображення (для паралельної обробки)."""
-    result = get_image_dimensions_and_size(img_url, cookies_dict)
-
-    if result:
-        width, height, size_kb, img_data, filename = result
-        is_scan = is_likely_scan(width, height, size_kb)
-
-        return {
-            'url': img_url,
-            'width': width,
-            'height': height,
-            'size_kb': size_kb,
-            'img_data': img_data,
-            'filename': filename,
-            'is_scan': is_scan,
-            'index': index
-        }
-
-    return None
-
+def may_have_been_applied(error):
+    """
+    Чи міг сервер виконати запит, що завершився помилкою.
 
-def is_likely_scan(width, height, size_kb):
-    """Визначає, чи є зображення сканом."""
-    if height < MIN_IMAGE_HEIGHT and size_kb < MIN_FILE_SIZE_KB:
+    Обрив під час встановлення з'єднання та тротлінг (429, квота Drive)
+    означають, що запит не виконано; timeout читання, обрив після відправки
+    та 5xx - ні того, ні іншого гарантувати не можна.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
         return False
-    if width < MIN_IMAGE_WIDTH:
+    httpx = sys.modules.get('httpx')
+    if httpx and isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
         return False
+    retryable = as_retryable(error)
+    return retryable is not None and not retryable.throttled
 
-    aspect_ratio = height / width if width > 0 else 0
 
-    if height >= MIN_IMAGE_HEIGHT or size_kb >= MIN_FILE_SIZE_KB:
-        if aspect_ratio >= MIN_ASPECT_RATIO:
-            return True
+def backoff_delay(attempt, retry_after=None):
+    """Експоненційна затримка з jitter; Retry-After сервера має пріоритет."""
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY)
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
 
-    return False
 
+class AdaptiveLimiter:
+    """
+    ⭐ AIMD-обмеження паралельних запитів до одного хоста.
 
-def scrape_scan_images(driver, url, wait_for_login=False):
-    """Збирає скани зображень зі сторінки."""
-    print(f"Завантаження сторінки: {url}")
-    driver.get(url)
+    Поки відповіді успішні, ліміт зростає приблизно на 1 за "вікно"
+    (+1/limit на кожну успішну відповідь), до стелі хоста (див. get_limiter).
+    На 429/503/квоту Drive ліміт зменшується вдвічі (не частіше разу
+    на вікно), а з Retry-After нові запити до хоста не стартують,
+    доки не мине вказаний час.
+    """
 
-    if wait_for_login:
-        print("\n" + "=" * 70)
-        print("⚠️  НЕОБХІДНИЙ ВХІД В АКАУНТ")
-        print("=" * 70)
-        print("1. Має відкритися вікно Chrome")
-        print("2. Увійдіть в акаунт на translate.webtoons.com")
-        print("3. Переконайтесь, що інтерфейс перекладу завантажився")
-        print("4. Натисніть Enter тут після входу")
-        print("=" * 70)
-        input("👉 Натисніть Enter після входу...")
-        print("✓ Продовжуємо...\n")
+    def __init__(self, host, initial, maximum):
+        self.host = host
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, initial), self.maximum))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _can_start(self):
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.paused_until
+
+    def raise_maximum(self, maximum):
+        """Піднімає стелю (хост використовує викликач з більшим лімітом)."""
+        with self._cond:
+            self.maximum = max(self.maximum, maximum)
+
+    def try_acquire(self):
+        with self._cond:
+            if not self._can_start():
+                return False
+            self.in_flight += 1
+            return True
 
-    image_urls = wait_for_network_idle_and_collect_images(driver, timeout=30, idle_time=2)
+    def acquire(self):
+        with self._cond:
+            while not self._can_start():
+                self._cond.wait(timeout=max(0.05, self.paused_until - time.monotonic()))
+            self.in_flight += 1
 
-    print("Прокручування для завантаження всіх зображень...")
-    for i in range(2):
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(1)
+    async def acquire_async(self):
+        while not self.try_acquire():
+            await asyncio.sleep(0.05)
 
-    driver.execute_script("window.scrollTo(0, 0);")
+    def release(self, outcome):
+        """outcome: 'ok', 'throttled' або 'error' (помилка, що не стосується навантаження)."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == 'ok':
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == 'throttled' and now - self._last_decrease > 1.0:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+                print(f"⚠ {self.host}: обмеження запитів, паралельність -> {int(self.limit)}")
+            self._cond.notify_all()
 
-    additional_urls = wait_for_network_idle_and_collect_images(driver, timeout=15, idle_time=1.5)
+    def pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
 
-    all_urls = image_urls + [url for url in additional_urls if url not in image_urls]
 
-    if not all_urls:
-        print("⚠ Зображення не знайдено. Переконайтесь, що ви увійшли в акаунт!")
-        return []
+RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
 
-    print(f"Всього унікальних зображень: {len(all_urls)}")
 
-    selenium_cookies = driver.get_cookies()
-    cookies_dict = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
+def get_limiter(url, initial):
+    """
+    Спільний AdaptiveLimiter хоста (None, якщо адаптивний режим вимкнено).
 
-    print(f"Аналіз зображень (паралельний режим, {MAX_PARALLEL_DOWNLOADS} потоків)...")
+    Стеля - ADAPTIVE_MAX_CONCURRENCY або власний ліміт викликача, якщо він
+    більший (напр. async_per_host_limit рушія asyncio): адаптивний режим
+    лише знижує паралельність на 429/503, а не обрізає налаштований ліміт.
+    """
+    if not ADAPTIVE_CONCURRENCY:
+        return None
+    host = urlparse(url).netloc or url
+    maximum = max(ADAPTIVE_MAX_CONCURRENCY, initial)
+    with _RATE_LIMITERS_LOCK:
+        limiter = RATE_LIMITERS.get(host)
+        if limiter is None:
+            limiter = RATE_LIMITERS[host] = AdaptiveLimiter(host, initial, maximum)
+        elif limiter.maximum < maximum:
+            limiter.raise_maximum(maximum)
+        return limiter
+
+
+def _after_attempt(limiter, error, attempt, span):
+    """
+    Спільна логіка повторів для потокового та asyncio-варіантів.
 
-    scan_images = []
+    Returns:
+        float: затримка перед наступною спробою; виняток, якщо повтору не буде
+    """
+    retryable = as_retryable(error)
+    if limiter:
+        limiter.release('throttled' if retryable and retryable.throttled else 'error')
+        if retryable and retryable.throttled and retryable.retry_after:
+            limiter.pause(retryable.retry_after)
 
-    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS) as executor:
-        futures = {
-            executor.submit(analyze_single_image, url, cookies_dict, idx, len(all_urls)): url
-            for idx, url in enumerate(all_urls, 1)
-        }
+    if retryable is None or attempt == RETRY_MAX_ATTEMPTS - 1:
+        raise error
 
-        for future in as_completed(futures):
-            result = future.result()
+    if span is not None:
+        span['retries'] += 1
+    return backoff_delay(attempt, retryable.retry_after)
 
-            if result:
-                idx = result['index']
-                width = result['width']
-                height = result['height']
-                size_kb = result['size_kb']
-                filename = result['filename']
-                is_scan = result['is_scan']
-
-                display_name = filename[:30] if len(filename) > 30 else filename
-                print(f"[{idx}/{len(all_urls)}] {display_name:30s} {width}x{height}, {size_kb:.1f}KB", end=" ")
-
-                if is_scan:
-                    print("✓ СКАН")
-                    scan_images.append({
-                        'data': result['img_data'],
-                        'filename': filename,
-                        'index': idx
-                    })
-                else:
-                    print("✗ Пропуск")
 
-    scan_images.sort(key=lambda x: x['index'])
+def call_with_retry(func, url, initial_concurrency, span=None, recover=None):
+    """
+    Викликає func() з повторами при тимчасових помилках та AIMD-лімітом хоста url.
 
-    return scan_images
+    recover - для неідемпотентних запитів (створення файлу чи папки): якщо
+    невдала спроба могла виконатися на сервері, перед повтором recover()
+    шукає створений нею об'єкт; знайдений об'єкт повертається замість повтору.
+    """
+    limiter = get_limiter(url, initial_concurrency)
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        if limiter:
+            limiter.acquire()
+        try:
+            result = func()
+        except Exception as e:
+            time.sleep(_after_attempt(limiter, e, attempt, span))
+            if recover and may_have_been_applied(e):
+                result = recover()
+                if result is not None:
+                    return result
+            continue
+        if limiter:
+            limiter.release('ok')
+        return result
+
+
+async def call_with_retry_async(coro_factory, url, initial_concurrency, span=None, recover=None):
+    """
+    Asyncio-варіант call_with_retry: coro_factory() створює нову корутину на кожну спробу,
+    recover() - корутину пошуку об'єкта, який могла створити невдала спроба.
+    """
+    limiter = get_limiter(url, initial_concurrency)
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        if limiter:
+            await limiter.acquire_async()
+        try:
+            result = await coro_factory()
+        except Exception as e:
+            await asyncio.sleep(_after_attempt(limiter, e, attempt, span))
+            if recover and may_have_been_applied(e):
+                result = await recover()
+                if result is not None:
+                    return result
+            continue
+        if limiter:
+            limiter.release('ok')
+        return result
+
+
+def execute_with_retry(request, span=None, recover=None):
+    """request.execute() клієнта googleapiclient з повторами та лімітом хоста Drive."""
+    return call_with_retry(request.execute, DRIVE_UPLOAD_URL, MAX_PARALLEL_UPLOADS, span, recover)
 
 
 # ============================================================================
-# MAIN EXECUTION
+# SCAN BUFFERS
 # ============================================================================
 
-def process_episode(driver, drive_service, webtoon_no, episode_no, is_first_episode=False):
-    """Обробляє один епізод."""
-    print("\n" + "=" * 70)
-    print(f"ОБРОБКА ЕПІЗОДУ {episode_no}")
-    print("=" * 70)
-
-    url = f"https://translate.webtoons.com/translate/tool?webtoonNo={webtoon_no}&episodeNo={episode_no}&language=UKR&teamVersion=0"
-
-    try:
-        folder_id = create_folder_structure(drive_service, episode_no)
-        print(f"✓ Папка Google Drive готова: {FOLDER_PATH}/{episode_no}/\n")
-    except Exception as e:
-        print(f"✗ Помилка налаштування папок: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+class MemoryBudget:
+    """Спільний для всіх потоків ліміт байтів, які скани займають у RAM."""
 
-    try:
-        scan_images = scrape_scan_images(driver, url, wait_for_login=is_first_episode)
-
-        print(f"\n✓ Знайдено {len(scan_images)} скан(ів)")
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
 
-        if not scan_images:
-            print("⚠ Скани не знайдено.")
-            print("  → Переконайтесь, що ви увійшли в акаунт")
-            print("  → Перевірте, чи є скани в цьому епізоді")
+    def try_acquire(self, size):
+        with self._lock:
+            if self.used + size > self.limit:
+                return False
+            self.used += size
             return True
 
-        print("Завантаження на Google Drive...")
-        successful_uploads = 0
+    def release(self, size):
+        with self._lock:
+            self.used -= size
 
-        for scan in scan_images:
-            img_data = scan['data']
-            filename = scan['filename']
 
-            try:
-                upload_to_drive(drive_service, img_data, filename, folder_id)
-                successful_uploads += 1
-            except Exception as upload_err:
-                print(f"  ✗ Помилка завантаження {filename}: {upload_err}")
+SCAN_MEMORY = MemoryBudget(SCAN_MEMORY_LIMIT)
 
-        print(f"\n✓ Епізод {episode_no}: завантажено {successful_uploads}/{len(scan_images)} файлів")
-        return True
 
-    except Exception as e:
-        print(f"✗ Помилка: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+class ScanFile:
+    """
+    ⭐ Дані одного скану з обмеженим використанням пам'яті.
 
+    Дані пишуться частинами (write) і лишаються в RAM, поки вистачає
+    SCAN_MEMORY; інакше все переноситься у тимчасовий файл на диску.
+    md5/sha256 рахуються під час запису, тож для перевірки завантаження
+    та маніфесту файл не потрібно перечитувати.
+    """
 
-def main():
-    """Головна функція виконання."""
-    print("=" * 70)
-    print("WEBTOONS SCRAPER v3.1")
-    print("=" * 70)
-    print()
+    HEAD_SIZE = 16
+
+    def __init__(self):
+        self.size = 0
+        self.head = b''
+        self.md5 = None
+        self.sha256 = None
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self._buffer = bytearray()
+        self._reserved = 0
+        self._file = None
+        self._path = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        scan_file = cls()
+        scan_file.write(data)
+        return scan_file.finish()
+
+    @classmethod
+    def from_path(cls, path, chunk_size=1024 * 1024):
+        scan_file = cls()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                scan_file.write(chunk)
+        return scan_file.finish()
+
+    @property
+    def on_disk(self):
+        return self._path is not None
+
+    @property
+    def path(self):
+        """Шлях до тимчасового файлу (None, якщо дані в RAM)."""
+        return self._path
+
+    def write(self, chunk):
+        self._md5.update(chunk)
+        self._sha256.update(chunk)
+        if len(self.head) < self.HEAD_SIZE:
+            self.head = (self.head + chunk[:self.HEAD_SIZE])[:self.HEAD_SIZE]
+        self.size += len(chunk)
+
+        if self._path is None:
+            if SCAN_MEMORY.try_acquire(len(chunk)):
+                self._reserved += len(chunk)
+                self._buffer.extend(chunk)
+                return
+            self._spill()
+
+        self._file.write(chunk)
+
+    def _spill(self):
+        """Переносить накопичене в тимчасовий файл та звільняє бюджет RAM."""
+        fd, self._path = tempfile.mkstemp(prefix='scan_', dir=SCAN_SPOOL_DIR)
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+        SCAN_MEMORY.release(self._reserved)
+        self._reserved = 0
+
+    def finish(self):
+        """Завершує запис. Повертає self."""
+        self.md5 = self._md5.hexdigest()
+        self.sha256 = self._sha256.hexdigest()
+        if self._file:
+            self._file.close()
+            self._file = None
+        return self
+
+    def open(self):
+        """Файловий об'єкт для читання (BytesIO або файл на диску)."""
+        if self._path:
+            return open(self._path, 'rb')
+        return BytesIO(self._buffer)
+
+    def read(self, offset=0, length=None):
+        """Читає дані (або їх частину) як bytes."""
+        if self._path is None:
+            end = self.size if length is None else offset + length
+            return bytes(self._buffer[offset:end])
+        with open(self._path, 'rb') as f:
+            f.seek(offset)
+            return f.read() if length is None else f.read(length)
+
+    def copy_to(self, path):
+        """Копіює дані у файл (потоково, якщо скан на диску)."""
+        with open(path, 'wb') as out:
+            if self._path is None:
+                out.write(self._buffer)
+            else:
+                with open(self._path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        out.write(chunk)
+
+    def release(self):
+        """Звільняє RAM або видаляє тимчасовий файл. Після цього дані недоступні."""
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._path:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+        self._buffer = bytearray()
+        SCAN_MEMORY.release(self._reserved)
+        self._reserved = 0
 
-    try:
-        webtoon_no = input("Введіть номер Webtoon (напр. 174): ").strip()
-        start_episode = int(input("Введіть ПОЧАТКОВИЙ епізод (напр. 130): ").strip())
-        end_episode = int(input("Введіть КІНЦЕВИЙ епізод (напр. 135): ").strip())
 
-        if not webtoon_no or start_episode <= 0 or end_episode < start_episode:
-            print("✗ Невалідні дані")
-            return
+# ============================================================================
+# GOOGLE DRIVE FUNCTIONS
+# ============================================================================
 
-    except (ValueError, KeyboardInterrupt):
-        print("\n✗ Скасовано")
-        return
+def get_google_credentials(interactive=True):
+    """
+    Автентифікація в Google та повернення OAuth credentials.
 
-    try:
-        drive_service = get_google_drive_service()
-        print("✓ Google Drive автентифіковано")
-        print(f"✓ Структура папок: {FOLDER_PATH}/[номер_епізоду]/\n")
-    except Exception as e:
-        print(f"✗ Помилка Google Drive: {e}")
-        return
+    З interactive=False не відкриває браузер для входу: без дійсного
+    (або оновлюваного) token.json одразу піднімає SessionExpiredError.
+    """
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
+    creds = None
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            if not os.path.exists(CREDENTIALS_FILE):
+                raise FileNotFoundError(
+                    f"Файл '{CREDENTIALS_FILE}' не знайдено!\n"
+                    f"Завантажте credentials.json з Google Cloud Console.\n"
+                    f"Див. інструкцію в SETUP.md"
+                )
+            if not interactive:
+                raise SessionExpiredError(
+                    f"Немає дійсного '{TOKEN_FILE}' - запустіть скрипт інтерактивно для входу в Google"
+                )
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+            creds = flow.run_local_server(port=0)
+        with open(TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+
+def get_google_drive_service(creds=None):
+    """
+    Повертає Google Drive API service.
+
+    Клієнт googleapiclient не є потокобезпечним, тому кожен потік конвеєра
+    створює власний service з тими самими credentials.
+    """
+    from googleapiclient.discovery import build
+
+    if creds is None:
+        creds = get_google_credentials()
+    client_options = None
+    if DRIVE_API_ENDPOINT:
+        client_options = {'api_endpoint': DRIVE_API_ENDPOINT.rstrip('/') + '/drive/v3/'}
+    return build('drive', 'v3', credentials=creds, client_options=client_options)
+
+
+class FolderCache:
+    """
+    ⭐ Кеш шлях -> ID папки Google Drive, що зберігається між запусками.
+
+    Ключ - пара (ID батьківської папки, назва). ID з файлу перевіряється
+    в Drive один раз за запуск, перш ніж його використати.
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._validated = set()
+        self.entries = {}
+
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Кеш папок пошкоджено, створюємо новий: {e}")
+
+    @staticmethod
+    def make_key(parent_id, folder_name):
+        return f"{parent_id or 'root'}/{folder_name}"
+
+    def lock_for(self, key):
+        """Окремий lock на кожну папку: потоки не створять її двічі."""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        with self._lock:
+            return self.entries.get(key)
+
+    def is_validated(self, key):
+        with self._lock:
+            return key in self._validated
+
+    def set(self, key, folder_id, save=True):
+        """Запам'ятовує перевірений ID папки."""
+        with self._lock:
+            self.entries[key] = folder_id
+            self._validated.add(key)
+            if save:
+                self._save()
+
+    def invalidate(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+            self._validated.discard(key)
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # Атомарний запис: при падінні лишається попередня версія файлу
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"⚠ Не вдалося зберегти кеш папок: {e}")
+
+
+
+def _escape_query(value):
+    """Екранує значення для рядка запиту Drive (q=...)."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def _list_folders(service, parent_id, folder_name=None):
+    """Повертає всі папки в батьківській (від найстарішої), з урахуванням сторінок."""
+    query = f"mimeType='{FOLDER_MIMETYPE}' and trashed=false"
+    query += f" and '{parent_id or 'root'}' in parents"
+    if folder_name is not None:
+        query += f" and name='{_escape_query(folder_name)}'"
+
+    folders = []
+    page_token = None
+    while True:
+        results = execute_with_retry(service.files().list(
+            q=query,
+            spaces='drive',
+            fields='nextPageToken, files(id, name, createdTime)',
+            orderBy='createdTime',
+            pageSize=1000,
+            pageToken=page_token
+        ))
+        folders.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return folders
+
+
+def list_folder_files(service, folder_id, all_copies=False):
+    """
+    Одним переліком отримує файли папки Drive.
+
+    Returns:
+        dict: {назва: {'id', 'size', 'md5Checksum'}}; з all_copies - list усіх
+        файлів (Drive допускає кілька файлів з однією назвою)
+    """
+    query = f"'{folder_id}' in parents and trashed=false and mimeType!='{FOLDER_MIMETYPE}'"
+
+    files = [] if all_copies else {}
+    page_token = None
+    while True:
+        results = execute_with_retry(service.files().list(
+            q=query,
+            spaces='drive',
+            fields='nextPageToken, files(id, name, size, md5Checksum)',
+            pageSize=1000,
+            pageToken=page_token
+        ))
+        for file in results.get('files', []):
+            if all_copies:
+                files.append(file)
+            else:
+                files.setdefault(file['name'], file)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def _folder_exists(service, folder_id):
+    """Перевіряє, що закешована папка досі існує і не в кошику."""
+    try:
+        folder = execute_with_retry(service.files().get(fileId=folder_id, fields='id,trashed'))
+        return not folder.get('trashed', False)
+    except Exception:
+        return False
+
+
+def find_or_create_folder(service, folder_name, parent_id=None):
+    """Знаходить або створює папку в Google Drive (з кешем ID)."""
+    ensure_configured()
+    key = FolderCache.make_key(parent_id, folder_name)
+
+    with FOLDER_CACHE.lock_for(key):
+        folder_id = FOLDER_CACHE.get(key)
+        if folder_id:
+            if FOLDER_CACHE.is_validated(key):
+                return folder_id
+            if _folder_exists(service, folder_id):
+                FOLDER_CACHE.set(key, folder_id, save=False)
+                print(f"  ✓ Знайдено (кеш): {folder_name}")
+                return folder_id
+            FOLDER_CACHE.invalidate(key)
+
+        # Промах кешу: шукаємо в Drive перед створенням
+        files = _list_folders(service, parent_id, folder_name)
+
+        if files:
+            print(f"  ✓ Знайдено: {folder_name}")
+            FOLDER_CACHE.set(key, files[0]['id'])
+            return files[0]['id']
+
+        file_metadata = {
+            'name': folder_name,
+            'mimeType': FOLDER_MIMETYPE
+        }
+        if parent_id:
+            file_metadata['parents'] = [parent_id]
+
+        # create не ідемпотентний: після обриву спершу шукаємо папку, яку він міг створити
+        folder = execute_with_retry(
+            service.files().create(body=file_metadata, fields='id'),
+            recover=lambda: next(iter(_list_folders(service, parent_id, folder_name)), None)
+        )
+        folder_id = folder['id']
+
+        # Інший процес міг створити таку саму папку одночасно з нами:
+        # лишаємо найстарішу, а свою дублікат-папку видаляємо
+        files = _list_folders(service, parent_id, folder_name)
+        if files and files[0]['id'] != folder_id:
+            print(f"  ⚠ Папку {folder_name} вже створено паралельно, використовуємо існуючу")
+            try:
+                execute_with_retry(service.files().delete(fileId=folder_id))
+            except Exception as e:
+                print(f"  ⚠ Не вдалося видалити дублікат папки: {e}")
+            folder_id = files[0]['id']
+        else:
+            print(f"  ✓ Створено: {folder_name}")
+
+        FOLDER_CACHE.set(key, folder_id)
+        return folder_id
+
+
+def resolve_parent_folder(service):
+    """Знаходить/створює папки шляху FOLDER_PATH. Повертає ID останньої (None - корінь)."""
+    # Розбиваємо шлях на частини
+    path_parts = [part.strip() for part in FOLDER_PATH.split('/') if part.strip()]
+
+    # Створюємо/знаходимо кожну папку в шляху
+    parent_id = None
+    for folder_name in path_parts:
+        parent_id = find_or_create_folder(service, folder_name, parent_id)
+
+    return parent_id
+
+
+def create_folder_structure(service, episode_no):
+    """
+    ⭐ СПРОЩЕНА ВЕРСІЯ: Створює структуру папок за шляхом з config.json
+
+    Приклади шляхів:
+    - "скани" -> створює папку "скани" в корені
+    - "TOG/скани" -> створює TOG/скани
+    - "TOG/нові розділи/скани" -> створює TOG/нові розділи/скани
+
+    Завжди додає підпапку з номером епізоду: шлях/{episode_no}/
+    """
+    ensure_configured()
+    print(f"Налаштування папок для епізоду {episode_no}...")
+
+    parent_id = resolve_parent_folder(service)
+
+    # Створюємо папку з номером епізоду
+    episode_folder_id = find_or_create_folder(service, str(episode_no), parent_id)
+
+    return episode_folder_id
+
+
+def prefetch_episode_folders(service, episodes):
+    """
+    ⭐ Одним переліком батьківської папки знаходить папки всіх епізодів пакету.
+
+    Знайдені ID потрапляють у кеш як перевірені, тож create_folder_structure
+    для цих епізодів не робить жодного запиту до Drive.
+
+    Returns:
+        int: кількість знайдених папок епізодів
+    """
+    ensure_configured()
+    parent_id = resolve_parent_folder(service)
+    wanted = {str(episode_no) for episode_no in episodes}
+
+    found = {}
+    for folder in _list_folders(service, parent_id):
+        # Список відсортовано за createdTime: при дублікатах лишається найстаріша
+        if folder['name'] in wanted and folder['name'] not in found:
+            found[folder['name']] = folder['id']
+
+    for folder_name, folder_id in found.items():
+        FOLDER_CACHE.set(FolderCache.make_key(parent_id, folder_name), folder_id, save=False)
+
+    # Папки, яких немає в Drive, не мають лишатися в кеші
+    for folder_name in wanted - found.keys():
+        key = FolderCache.make_key(parent_id, folder_name)
+        if FOLDER_CACHE.get(key):
+            FOLDER_CACHE.invalidate(key)
+
+    FOLDER_CACHE.save()
+    return len(found)
+
+
+def check_uploaded_metadata(file_metadata, scan_file):
+    """
+    Порівнює розмір та md5 файлу на Drive з локальними даними.
+
+    Returns:
+        bool: True якщо файл валідний
+    """
+    original_size = scan_file.size
+    uploaded_size = int(file_metadata.get('size', 0))
+
+    # Перевіряємо розмір (допускаємо відхилення 1%)
+    size_diff = abs(uploaded_size - original_size) / original_size
+    if size_diff > 0.01:
+        print(f"    ⚠ Розмір не співпадає: {uploaded_size} != {original_size}")
+        return False
+
+    remote_md5 = file_metadata.get('md5Checksum')
+    if remote_md5 and remote_md5 != scan_file.md5:
+        print(f"    ⚠ md5 не співпадає: {remote_md5}")
+        return False
+
+    return True
+
+
+def detect_mimetype(file_data):
+    """Визначає MIME-тип зображення (або архіву епізоду) за сигнатурою (перші байти файлу)."""
+    if file_data.startswith(b'PK\x03\x04'):
+        return 'application/zip'
+    if file_data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if file_data.startswith(b'GIF8'):
+        return 'image/gif'
+    if file_data[:4] == b'RIFF' and file_data[8:12] == b'WEBP':
+        return 'image/webp'
+    if file_data[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return 'image/png'
+
+
+class DriveUploader:
+    """
+    ⭐ Паралельне завантаження файлів на Google Drive.
+
+    Малі файли відправляються одним multipart-запитом, resumable-сесія
+    відкривається лише для файлів, більших за RESUMABLE_UPLOAD_THRESHOLD.
+    Усі потоки використовують одну AuthorizedSession зі спільним пулом
+    HTTP-з'єднань (keep-alive), а перевірка береться з відповіді create.
+    """
+
+    RESPONSE_FIELDS = 'id,size,md5Checksum'
+    CHUNK_SIZE = 8 * 1024 * 1024  # кратно 256 KB, як вимагає Drive API
+
+    def __init__(self, creds, max_workers=None):
+        self.creds = creds
+        self.max_workers = max_workers or MAX_PARALLEL_UPLOADS
+        # Потоків більше за стартовий ліміт: AdaptiveLimiter сам вирішує, скільки з них працює
+        self.pool_size = max(self.max_workers, ADAPTIVE_MAX_CONCURRENCY) if ADAPTIVE_CONCURRENCY else self.max_workers
+        self._refresh_lock = threading.Lock()
+
+        from google.auth.transport.requests import AuthorizedSession
+
+        self.session = AuthorizedSession(creds)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=self.pool_size
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size)
+
+    def close(self):
+        """Зупиняє потоки та закриває з'єднання."""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _ensure_token(self):
+        """Оновлює токен один раз, навіть якщо він протух у кількох потоках."""
+        from google.auth.transport.requests import Request
+
+        with self._refresh_lock:
+            if not self.creds.valid:
+                self.creds.refresh(Request())
+
+    @staticmethod
+    def build_multipart_body(metadata, mimetype, data):
+        """
+        Returns:
+            tuple: (тіло multipart/related, значення Content-Type)
+        """
+        boundary = f"==webtoons{hashlib.md5(os.urandom(16)).hexdigest()}=="
+        body = b''.join([
+            f"--{boundary}\r\n".encode(),
+            b"Content-Type: application/json; charset=UTF-8\r\n\r\n",
+            json.dumps(metadata).encode('utf-8'),
+            f"\r\n--{boundary}\r\n".encode(),
+            f"Content-Type: {mimetype}\r\n\r\n".encode(),
+            data,
+            f"\r\n--{boundary}--".encode(),
+        ])
+        return body, f'multipart/related; boundary={boundary}'
+
+    @staticmethod
+    def next_resumable_offset(response_headers):
+        """308: сервер повідомляє, скільки байтів уже отримано."""
+        received = response_headers.get('Range')
+        return int(received.split('-')[1]) + 1 if received else 0
+
+    @staticmethod
+    def upload_target(file_id):
+        """
+        Returns:
+            tuple: (HTTP-метод, URL) - створення файлу або оновлення вмісту наявного
+        """
+        if file_id:
+            return 'PATCH', f"{DRIVE_UPLOAD_URL}/{file_id}"
+        return 'POST', DRIVE_UPLOAD_URL
+
+    def _upload_multipart(self, scan_file, metadata, mimetype, file_id=None):
+        """Один запит: метадані та вміст файлу в тілі multipart/related."""
+        body, content_type = self.build_multipart_body(metadata, mimetype, scan_file.read())
+        method, url = self.upload_target(file_id)
+
+        response = self.session.request(
+            method, url,
+            params={'uploadType': 'multipart', 'fields': self.RESPONSE_FIELDS},
+            data=body,
+            headers={'Content-Type': content_type},
+            timeout=120
+        )
+        check_response(response)
+        return response.json()
+
+    def _upload_resumable(self, scan_file, metadata, mimetype, file_id=None):
+        """Resumable-сесія для великих файлів, завантаження частинами."""
+        total = scan_file.size
+        method, url = self.upload_target(file_id)
+        response = self.session.request(
+            method, url,
+            params={'uploadType': 'resumable', 'fields': self.RESPONSE_FIELDS},
+            json=metadata,
+            headers={
+                'X-Upload-Content-Type': mimetype,
+                'X-Upload-Content-Length': str(total),
+            },
+            timeout=60
+        )
+        check_response(response)
+        session_url = response.headers['Location']
+
+        offset = 0
+        while True:
+            # Читаємо з ScanFile лише поточну частину, а не весь файл
+            chunk = scan_file.read(offset, self.CHUNK_SIZE)
+            end = offset + len(chunk) - 1
+            response = self.session.put(
+                session_url,
+                data=chunk,
+                headers={'Content-Range': f'bytes {offset}-{end}/{total}'},
+                timeout=120
+            )
+
+            if response.status_code in (200, 201):
+                return response.json()
+            if response.status_code != 308:
+                check_response(response)
+
+            offset = self.next_resumable_offset(response.headers)
+
+    @classmethod
+    def uploaded_query(cls, filename, folder_id):
+        """Параметри files.list для пошуку файлу з такою назвою в папці."""
+        return {
+            'q': f"name='{_escape_query(filename)}' and '{folder_id}' in parents and trashed=false",
+            'spaces': 'drive',
+            'fields': f'files({cls.RESPONSE_FIELDS})',
+        }
+
+    @staticmethod
+    def match_uploaded(response, scan_file, filename):
+        """Файл зі списку, що збігається зі ScanFile за розміром і md5, або None."""
+        check_response(response)
+        for file in response.json().get('files', []):
+            if file.get('md5Checksum') == scan_file.md5 and int(file.get('size', 0)) == scan_file.size:
+                print(f"  ↺ {filename} вже створено обірваною спробою, не завантажуємо вдруге")
+                return file
+        return None
+
+    def _find_uploaded(self, scan_file, filename, folder_id):
+        """Шукає файл, який могла створити спроба create, що завершилась обривом чи 5xx."""
+        self._ensure_token()
+        response = self.session.get(DRIVE_FILES_URL, params=self.uploaded_query(filename, folder_id), timeout=60)
+        return self.match_uploaded(response, scan_file, filename)
+
+    def upload(self, scan_file, filename, folder_id, file_id=None):
+        """
+        Завантажує один файл (ScanFile) та перевіряє його за відповіддю create.
+        З file_id замінює вміст наявного файлу (files.update), ID не змінюється.
+
+        Returns:
+            str: ID файлу на Drive
+        """
+        # parents при оновленні не передається - файл лишається у своїй папці
+        metadata = {'name': filename} if file_id else {'name': filename, 'parents': [folder_id]}
+        mimetype = detect_mimetype(scan_file.head)
+
+        def attempt():
+            self._ensure_token()
+            if scan_file.size > RESUMABLE_UPLOAD_THRESHOLD:
+                return self._upload_resumable(scan_file, metadata, mimetype, file_id)
+            return self._upload_multipart(scan_file, metadata, mimetype, file_id)
+
+        # Оновлення за file_id ідемпотентне; створення повторюємо лише після пошуку
+        recover = None if file_id else (lambda: self._find_uploaded(scan_file, filename, folder_id))
+
+        try:
+            with METRICS.span('upload', bytes=scan_file.size) as span:
+                file = call_with_retry(attempt, DRIVE_UPLOAD_URL, self.max_workers, span, recover)
+
+            return self._report(file, scan_file, filename)
+
+        except Exception as e:
+            print(f"  ✗ Помилка завантаження {filename}: {e}")
+            raise
+
+    @staticmethod
+    def _report(file, scan_file, filename):
+        """Перевіряє відповідь create та повертає ID файлу."""
+        with METRICS.span('verify') as span:
+            valid = check_uploaded_metadata(file, scan_file)
+            if not valid:
+                span['error'] = 'mismatch'
+
+        if not valid:
+            print(f"  ⚠ Завантажено з попередженням: {filename}")
+        elif not PROGRESS_LINE:
+            print(f"  ✓ Завантажено: {filename} ({scan_file.size/1024:.1f} KB)")
+
+        METRICS.progress(uploaded=1)
+        return file['id']
+
+    def submit(self, scan, folder_id):
+        """
+        Ставить скан у чергу завантаження. Повертає Future з ID файлу.
+        scan['replace_id'] - ID файлу, вміст якого треба замінити (синхронізація).
+        """
+        return self.executor.submit(self.upload, scan['file'], scan['filename'], folder_id, scan.get('replace_id'))
+
+    def upload_many(self, scan_images, folder_id):
+        """
+        Паралельно завантажує список сканів у папку.
+
+        Returns:
+            list: ID файлів у порядку scan_images (None для невдалих)
+        """
+        futures = [self.submit(scan, folder_id) for scan in scan_images]
+        return collect_upload_results(futures)
+
+
+def collect_upload_results(futures):
+    """Чекає на Future завантажень. Повертає ID файлів (None для невдалих)."""
+    file_ids = []
+    for future in futures:
+        try:
+            file_ids.append(future.result())
+        except Exception:
+            file_ids.append(None)
+    return file_ids
+
+
+# ============================================================================
+# RUN MANIFEST
+# ============================================================================
+
+class RunManifest:
+    """
+    ⭐ Стан пакетного запуску в SQLite: епізоди та кожне зображення.
+
+    Статуси зображень: 'uploaded', 'skipped' (не скан), 'duplicate'
+    (такий самий скан уже є в папці, див. DedupIndex), 'failed'.
+    Статуси епізодів: 'in_progress', 'done', 'failed', 'empty'.
+    Після перезапуску завершені епізоди та зображення пропускаються,
+    повторюються лише невдалі.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS episodes (
+            webtoon_no TEXT NOT NULL,
+            episode_no INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            folder_id TEXT,
+            scans_total INTEGER,
+            scans_uploaded INTEGER,
+            updated_at REAL,
+            PRIMARY KEY (webtoon_no, episode_no)
+        );
+        CREATE TABLE IF NOT EXISTS images (
+            webtoon_no TEXT NOT NULL,
+            episode_no INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            idx INTEGER,
+            filename TEXT,
+            md5 TEXT,
+            size INTEGER,
+            drive_file_id TEXT,
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at REAL,
+            width INTEGER,
+            height INTEGER,
+            source_size INTEGER,
+            label INTEGER,
+            PRIMARY KEY (webtoon_no, episode_no, url)
+        );
+    """
+
+    # Ознаки для калібрування класифікатора (--calibrate); label - ручна розмітка: 1 скан, 0 ні
+    FEATURE_COLUMNS = ('width', 'height', 'source_size', 'label')
+
+    FINISHED_IMAGE_STATUSES = ('uploaded', 'skipped', 'duplicate')
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(manifest_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        # Маніфести попередніх версій - без колонок ознак
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(images)')}
+        for column in self.FEATURE_COLUMNS:
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE images ADD COLUMN {column} INTEGER')
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            with self._conn:
+                return self._conn.execute(sql, params).fetchall()
+
+    def episode_status(self, webtoon_no, episode_no):
+        rows = self._execute(
+            'SELECT status FROM episodes WHERE webtoon_no=? AND episode_no=?',
+            (str(webtoon_no), episode_no)
+        )
+        return rows[0][0] if rows else None
+
+    def set_episode(self, webtoon_no, episode_no, status, folder_id=None,
+                    scans_total=None, scans_uploaded=None):
+        self._execute(
+            """
+            INSERT INTO episodes (webtoon_no, episode_no, status, folder_id,
+                                  scans_total, scans_uploaded, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (webtoon_no, episode_no) DO UPDATE SET
+                status=excluded.status,
+                folder_id=COALESCE(excluded.folder_id, folder_id),
+                scans_total=COALESCE(excluded.scans_total, scans_total),
+                scans_uploaded=COALESCE(excluded.scans_uploaded, scans_uploaded),
+                updated_at=excluded.updated_at
+            """,
+            (str(webtoon_no), episode_no, status, folder_id,
+             scans_total, scans_uploaded, time.time())
+        )
+
+    def record_image(self, webtoon_no, episode_no, url, status, index=None, filename=None,
+                     md5=None, size=None, drive_file_id=None, error=None, features=None):
+        """features - ознаки класифікатора: {'width', 'height', 'source_size'}."""
+        features = features or {}
+        self._execute(
+            """
+            INSERT INTO images (webtoon_no, episode_no, url, idx, filename, md5, size,
+                                drive_file_id, status, error, updated_at, width, height, source_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (webtoon_no, episode_no, url) DO UPDATE SET
+                idx=COALESCE(excluded.idx, idx),
+                filename=COALESCE(excluded.filename, filename),
+                md5=COALESCE(excluded.md5, md5),
+                size=COALESCE(excluded.size, size),
+                drive_file_id=COALESCE(excluded.drive_file_id, drive_file_id),
+                status=excluded.status,
+                error=excluded.error,
+                updated_at=excluded.updated_at,
+                width=COALESCE(excluded.width, width),
+                height=COALESCE(excluded.height, height),
+                source_size=COALESCE(excluded.source_size, source_size)
+            """,
+            (str(webtoon_no), episode_no, url, index, filename, md5, size,
+             drive_file_id, status, error, time.time(),
+             features.get('width'), features.get('height'), features.get('source_size'))
+        )
+
+    def finished_urls(self, webtoon_no, episode_no):
+        """URL зображень епізоду, які вже не потребують обробки."""
+        rows = self._execute(
+            f"""
+            SELECT url FROM images
+            WHERE webtoon_no=? AND episode_no=?
+              AND status IN ({','.join('?' * len(self.FINISHED_IMAGE_STATUSES))})
+            """,
+            (str(webtoon_no), episode_no, *self.FINISHED_IMAGE_STATUSES)
+        )
+        return {row[0] for row in rows}
+
+    def stored_files(self, webtoon_no, episode_no, urls):
+        """
+        Файли у сховищі, що належать зображенням urls (завантажені та оригінали дублікатів).
+
+        Returns:
+            tuple: (set назв, set ID файлів)
+        """
+        urls = set(urls)
+        rows = self._execute(
+            "SELECT url, filename, drive_file_id FROM images "
+            "WHERE webtoon_no=? AND episode_no=? AND status IN ('uploaded', 'duplicate')",
+            (str(webtoon_no), episode_no)
+        )
+        names, file_ids = set(), set()
+        for url, filename, file_id in rows:
+            if url in urls:
+                names.add(filename)
+                file_ids.add(file_id)
+        return names, file_ids
+
+    def labelled_images(self):
+        """
+        Зображення з ручною міткою (label) та ознаками - для калібрування.
+
+        Рішення попередніх запусків (uploaded/skipped) мітками не вважаються:
+        на них класифікатор лише відтворив би власні пороги.
+        total - кількість зображень епізоду.
+
+        Returns:
+            list: кортежі (url, idx, total, width, height, source_size, мітка 0/1)
+        """
+        return self._execute(
+            """
+            SELECT url, idx,
+                   (SELECT MAX(idx) FROM images AS episode
+                    WHERE episode.webtoon_no = images.webtoon_no AND episode.episode_no = images.episode_no),
+                   width, height, source_size, label
+            FROM images
+            WHERE width IS NOT NULL AND source_size IS NOT NULL AND label IS NOT NULL
+            ORDER BY webtoon_no, episode_no, idx
+            """
+        )
+
+    def image_features(self):
+        """
+        Усі зображення з ознаками - для розмітки (export_labels).
+
+        Returns:
+            list: кортежі (webtoon_no, episode_no, idx, url, width, height,
+                  source_size, status, label)
+        """
+        return self._execute(
+            """
+            SELECT webtoon_no, episode_no, idx, url, width, height, source_size, status, label
+            FROM images
+            WHERE width IS NOT NULL AND source_size IS NOT NULL
+            ORDER BY webtoon_no, episode_no, idx
+            """
+        )
+
+    def set_labels(self, labels):
+        """
+        Записує ручні мітки {url: 1 скан / 0 ні / None зняти мітку}.
+
+        Returns:
+            int: кількість оновлених рядків
+        """
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.executemany(
+                    'UPDATE images SET label=? WHERE url=?',
+                    [(label, url) for url, label in labels.items()]
+                )
+                return cursor.rowcount
+
+    def failed_count(self, webtoon_no, episode_no):
+        rows = self._execute(
+            "SELECT COUNT(*) FROM images WHERE webtoon_no=? AND episode_no=? AND status='failed'",
+            (str(webtoon_no), episode_no)
+        )
+        return rows[0][0]
+
+    def scan_count(self, webtoon_no, episode_no):
+        """Кількість сканів епізоду, що вже є у сховищі (uploaded або duplicate)."""
+        rows = self._execute(
+            "SELECT COUNT(*) FROM images WHERE webtoon_no=? AND episode_no=? AND status IN ('uploaded', 'duplicate')",
+            (str(webtoon_no), episode_no)
+        )
+        return rows[0][0]
+
+
+
+def filter_pending_urls(webtoon_no, episode_no, all_urls, remote_files=None):
+    """
+    Відкидає URL, які вже оброблено в попередніх запусках.
+
+    remote_files - перелік папки епізоду на Drive (list_folder_files):
+    зображення з такою ж назвою файлу вважаються завантаженими
+    і не завантажуються повторно навіть без запису в маніфесті.
+
+    Returns:
+        set: URL, які ще потрібно обробити
+    """
+    if not RUN_MANIFEST or SYNC_ENABLED:
+        # Синхронізація порівнює вміст кожного скану з папкою, тож пропускати нічого не можна
+        return set(all_urls)
+
+    finished = RUN_MANIFEST.finished_urls(webtoon_no, episode_no)
+    remote_files = remote_files or {}
+    pending = set()
+
+    for index, url in enumerate(all_urls, 1):
+        if url in finished:
+            continue
+
+        filename = extract_filename_from_url(url)
+        # Перекодований скан лежить на Drive з іншим розширенням
+        remote = remote_files.get(filename) or remote_files.get(transformed_filename(filename))
+        if remote:
+            RUN_MANIFEST.record_image(
+                webtoon_no, episode_no, url, 'uploaded',
+                index=index, filename=filename, md5=remote.get('md5Checksum'),
+                size=int(remote.get('size', 0)), drive_file_id=remote['id']
+            )
+            continue
+
+        pending.add(url)
+
+    skipped = len(all_urls) - len(pending)
+    if skipped:
+        print(f"⏭ Пропущено {skipped} вже оброблених зображень (маніфест/Drive)")
+
+    return pending
+
+
+def prepare_episode_folder(storage, webtoon_no, episode_no):
+    """
+    Створює папку епізоду та (за налаштуванням) отримує її вміст зі сховища.
+    В режимі архіву повертає батьківську папку FOLDER_PATH.
+
+    Returns:
+        tuple: (folder_id, remote_files)
+    """
+    with METRICS.span('folder', episode=f"{webtoon_no}/{episode_no}"):
+        if ARCHIVE_OUTPUT:
+            # Архів епізоду лежить поруч з іншими, окрема папка не потрібна
+            folder_id = storage.parent_folder()
+            if RUN_MANIFEST:
+                RUN_MANIFEST.set_episode(webtoon_no, episode_no, 'in_progress', folder_id=folder_id)
+            print(f"✓ Папка готова ({storage.name}): {FOLDER_PATH}/ ({archive_filename(episode_no)})\n")
+            return folder_id, {}
+
+        folder_id = storage.episode_folder(episode_no)
+        print(f"✓ Папка готова ({storage.name}): {FOLDER_PATH}/{episode_no}/\n")
+
+        seed = RUN_MANIFEST and SEED_FROM_DRIVE
+        if RUN_MANIFEST:
+            RUN_MANIFEST.set_episode(webtoon_no, episode_no, 'in_progress', folder_id=folder_id)
+
+        listing = storage.list_files(folder_id) if seed or DEDUP_INDEX or SYNC_ENABLED else {}
+        if DEDUP_INDEX:
+            DEDUP_INDEX.seed_folder(webtoon_no, folder_id, listing)
+        remote_files = listing if seed or SYNC_ENABLED else {}
+
+    return folder_id, remote_files
+
+
+def is_episode_done(webtoon_no, episode_no):
+    """Чи завершено епізод у попередньому запуску (з синхронізацією епізод звіряється щоразу)."""
+    if SYNC_ENABLED:
+        return False
+    return bool(RUN_MANIFEST) and RUN_MANIFEST.episode_status(webtoon_no, episode_no) == 'done'
+
+
+# ============================================================================
+# IMAGE CACHE
+# ============================================================================
+
+class ImageCache:
+    """
+    ⭐ Дисковий LRU-кеш зображень з обмеженням розміру.
+
+    Індекс (SQLite) зберігає для кожного URL ETag/Last-Modified, sha256
+    вмісту та розміри зображення. Вміст лежить у objects/ під своїм sha256,
+    тож однакові файли з різних URL зберігаються один раз. Для не-сканів
+    зберігаються лише метадані: такі URL більше не завантажуються.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            sha256 TEXT,
+            size INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            has_body INTEGER NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_lru ON entries (has_body, last_access);
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.cache_dir, 'objects', sha256[:2], sha256)
+
+    def lookup(self, url):
+        """
+        Returns:
+            dict або None: метадані запису (без вмісту)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, last_modified, sha256, size, width, height, has_body '
+                'FROM entries WHERE url=?', (url,)
+            ).fetchone()
+            if not row:
+                return None
+
+            with self._conn:
+                self._conn.execute('UPDATE entries SET last_access=? WHERE url=?', (time.time(), url))
+
+        keys = ('etag', 'last_modified', 'sha256', 'size', 'width', 'height', 'has_body')
+        return dict(zip(keys, row))
+
+    def read_body(self, entry):
+        """Читає вміст з диска як ScanFile (None, якщо файл зник)."""
+        if not entry['has_body']:
+            return None
+        try:
+            return ScanFile.from_path(self._object_path(entry['sha256']))
+        except OSError:
+            return None
+
+    def store(self, url, width, height, size, scan_file=None, headers=None):
+        """
+        Зберігає зображення. Без scan_file (не-скан, завантаження перервано
+        після заголовка) зберігаються лише метадані.
+        """
+        headers = headers or {}
+        keep_body = scan_file is not None
+        sha256 = scan_file.sha256 if keep_body else None
+
+        if keep_body:
+            path = self._object_path(sha256)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                scan_file.copy_to(tmp_path)
+                os.replace(tmp_path, path)
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO entries
+                        (url, etag, last_modified, sha256, size, width, height, has_body, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (url, headers.get('ETag'), headers.get('Last-Modified'), sha256,
+                     size, width, height, int(keep_body), time.time())
+                )
+            if keep_body:
+                self._evict()
+
+    def _evict(self):
+        """Видаляє найдавніше використані вмісти, поки кеш більший за ліміт."""
+        total = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM '
+            '(SELECT DISTINCT sha256, size FROM entries WHERE has_body=1)'
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            'SELECT url, sha256, size FROM entries WHERE has_body=1 ORDER BY last_access'
+        ).fetchall()
+
+        with self._conn:
+            for url, sha256, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute('DELETE FROM entries WHERE url=?', (url,))
+
+                # Той самий вміст може належати іншим URL
+                still_used = self._conn.execute(
+                    'SELECT 1 FROM entries WHERE sha256=? AND has_body=1 LIMIT 1', (sha256,)
+                ).fetchone()
+                if not still_used:
+                    try:
+                        os.remove(self._object_path(sha256))
+                    except OSError:
+                        pass
+                    total -= size
+
+
+
+# ============================================================================
+# DEDUPLICATION
+# ============================================================================
+
+def perceptual_hash(scan_file):
+    """
+    64-бітний dHash зображення: однаковий для того самого скану,
+    перекодованого CDN з іншою якістю чи в іншому форматі.
+
+    Returns:
+        int або None, якщо зображення не вдалося розібрати
+    """
+    from PIL import Image
+
+    try:
+        with scan_file.open() as fileobj:
+            image = Image.open(fileobj)
+            # JPEG декодується одразу зменшеним - повний розмір не потрібен
+            image.draft('L', (image.width // 8, image.height // 8))
+            pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+class DedupIndex:
+    """
+    ⭐ Індекс вмісту завантажених сканів (SQLite), спільний для всіх запусків.
+
+    Скан не завантажується, якщо файл з таким самим md5 вже є в папці
+    епізоду на Drive (md5Checksum з переліку папки) або був завантажений
+    раніше. Зі scope = "webtoon" перевіряються всі папки вебтуну, з
+    perceptual = true - також майже однакові зображення (dHash, відстань
+    Геммінга до DEDUP_MAX_DISTANCE). Скани, що ще завантажуються,
+    тримаються в пам'яті: до бази потрапляють лише успішні завантаження.
+    Резерв claim() знімається record() або, якщо до завантаження справа
+    не дійшла (помилка), release().
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scans (
+            folder_id TEXT NOT NULL,
+            md5 TEXT NOT NULL,
+            webtoon_no TEXT,
+            filename TEXT,
+            drive_file_id TEXT,
+            phash TEXT,
+            updated_at REAL,
+            PRIMARY KEY (folder_id, md5)
+        );
+        CREATE INDEX IF NOT EXISTS scans_webtoon ON scans (webtoon_no, md5);
+    """
+
+    # dHash майже однотонних зображень (порожні панелі) збігається для різних сканів
+    MIN_PHASH_BITS = 8
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._conn = sqlite3.connect(index_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def seed_folder(self, webtoon_no, folder_id, remote_files):
+        """
+        Синхронізує записи папки з її переліком на Drive (list_folder_files):
+        видалені вручну файли забуваються, чужі файли з md5 додаються.
+
+        Записи зберігають md5 скану до перекодування (TRANSFORM_MODE), тож
+        звіряються з Drive за ID файлу, а не за md5Checksum.
+        """
+        remote = {file['md5Checksum']: file for file in remote_files.values() if file.get('md5Checksum')}
+        remote_ids = {file['id'] for file in remote_files.values()}
+
+        with self._lock, self._conn:
+            rows = self._conn.execute('SELECT md5, drive_file_id FROM scans WHERE folder_id=?', (folder_id,))
+            self._conn.executemany(
+                'DELETE FROM scans WHERE folder_id=? AND md5=?',
+                [(folder_id, md5) for md5, drive_file_id in rows.fetchall() if drive_file_id not in remote_ids]
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO scans (folder_id, md5, webtoon_no, filename, drive_file_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(folder_id, md5, str(webtoon_no), file['name'], file['id'], time.time())
+                 for md5, file in remote.items()]
+            )
+
+    def _in_scope(self, entry, webtoon_no, folder_id):
+        if DEDUP_SCOPE == 'webtoon':
+            return entry['webtoon_no'] == str(webtoon_no)
+        return entry['folder_id'] == folder_id
+
+    def _find(self, md5, phash, webtoon_no, folder_id):
+        if DEDUP_SCOPE == 'webtoon':
+            where, params = 'webtoon_no=?', (str(webtoon_no),)
+        else:
+            where, params = 'folder_id=?', (folder_id,)
+
+        for entry in self._pending.values():
+            if entry['md5'] == md5 and self._in_scope(entry, webtoon_no, folder_id):
+                return entry
+
+        row = self._conn.execute(
+            f'SELECT filename, drive_file_id FROM scans WHERE {where} AND md5=? LIMIT 1', (*params, md5)
+        ).fetchone()
+        if row:
+            return {'filename': row[0], 'drive_file_id': row[1]}
+
+        if phash is None:
+            return None
+
+        candidates = [
+            entry for entry in self._pending.values()
+            if entry['phash'] is not None and self._in_scope(entry, webtoon_no, folder_id)
+        ]
+        candidates += [
+            {'filename': row[0], 'drive_file_id': row[1], 'phash': int(row[2], 16)}
+            for row in self._conn.execute(
+                f'SELECT filename, drive_file_id, phash FROM scans WHERE {where} AND phash IS NOT NULL', params
+            )
+        ]
+        for entry in candidates:
+            if bin(entry['phash'] ^ phash).count('1') <= DEDUP_MAX_DISTANCE:
+                return entry
+        return None
+
+    def claim(self, scan_file, filename, webtoon_no, folder_id):
+        """
+        Перевіряє скан перед завантаженням.
+
+        Returns:
+            dict або None: оригінал ({'filename', 'drive_file_id'}), якщо скан -
+            дублікат; None - скан новий і зарезервований до record()
+        """
+        phash = None
+        if DEDUP_PERCEPTUAL:
+            phash = perceptual_hash(scan_file)
+            if phash is not None and not self.MIN_PHASH_BITS <= bin(phash).count('1') <= 64 - self.MIN_PHASH_BITS:
+                phash = None
+
+        with self._lock:
+            original = self._find(scan_file.md5, phash, webtoon_no, folder_id)
+            if original:
+                return original
+
+            self._pending[(folder_id, scan_file.md5)] = {
+                'folder_id': folder_id, 'md5': scan_file.md5, 'webtoon_no': str(webtoon_no),
+                'filename': filename, 'drive_file_id': None, 'phash': phash
+            }
+            return None
+
+    def release(self, folder_id, md5):
+        """Знімає резерв claim() скану, який так і не був завантажений."""
+        with self._lock:
+            self._pending.pop((folder_id, md5), None)
+
+    def record(self, folder_id, md5, drive_file_id):
+        """
+        Результат завантаження зарезервованого скану (drive_file_id=None - помилка).
+        md5 - той самий, що й у claim(), тобто до перекодування.
+        """
+        with self._lock:
+            entry = self._pending.pop((folder_id, md5), None)
+            if not entry or not drive_file_id:
+                return
+            with self._conn:
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO scans
+                        (folder_id, md5, webtoon_no, filename, drive_file_id, phash, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (folder_id, md5, entry['webtoon_no'], entry['filename'], drive_file_id,
+                     None if entry['phash'] is None else format(entry['phash'], '016x'), time.time())
+                )
+
+
+# ============================================================================
+# TRANSFORM
+# ============================================================================
+
+TRANSFORM_MODES = ('original', 'png_optimize', 'webp_lossless', 'avif')
+TRANSFORM_EXTENSIONS = {'webp_lossless': '.webp', 'avif': '.avif'}
+
+
+def transform_image(source, mode):
+    """
+    Перекодовує зображення. Виконується в дочірньому процесі пулу.
+
+    source - bytes або шлях до файлу (скан, перенесений на диск).
+
+    Returns:
+        tuple: (bytes або None, якщо формат не підлягає перетворенню; час, с)
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    image = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    if image.format not in ('PNG', 'JPEG') or image.mode == 'CMYK':
+        return None, time.perf_counter() - started
+    if mode == 'png_optimize' and image.format != 'PNG':
+        return None, time.perf_counter() - started
+
+    # ICC-профіль та EXIF WebP/AVIF самі не переносять - без профілю змінюються кольори
+    extra = {key: image.info[key] for key in ('icc_profile', 'exif') if image.info.get(key)}
+
+    out = BytesIO()
+    if mode == 'png_optimize':
+        if 'transparency' in image.info:
+            extra['transparency'] = image.info['transparency']
+        image.save(out, 'PNG', optimize=True, **extra)
+    elif mode == 'webp_lossless':
+        image.save(out, 'WEBP', lossless=True, quality=100, method=4, **extra)
+    elif mode == 'avif':
+        # Pillow не має справжнього lossless AVIF: максимальна якість без субдискретизації
+        image.save(out, 'AVIF', quality=100, subsampling='4:4:4', **extra)
+    else:
+        return None, time.perf_counter() - started
+
+    return out.getvalue(), time.perf_counter() - started
+
+
+def transformed_filename(filename, mode=None):
+    """Назва файлу після перекодування (нове розширення для WebP/AVIF)."""
+    extension = TRANSFORM_EXTENSIONS.get(mode or TRANSFORM_MODE)
+    if not extension:
+        return filename
+    return os.path.splitext(filename)[0] + extension
+
+
+_transform_pool = None
+_transform_pool_lock = threading.Lock()
+
+
+def get_transform_pool():
+    """
+    Повертає спільний пул процесів для перекодування сканів.
+
+    Returns:
+        ProcessPoolExecutor або None (mode = "original" або формат не підтримується)
+    """
+    global _transform_pool, TRANSFORM_MODE
+
+    if TRANSFORM_MODE == 'original':
+        return None
+
+    with _transform_pool_lock:
+        if _transform_pool is None:
+            from PIL import features
+
+            if TRANSFORM_MODE not in TRANSFORM_MODES:
+                print(f"⚠ Невідомий transform.mode: {TRANSFORM_MODE}, скани завантажуються без змін")
+                TRANSFORM_MODE = 'original'
+                return None
+            if TRANSFORM_MODE in TRANSFORM_EXTENSIONS and not features.check(TRANSFORM_EXTENSIONS[TRANSFORM_MODE][1:]):
+                print(f"⚠ Pillow зібрано без підтримки {TRANSFORM_MODE}, скани завантажуються без змін")
+                TRANSFORM_MODE = 'original'
+                return None
+
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn: fork процесу з робочими потоками може зависнути; імпорт модуля дешевий
+            _transform_pool = ProcessPoolExecutor(
+                max_workers=TRANSFORM_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _transform_pool
+
+
+def shutdown_transform_pool():
+    global _transform_pool
+
+    with _transform_pool_lock:
+        if _transform_pool is not None:
+            _transform_pool.shutdown(wait=True)
+            _transform_pool = None
+
+
+def submit_transform(pool, scan, on_done=None):
+    """
+    ⭐ Перекодовує скан у пулі процесів, не займаючи потоків завантаження.
+
+    Якщо результат менший хоча б на TRANSFORM_MIN_SAVING, scan['file']
+    замінюється новим ScanFile (розмір і md5 для перевірки на Drive
+    рахуються вже по ньому), а scan['filename'] отримує нове розширення.
+    Розмір і md5 оригіналу лишаються в scan['original_size'] та
+    scan['original_md5']. Після цього викликається on_done(scan).
+
+    Returns:
+        Future: завершується, коли скан готовий до завантаження
+    """
+    scan_file = scan['file']
+    scan['original_size'] = scan_file.size
+    scan['original_md5'] = scan_file.md5
+    done = Future()
+    submitted = time.perf_counter()
+
+    def finish(future):
+        try:
+            data, elapsed = future.result()
+            saved = 0
+            if data and len(data) <= scan_file.size * (1 - TRANSFORM_MIN_SAVING):
+                saved = scan_file.size - len(data)
+                scan['file'] = ScanFile.from_bytes(data)
+                scan['filename'] = transformed_filename(scan['filename'])
+                scan_file.release()
+            METRICS.add_span('transform', elapsed, bytes=scan['original_size'], saved=saved,
+                             wait=time.perf_counter() - submitted - elapsed)
+        except Exception as e:
+            print(f"  ⚠ Не вдалося перекодувати {scan['filename']}: {e}")
+            METRICS.add_span('transform', time.perf_counter() - submitted, error=type(e).__name__)
+
+        try:
+            if on_done:
+                on_done(scan)
+        finally:
+            done.set_result(scan)
+
+    try:
+        future = pool.submit(transform_image, scan_file.path or scan_file.read(), TRANSFORM_MODE)
+    except RuntimeError as e:
+        # Пул зупинено або зламано (BrokenProcessPool) - завантажуємо оригінал
+        future = Future()
+        future.set_exception(e)
+    future.add_done_callback(finish)
+    return done
+
+
+# ============================================================================
+# ARCHIVE OUTPUT
+# ============================================================================
+
+def archive_filename(episode_no):
+    return f"{episode_no}.{OUTPUT_MODE}"
+
+
+class _ScanFileWriter:
+    """Потік лише для запису в ScanFile (zipfile вміє писати без seek)."""
+
+    def __init__(self, scan_file):
+        self.scan_file = scan_file
+
+    def write(self, data):
+        self.scan_file.write(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class EpisodeArchive:
+    """
+    ⭐ CBZ/ZIP-архів епізоду, що збирається під час аналізу.
+
+    Скани додаються (add) щойно їх класифіковано і одразу звільняються.
+    Записи називаються за index з нулями попереду, тож читалки показують
+    сторінки в порядку епізоду, хоч би в якому порядку вони завершились.
+    Архів пишеться потоком у ScanFile (RAM у межах SCAN_MEMORY або диск),
+    md5 для перевірки на Drive рахується під час запису. Зображення вже
+    стиснені, тому записи зберігаються без повторного стиснення.
+    """
+
+    def __init__(self, total_images):
+        self.width = len(str(max(1, total_images)))
+        self.file = ScanFile()
+        self.count = 0
+        self._md5s = set()
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(_ScanFileWriter(self.file), 'w', zipfile.ZIP_STORED)
+
+    def add(self, scan):
+        """Дописує скан в архів (однаковий вміст - лише раз) та звільняє його дані."""
+        scan_file = scan['file']
+        extension = os.path.splitext(scan['filename'])[1].lower() or '.jpg'
+        name = f"{scan['index']:0{self.width}d}{extension}"
+
+        with self._lock:
+            if scan_file.md5 not in self._md5s:
+                self._md5s.add(scan_file.md5)
+                with scan_file.open() as source, self._zip.open(name, 'w') as entry:
+                    shutil.copyfileobj(source, entry, 1024 * 1024)
+                self.count += 1
+        scan_file.release()
+
+    def close(self):
+        """Завершує архів. Returns: ScanFile з вмістом архіву."""
+        with self._lock:
+            self._zip.close()
+        return self.file.finish()
+
+    def discard(self):
+        with self._lock:
+            self._zip.close()
+        self.file.release()
+
+
+def delete_older_copies(service, filename, folder_id, keep_id):
+    """Видаляє з папки інші файли з такою назвою (архів з попереднього запуску)."""
+    query = f"name='{_escape_query(filename)}' and '{folder_id}' in parents and trashed=false"
+    try:
+        results = execute_with_retry(service.files().list(q=query, spaces='drive', fields='files(id)'))
+        for file in results.get('files', []):
+            if file['id'] != keep_id:
+                execute_with_retry(service.files().delete(fileId=file['id']))
+    except Exception as e:
+        print(f"  ⚠ Не вдалося видалити попередню версію {filename}: {e}")
+
+
+def upload_episode_archive(storage, episode_no, scan_images, archive, folder_id, webtoon_no=None):
+    """
+    Завершує архів епізоду та зберігає його в сховище одним файлом.
+
+    Returns:
+        int: кількість сканів в успішно завантаженому архіві (0 при помилці)
+    """
+    archive_file = archive.close()
+    filename = archive_filename(episode_no)
+    print(f"Завантаження архіву {filename} ({archive.count} сканів, "
+          f"{archive_file.size / 1024 / 1024:.1f} MB) у сховище ({storage.name})...")
+
+    try:
+        file_id = storage.upload(archive_file, filename, folder_id)
+    except Exception:
+        file_id = None
+    finally:
+        archive_file.release()
+
+    if file_id:
+        storage.delete_older_copies(filename, folder_id, file_id)
+
+    return record_episode_uploads(webtoon_no, episode_no, scan_images, [file_id] * len(scan_images))
+
+
+# ============================================================================
+# ASYNC I/O ENGINE
+# ============================================================================
+
+class AsyncIOEngine:
+    """
+    ⭐ Необов'язковий asyncio-рушій для аналізу зображень та завантажень на Drive.
+
+    Один event loop у фоновому потоці обслуговує всі епізоди. httpx.AsyncClient
+    тримає HTTP/2 keep-alive з'єднання до pstatic.net та googleapis.com, тож
+    десятки запитів одночасно йдуть без окремого потоку на кожен.
+    Кількість запитів обмежена глобально та для кожного хоста окремо.
+    Методи submit_* повертають concurrent.futures.Future, як і ThreadPoolExecutor.
+
+    Блокуюча робота (SQLite кешу, диск ScanFile, PIL, хеші) виконується
+    через offload в окремих потоках, щоб не зупиняти інші запити в loop.
+    """
+
+    # Тіло скану передається в ScanFile пачками такого розміру
+    WRITE_BATCH = 256 * 1024
+
+    def __init__(self, max_in_flight=None, per_host_limit=None):
+        import httpx  # необов'язкова залежність: pip install "httpx[http2]"
+
+        self._httpx = httpx
+        self.max_in_flight = max_in_flight or ASYNC_MAX_IN_FLIGHT
+        self.per_host_limit = per_host_limit or ASYNC_PER_HOST_LIMIT
+        self._host_limits = {}
+        self._blocking = ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix='async-io-blocking'
+        )
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='async-io', daemon=True)
+        self._thread.start()
+        self.client = self.call(self._create_client())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _create_client(self):
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            print("⚠ Пакет h2 не встановлено, asyncio-рушій працює через HTTP/1.1")
+            http2 = False
+
+        return self._httpx.AsyncClient(
+            http2=http2,
+            timeout=20,
+            follow_redirects=True,
+            limits=self._httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight
+            )
+        )
+
+    def submit(self, coro):
+        """Запускає корутину в loop рушія. Повертає concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro):
+        """Запускає корутину та чекає на результат."""
+        return self.submit(coro).result()
+
+    def close(self):
+        self.call(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._blocking.shutdown(wait=True)
+
+    async def offload(self, func, *args):
+        """Виконує блокуючий func(*args) поза loop рушія."""
+        return await self.loop.run_in_executor(self._blocking, partial(func, *args))
+
+    def host_limit(self, url):
+        """Семафор хоста (викликається лише з loop рушія)."""
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    def submit_analysis(self, img_url, cookies_dict, index, total):
+        """Асинхронний аналог analyze_single_image."""
+        return self.submit(self._analyze(img_url, cookies_dict, index, total))
+
+    async def _analyze(self, img_url, cookies_dict, index, total):
+        async with self._in_flight, self.host_limit(img_url):
+            result = await self._fetch_image(img_url, cookies_dict)
+        return await self.offload(make_analysis_result, img_url, index, result, total)
+
+    async def _fetch_image(self, img_url, cookies_dict):
+        """Асинхронний аналог get_image_dimensions_and_size."""
+        with METRICS.span('image_fetch', url=img_url) as span:
+            # Пошук у кеші - SQLite та читання з диска
+            fetch = await self.offload(ImageFetch, img_url, span)
+            if fetch.result:
+                return fetch.result
+
+            try:
+                result = await call_with_retry_async(partial(self._fetch_image_once, fetch, cookies_dict),
+                                                     img_url, self.per_host_limit, span)
+            except Exception:
+                result = None
+            if result:
+                return result
+
+            await self.offload(fetch.discard_cached)
+            span['error'] = 'failed'
+            return None
+
+    async def _fetch_image_once(self, fetch, cookies_dict):
+        """Одна спроба завантаження (див. _fetch_image_once потокового рушія)."""
+        headers = dict(fetch.headers)
+        if cookies_dict:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in cookies_dict.items())
+
+        async with self.client.stream('GET', fetch.url, headers=headers) as response:
+            if response.status_code == 304 and fetch.cached_file is not None:
+                return fetch.not_modified()
+            if response.status_code != 200:
+                if response.status_code == 403:
+                    await response.aread()
+                check_response(response)
+                return None
+
+            await self.offload(fetch.discard_cached)
+            probe = fetch.make_probe(response.headers)
+            try:
+                batch = bytearray()
+                async for chunk in response.aiter_bytes(PROBE_CHUNK_SIZE):
+                    if probe.scan_file is None:
+                        if not await self.offload(probe.feed, chunk):
+                            break
+                        continue
+                    # Тіло скану (хеші, можливий запис на диск) - пачками, менше переходів між потоками
+                    batch.extend(chunk)
+                    if len(batch) >= self.WRITE_BATCH:
+                        await self.offload(probe.feed, bytes(batch))
+                        batch.clear()
+                if batch:
+                    await self.offload(probe.feed, bytes(batch))
+                # PIL для невідомих форматів та запис у кеш
+                return await self.offload(fetch.complete, probe, response.headers)
+            except Exception:
+                await self.offload(probe.discard)
+                raise
+
+
+class AsyncDriveUploader(DriveUploader):
+    """
+    DriveUploader, що працює в loop AsyncIOEngine через httpx (HTTP/2).
+
+    Інтерфейс той самий (submit/upload_many/close), тож конвеєр не залежить
+    від обраного рушія.
+    """
+
+    def __init__(self, engine, creds, max_workers=None):
+        self.engine = engine
+        self.creds = creds
+        self.max_workers = max_workers or MAX_PARALLEL_UPLOADS
+        self.pool_size = max(self.max_workers, ADAPTIVE_MAX_CONCURRENCY) if ADAPTIVE_CONCURRENCY else self.max_workers
+        self._refresh_lock = threading.Lock()
+        self._limit = engine.call(self._create_limit())
+
+    async def _create_limit(self):
+        return asyncio.Semaphore(self.pool_size)
+
+    def close(self):
+        """З'єднання належать AsyncIOEngine і закриваються разом з ним."""
+
+    async def _auth_headers(self):
+        if not self.creds.valid:
+            await asyncio.get_running_loop().run_in_executor(None, self._ensure_token)
+        return {'Authorization': f'Bearer {self.creds.token}'}
+
+    def _multipart_body(self, scan_file, metadata, mimetype):
+        return self.build_multipart_body(metadata, mimetype, scan_file.read())
+
+    async def _upload_multipart(self, scan_file, metadata, mimetype, file_id=None):
+        # Скан може бути на диску - читання поза loop рушія
+        body, content_type = await self.engine.offload(self._multipart_body, scan_file, metadata, mimetype)
+        headers = await self._auth_headers()
+        headers['Content-Type'] = content_type
+        method, url = self.upload_target(file_id)
+
+        response = await self.engine.client.request(
+            method, url,
+            params={'uploadType': 'multipart', 'fields': self.RESPONSE_FIELDS},
+            content=body,
+            headers=headers,
+            timeout=120
+        )
+        check_response(response)
+        return response.json()
+
+    async def _upload_resumable(self, scan_file, metadata, mimetype, file_id=None):
+        total = scan_file.size
+        headers = await self._auth_headers()
+        headers.update({
+            'X-Upload-Content-Type': mimetype,
+            'X-Upload-Content-Length': str(total),
+        })
+        method, url = self.upload_target(file_id)
+        response = await self.engine.client.request(
+            method, url,
+            params={'uploadType': 'resumable', 'fields': self.RESPONSE_FIELDS},
+            json=metadata,
+            headers=headers,
+            timeout=60
+        )
+        check_response(response)
+        session_url = response.headers['Location']
+
+        offset = 0
+        while True:
+            chunk = await self.engine.offload(scan_file.read, offset, self.CHUNK_SIZE)
+            end = offset + len(chunk) - 1
+            response = await self.engine.client.put(
+                session_url,
+                content=chunk,
+                headers={'Content-Range': f'bytes {offset}-{end}/{total}'},
+                timeout=120
+            )
+
+            if response.status_code in (200, 201):
+                return response.json()
+            if response.status_code != 308:
+                check_response(response)
+
+            offset = self.next_resumable_offset(response.headers)
+
+    async def _find_uploaded(self, scan_file, filename, folder_id):
+        response = await self.engine.client.get(
+            DRIVE_FILES_URL,
+            params=self.uploaded_query(filename, folder_id),
+            headers=await self._auth_headers(),
+            timeout=60
+        )
+        return self.match_uploaded(response, scan_file, filename)
+
+    async def _upload(self, scan_file, filename, folder_id, file_id=None):
+        metadata = {'name': filename} if file_id else {'name': filename, 'parents': [folder_id]}
+        mimetype = detect_mimetype(scan_file.head)
+
+        def attempt():
+            if scan_file.size > RESUMABLE_UPLOAD_THRESHOLD:
+                return self._upload_resumable(scan_file, metadata, mimetype, file_id)
+            return self._upload_multipart(scan_file, metadata, mimetype, file_id)
+
+        recover = None if file_id else (lambda: self._find_uploaded(scan_file, filename, folder_id))
+
+        try:
+            async with self._limit:
+                with METRICS.span('upload', bytes=scan_file.size) as span:
+                    file = await call_with_retry_async(attempt, DRIVE_UPLOAD_URL, self.max_workers, span, recover)
+
+            return self._report(file, scan_file, filename)
+
+        except Exception as e:
+            print(f"  ✗ Помилка завантаження {filename}: {e}")
+            raise
+
+    def upload(self, scan_file, filename, folder_id, file_id=None):
+        return self.engine.call(self._upload(scan_file, filename, folder_id, file_id))
+
+    def submit(self, scan, folder_id):
+        return self.engine.submit(self._upload(scan['file'], scan['filename'], folder_id, scan.get('replace_id')))
+
+
+_async_engine = None
+_async_engine_lock = threading.Lock()
+
+
+def get_async_engine():
+    """
+    Повертає спільний AsyncIOEngine, якщо io_backend = "asyncio".
+
+    Returns:
+        AsyncIOEngine або None (потоковий рушій або httpx не встановлено)
+    """
+    global _async_engine, IO_BACKEND
+
+    if IO_BACKEND != 'asyncio':
+        return None
+
+    with _async_engine_lock:
+        if _async_engine is None:
+            try:
+                _async_engine = AsyncIOEngine()
+            except ImportError:
+                print("⚠ httpx не встановлено (pip install \"httpx[http2]\"), використовуємо потоки")
+                IO_BACKEND = 'threads'
+                return None
+        return _async_engine
+
+
+def create_uploader(creds):
+    """Створює завантажувач на Drive для обраного I/O рушія."""
+    engine = get_async_engine()
+    if engine:
+        return AsyncDriveUploader(engine, creds)
+    return DriveUploader(creds)
+
+
+def shutdown_async_engine():
+    global _async_engine
+
+    with _async_engine_lock:
+        if _async_engine is not None:
+            _async_engine.close()
+            _async_engine = None
+
+
+# ============================================================================
+# STORAGE BACKENDS
+# ============================================================================
+
+def storage_path_parts(episode_no=None):
+    """Частини шляху folder_path/{episode_no} - спільна розкладка всіх сховищ."""
+    parts = [part.strip() for part in FOLDER_PATH.split('/') if part.strip()]
+    if episode_no is not None:
+        parts.append(str(episode_no))
+    return parts
+
+
+class StorageBackend:
+    """
+    ⭐ Спільний інтерфейс сховищ сканів (Drive, локальний диск, S3).
+
+    Папка (folder_id) - непрозорий ідентифікатор з episode_folder або
+    parent_folder: ID папки на Drive, шлях на диску чи префікс ключів S3.
+    list_files повертає {назва: {'id', 'name', 'size', 'md5Checksum'}}, як
+    list_folder_files, тож маніфест і дедуплікація працюють однаково.
+    """
+
+    name = None
+    max_workers = 1
+
+    def episode_folder(self, episode_no):
+        raise NotImplementedError
+
+    def parent_folder(self):
+        raise NotImplementedError
+
+    def list_files(self, folder_id):
+        raise NotImplementedError
+
+    def upload(self, scan_file, filename, folder_id):
+        """Зберігає файл (ScanFile) з перевіркою. Returns: ID файлу."""
+        raise NotImplementedError
+
+    def prefetch(self, episodes):
+        """Готує папки епізодів пакету заздалегідь. Returns: кількість знайдених."""
+        return 0
+
+    def delete_older_copies(self, filename, folder_id, keep_id):
+        """Прибирає попередні версії файлу (там, де назва не перезаписує файл)."""
+
+    def delete_files(self, folder_id, files):
+        """Видаляє файли (записи з list_files)."""
+        raise NotImplementedError
+
+    def submit(self, scan, folder_id):
+        """Ставить скан у чергу. Повертає Future з ID файлу."""
+        return self.executor.submit(self.upload, scan['file'], scan['filename'], folder_id)
+
+    def sync(self, scan, folder_id, remote=None):
+        """
+        Зберігає скан з урахуванням файлу з такою ж назвою в папці (remote з list_files).
+
+        Той самий вміст (md5) не завантажується, інший оновлюється на місці
+        (scan['replace_id']), відсутній файл створюється. Що зроблено,
+        записується в scan['sync']. Returns: Future з ID файлу.
+        """
+        if remote and remote.get('md5Checksum') == scan['file'].md5:
+            scan['sync'] = 'unchanged'
+            future = Future()
+            future.set_result(remote['id'])
+            return future
+
+        scan['sync'] = 'updated' if remote else 'created'
+        return self.submit(dict(scan, replace_id=remote['id']) if remote else scan, folder_id)
+
+    def prune(self, folder_id, keep_names, keep_ids=()):
+        """Видаляє з папки файли, яких немає ні серед keep_names, ні серед keep_ids. Returns: кількість."""
+        orphans = [file for name, file in self.list_files(folder_id).items()
+                   if name not in keep_names and file['id'] not in keep_ids]
+        if orphans:
+            self.delete_files(folder_id, orphans)
+        return len(orphans)
+
+    def upload_many(self, scan_images, folder_id):
+        """Returns: list ID файлів у порядку scan_images (None для невдалих)."""
+        futures = [self.submit(scan, folder_id) for scan in scan_images]
+        return collect_upload_results(futures)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class DriveStorage(StorageBackend):
+    """Google Drive: папки з FolderCache, завантаження через DriveUploader/AsyncDriveUploader."""
+
+    name = 'drive'
+
+    def __init__(self, creds):
+        self.creds = creds
+        self.uploader = create_uploader(creds)
+        self.max_workers = self.uploader.max_workers
+        # Клієнт googleapiclient не потокобезпечний - окремий на кожен потік
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        if getattr(self._local, 'service', None) is None:
+            self._local.service = get_google_drive_service(self.creds)
+        return self._local.service
+
+    def episode_folder(self, episode_no):
+        return create_folder_structure(self.service, episode_no)
+
+    def parent_folder(self):
+        return resolve_parent_folder(self.service) or 'root'
+
+    def list_files(self, folder_id):
+        return list_folder_files(self.service, folder_id)
+
+    def upload(self, scan_file, filename, folder_id):
+        return self.uploader.upload(scan_file, filename, folder_id)
+
+    def submit(self, scan, folder_id):
+        return self.uploader.submit(scan, folder_id)
+
+    def prefetch(self, episodes):
+        return prefetch_episode_folders(self.service, episodes)
+
+    def delete_older_copies(self, filename, folder_id, keep_id):
+        delete_older_copies(self.service, filename, folder_id, keep_id)
+
+    def delete_files(self, folder_id, files):
+        for file in files:
+            execute_with_retry(self.service.files().delete(fileId=file['id']))
+
+    def prune(self, folder_id, keep_names, keep_ids=()):
+        """
+        Крім файлів з чужими назвами видаляє й зайві копії з однаковою назвою
+        (попередні запуски без синхронізації створювали файл щоразу заново).
+        Із копій лишається та, чий ID у keep_ids, інакше - перша в переліку.
+        """
+        files = list_folder_files(self.service, folder_id, all_copies=True)
+        names_kept = {file['name'] for file in files if file['id'] in keep_ids}
+
+        orphans = []
+        for file in files:
+            if file['id'] in keep_ids:
+                continue
+            if file['name'] in keep_names and file['name'] not in names_kept:
+                names_kept.add(file['name'])
+                continue
+            orphans.append(file)
+
+        self.delete_files(folder_id, orphans)
+        return len(orphans)
+
+    def close(self):
+        self.uploader.close()
+
+
+class LocalStorage(StorageBackend):
+    """
+    Локальна папка root/folder_path/{episode_no}/ - без OAuth і квот Drive.
+
+    Файл спершу пишеться у тимчасовий поруч, а потім атомарно
+    перейменовується (os.replace): інші програми (OCR) ніколи не бачать
+    недописаних сканів, а повторний запуск просто перезаписує файл.
+    """
+
+    name = 'local'
+
+    def __init__(self, root, max_workers=None):
+        self.root = root
+        self.max_workers = max_workers or MAX_PARALLEL_UPLOADS
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def _folder(self, episode_no=None):
+        path = os.path.join(self.root, *storage_path_parts(episode_no))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def episode_folder(self, episode_no):
+        return self._folder(episode_no)
+
+    def parent_folder(self):
+        return self._folder()
+
+    def list_files(self, folder_id):
+        files = {}
+        for entry in os.scandir(folder_id):
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            md5 = hashlib.md5()
+            with open(entry.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+            files[entry.name] = {
+                'id': entry.path, 'name': entry.name,
+                'size': str(entry.stat().st_size), 'md5Checksum': md5.hexdigest()
+            }
+        return files
+
+    def upload(self, scan_file, filename, folder_id):
+        path = os.path.join(folder_id, filename)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with METRICS.span('upload', bytes=scan_file.size):
+                scan_file.copy_to(tmp_path)
+                os.replace(tmp_path, path)
+            file = {'id': path, 'size': str(os.path.getsize(path))}
+            return DriveUploader._report(file, scan_file, filename)
+
+        except Exception as e:
+            print(f"  ✗ Помилка збереження {filename}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete_files(self, folder_id, files):
+        for file in files:
+            os.remove(file['id'])
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-сумісне сховище (AWS S3, MinIO, ...): ключі prefix/folder_path/{episode_no}/файл.
+
+    Малі файли - одним put_object, більші за multipart_threshold_mb -
+    multipart upload частинами. Кожен запит несе Content-MD5, тож сервер
+    сам відхиляє пошкоджені дані, а ETag відповіді звіряється з md5 файлу.
+    Повтори та обмеження швидкості - вбудований адаптивний режим botocore.
+    """
+
+    name = 's3'
+
+    def __init__(self, settings, max_workers=None):
+        import boto3  # необов'язкова залежність: pip install boto3
+        from botocore.config import Config
+
+        self.bucket = settings['bucket']
+        self.prefix = settings.get('prefix', '').strip('/')
+        self.multipart_threshold = int(settings.get('multipart_threshold_mb', 8) * 1024 * 1024)
+        # S3 вимагає частини не менші за 5 MB (крім останньої)
+        self.chunk_size = max(5 * 1024 * 1024, int(settings.get('multipart_chunk_mb', 8) * 1024 * 1024))
+        self.max_workers = max_workers or MAX_PARALLEL_UPLOADS
+
+        self.client = boto3.client(
+            's3',
+            endpoint_url=settings.get('endpoint_url'),
+            region_name=settings.get('region'),
+            aws_access_key_id=settings.get('access_key_id'),
+            aws_secret_access_key=settings.get('secret_access_key'),
+            config=Config(
+                max_pool_connections=self.max_workers,
+                retries={'mode': 'adaptive', 'max_attempts': RETRY_MAX_ATTEMPTS}
+            )
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def _key(self, episode_no=None):
+        return '/'.join(([self.prefix] if self.prefix else []) + storage_path_parts(episode_no))
+
+    def episode_folder(self, episode_no):
+        return self._key(episode_no)
+
+    def parent_folder(self):
+        return self._key()
+
+    def list_files(self, folder_id):
+        prefix = f"{folder_id}/" if folder_id else ''
+        files = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            for obj in page.get('Contents', []):
+                etag = obj['ETag'].strip('"')
+                name = obj['Key'][len(prefix):]
+                files[name] = {
+                    'id': obj['Key'],
+                    'name': name,
+                    'size': str(obj['Size']),
+                    # ETag дорівнює md5 лише для об'єктів, завантажених одним запитом
+                    'md5Checksum': None if '-' in etag else etag
+                }
+        return files
+
+    @staticmethod
+    def _content_md5(digest):
+        return base64.b64encode(digest).decode('ascii')
+
+    def delete_files(self, folder_id, files):
+        # delete_objects приймає до 1000 ключів за запит
+        keys = [{'Key': file['id']} for file in files]
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys[start:start + 1000], 'Quiet': True})
+
+    def _upload_multipart(self, scan_file, key, mimetype):
+        """Returns: tuple (ETag відповіді, очікуваний ETag за md5 частин)."""
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType=mimetype
+        )['UploadId']
+        try:
+            parts = []
+            digests = []
+            for offset in range(0, scan_file.size, self.chunk_size):
+                chunk = scan_file.read(offset, self.chunk_size)
+                digest = hashlib.md5(chunk).digest()
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1,
+                    Body=chunk, ContentMD5=self._content_md5(digest)
+                )
+                parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+                digests.append(digest)
+
+            response = self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+        expected = f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+        return response['ETag'].strip('"'), expected
+
+    def upload(self, scan_file, filename, folder_id):
+        key = f"{folder_id}/{filename}" if folder_id else filename
+        mimetype = detect_mimetype(scan_file.head)
+        try:
+            with METRICS.span('upload', bytes=scan_file.size):
+                if scan_file.size > self.multipart_threshold:
+                    etag, expected = self._upload_multipart(scan_file, key, mimetype)
+                else:
+                    response = self.client.put_object(
+                        Bucket=self.bucket, Key=key, Body=scan_file.read(), ContentType=mimetype,
+                        ContentMD5=self._content_md5(bytes.fromhex(scan_file.md5))
+                    )
+                    etag, expected = response['ETag'].strip('"'), scan_file.md5
+
+            file = {'id': key, 'size': str(scan_file.size), 'md5Checksum': scan_file.md5 if etag == expected else etag}
+            return DriveUploader._report(file, scan_file, filename)
+
+        except Exception as e:
+            print(f"  ✗ Помилка завантаження {filename} в S3: {e}")
+            raise
+
+
+class FanOutStorage(StorageBackend):
+    """
+    ⭐ Кілька сховищ за один прохід: кожен скан зберігається з того самого
+    ScanFile в усі сховища паралельно, без повторного завантаження з CDN.
+
+    Перше сховище - основне: його ID папок і файлів записуються в маніфест
+    та індекс дедуплікації. Файл вважається збереженим, лише коли він є
+    в усіх сховищах; list_files повертає тільки такі файли, а сховища,
+    де файл з таким розміром уже є, при повторі пропускаються.
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = '+'.join(backend.name for backend in backends)
+        self.max_workers = max(backend.max_workers for backend in backends)
+        self._lock = threading.Lock()
+        self._folders = {}   # ID папки основного сховища -> ID папок усіх сховищ
+        self._present = {}   # (сховище, ID папки) -> {назва: файл}
+        self._uploaded = {}  # (ID папки, назва) -> ID файлу в кожному сховищі
+
+    def _register(self, folder_ids):
+        with self._lock:
+            self._folders[folder_ids[0]] = folder_ids
+        return folder_ids[0]
+
+    def episode_folder(self, episode_no):
+        return self._register([backend.episode_folder(episode_no) for backend in self.backends])
+
+    def parent_folder(self):
+        return self._register([backend.parent_folder() for backend in self.backends])
+
+    def list_files(self, folder_id):
+        listings = []
+        for index, (backend, backend_folder) in enumerate(zip(self.backends, self._folders[folder_id])):
+            listing = backend.list_files(backend_folder)
+            with self._lock:
+                self._present[(index, backend_folder)] = listing
+            listings.append(listing)
+
+        return {
+            name: file for name, file in listings[0].items()
+            if all(name in listing for listing in listings[1:])
+        }
+
+    def prefetch(self, episodes):
+        return sum(backend.prefetch(episodes) for backend in self.backends)
+
+    def delete_older_copies(self, filename, folder_id, keep_id):
+        file_ids = self._uploaded.get((folder_id, filename))
+        if not file_ids:
+            return
+        for backend, backend_folder, file_id in zip(self.backends, self._folders[folder_id], file_ids):
+            backend.delete_older_copies(filename, backend_folder, file_id)
+
+    def prune(self, folder_id, keep_names, keep_ids=()):
+        # keep_ids - ID основного сховища; в інших сховищах файли впізнаються за назвою
+        primary = self.backends[0].list_files(self._folders[folder_id][0])
+        names = set(keep_names) | {name for name, file in primary.items() if file['id'] in keep_ids}
+        return sum(
+            backend.prune(backend_folder, names, keep_ids if index == 0 else ())
+            for index, (backend, backend_folder) in enumerate(zip(self.backends, self._folders[folder_id]))
+        )
+
+    def submit(self, scan, folder_id):
+        futures = []
+        for index, (backend, backend_folder) in enumerate(zip(self.backends, self._folders[folder_id])):
+            existing = self._present.get((index, backend_folder), {}).get(scan['filename'])
+            if existing and int(existing['size']) == scan['file'].size:
+                future = Future()
+                future.set_result(existing['id'])
+            else:
+                future = backend.submit(scan, backend_folder)
+            futures.append(future)
+        return self._combine(scan, folder_id, futures)
+
+    def sync(self, scan, folder_id, remote=None):
+        # Кожне сховище порівнює скан з власним переліком папки; scan['sync'] - за основним
+        futures = [
+            backend.sync(scan if index == 0 else dict(scan), backend_folder,
+                         self._present.get((index, backend_folder), {}).get(scan['filename']))
+            for index, (backend, backend_folder) in enumerate(zip(self.backends, self._folders[folder_id]))
+        ]
+        return self._combine(scan, folder_id, futures)
+
+    def _combine(self, scan, folder_id, futures):
+        """Future з ID основного сховища, що завершується, коли файл є в усіх сховищах."""
+        done = Future()
+        pending = [len(futures)]
+
+        def on_done(_):
+            with self._lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            errors = [future.exception() for future in futures if future.exception()]
+            if errors:
+                done.set_exception(errors[0])
+                return
+            file_ids = [future.result() for future in futures]
+            with self._lock:
+                self._uploaded[(folder_id, scan['filename'])] = file_ids
+            done.set_result(file_ids[0])
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return done
+
+    def upload(self, scan_file, filename, folder_id):
+        return self.submit({'file': scan_file, 'filename': filename}, folder_id).result()
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+def create_storage(creds=None):
+    """
+    Створює сховище за storage.backends; кілька назв - FanOutStorage.
+
+    creds потрібні лише для "drive".
+    """
+    ensure_configured()
+    backends = []
+    for name in STORAGE_BACKENDS:
+        if name == 'drive':
+            backends.append(DriveStorage(creds))
+        elif name == 'local':
+            backends.append(LocalStorage(STORAGE_LOCAL_ROOT))
+        elif name == 's3':
+            backends.append(S3Storage(STORAGE_S3))
+        else:
+            raise ValueError(f"Невідоме сховище: {name} (доступні: drive, local, s3)")
+
+    if not backends:
+        raise ValueError("storage.backends порожній")
+    return backends[0] if len(backends) == 1 else FanOutStorage(backends)
+
+
+# ============================================================================
+# SCAN CLASSIFIER
+# ============================================================================
+
+class ScanClassifier:
+    """
+    Рішення "скан чи ні" з порогами, які можна підібрати за маніфестом.
+
+    Правило: ширина >= min_width, співвідношення сторін >= min_aspect_ratio і
+    (висота >= min_height або вага >= min_file_size_kb). Додатково відкидаються
+    skip_leading перших і skip_trailing останніх зображень епізоду (банери,
+    заставки) та URL, що збігаються з exclude_url_patterns.
+
+    Під час запуску рішення приймається для кожного зображення окремо
+    (is_scan) - воно переплетене з перериванням завантаження та негайним
+    завантаженням скану. predict - те саме правило для всіх розмічених
+    зображень маніфесту одразу, лише для калібрування.
+    """
+
+    PARAMS = ('min_height', 'min_width', 'min_aspect_ratio', 'min_file_size_kb',
+              'skip_leading', 'skip_trailing')
+
+    def __init__(self, min_height=None, min_width=None, min_aspect_ratio=None,
+                 min_file_size_kb=None, skip_leading=0, skip_trailing=0, url_patterns=None):
+        self.min_height = MIN_IMAGE_HEIGHT if min_height is None else min_height
+        self.min_width = MIN_IMAGE_WIDTH if min_width is None else min_width
+        self.min_aspect_ratio = MIN_ASPECT_RATIO if min_aspect_ratio is None else min_aspect_ratio
+        self.min_file_size_kb = MIN_FILE_SIZE_KB if min_file_size_kb is None else min_file_size_kb
+        self.skip_leading = int(skip_leading)
+        self.skip_trailing = int(skip_trailing)
+        self.url_patterns = [re.compile(p) for p in (url_patterns or [])]
+
+    @classmethod
+    def load(cls, model_file):
+        """
+        Класифікатор з файлу калібрування поверх порогів image_filters.
+
+        Без файлу (або з пошкодженим) діють пороги з конфігу.
+        """
+        params = {}
+        if model_file and os.path.exists(model_file):
+            try:
+                with open(model_file, 'r', encoding='utf-8') as f:
+                    params = json.load(f).get('params', {})
+                print(f"✓ Пороги класифікатора з {model_file}")
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"⚠ Не вдалося прочитати {model_file}: {e}")
+                params = {}
+        params = {name: params[name] for name in cls.PARAMS if name in params}
+        return cls(url_patterns=CLASSIFIER_EXCLUDE_URLS, **params)
+
+    def params(self):
+        return {name: getattr(self, name) for name in self.PARAMS}
+
+    def with_params(self, **params):
+        """Копія з іншими порогами (для калібрування)."""
+        merged = {**self.params(), **params}
+        clone = ScanClassifier(**merged)
+        clone.url_patterns = self.url_patterns
+        return clone
+
+    def is_scan(self, width, height, size_kb, url=None, index=None, total=None):
+        """
+        Рішення для одного зображення.
+
+        Без url/index/total перевіряються лише розміри - це верхня межа
+        повного рішення, тож на ній безпечно переривати завантаження.
+        """
+        if width < self.min_width or width <= 0:
+            return False
+        if height / width < self.min_aspect_ratio:
+            return False
+        if height < self.min_height and size_kb < self.min_file_size_kb:
+            return False
+        if index is not None and total is not None:
+            if index <= self.skip_leading or index > total - self.skip_trailing:
+                return False
+        if url is not None and any(p.search(url) for p in self.url_patterns):
+            return False
+        return True
+
+    def predict(self, width, height, size_kb, urls=None, index=None, total=None):
+        """
+        is_scan для списків ознак (калібрування).
+
+        З numpy рахує маски над масивами, без нього - поелементно.
+
+        Returns:
+            list[bool]: рішення для кожного зображення
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is None:
+            return [
+                self.is_scan(
+                    width[i], height[i], size_kb[i],
+                    urls[i] if urls is not None else None,
+                    index[i] if index is not None else None,
+                    total[i] if total is not None else None
+                )
+                for i in range(len(width))
+            ]
+
+        width = np.asarray(width, dtype=float)
+        height = np.asarray(height, dtype=float)
+        size_kb = np.asarray(size_kb, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aspect = np.where(width > 0, height / np.where(width > 0, width, 1), 0)
+        mask = (
+            (width >= self.min_width) & (width > 0)
+            & (aspect >= self.min_aspect_ratio)
+            & ((height >= self.min_height) | (size_kb >= self.min_file_size_kb))
+        )
+        if index is not None and total is not None:
+            index = np.asarray(index, dtype=float)
+            total = np.asarray(total, dtype=float)
+            mask &= (index > self.skip_leading) & (index <= total - self.skip_trailing)
+        if urls is not None and self.url_patterns:
+            mask &= np.array([not any(p.search(u) for p in self.url_patterns) for u in urls], dtype=bool)
+        return mask.tolist()
+
+
+SCAN_CLASSIFIER = ScanClassifier()
+
+
+def _f_score(predicted, labels, beta):
+    """Точність, повнота та F-beta для списків 0/1."""
+    tp = sum(1 for p, l in zip(predicted, labels) if p and l)
+    fp = sum(1 for p, l in zip(predicted, labels) if p and not l)
+    fn = sum(1 for p, l in zip(predicted, labels) if not p and l)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    b2 = beta * beta
+    f = (1 + b2) * precision * recall / (b2 * precision + recall) if precision + recall else 0.0
+    return precision, recall, f
+
+
+def _threshold_candidates(values, current, count=40):
+    """Кандидати порогу: поточне значення та квантилі спостережених значень."""
+    values = sorted(set(values))
+    if len(values) > count:
+        step = (len(values) - 1) / (count - 1)
+        values = [values[round(i * step)] for i in range(count)]
+    return sorted(set(values) | {current})
+
+
+def calibrate_classifier(beta=1.0, rounds=3):
+    """
+    Підбирає пороги класифікатора за зображеннями з маніфесту.
+
+    Використовуються лише ручні мітки (images.label, див. import_labels):
+    рішення попередніх запусків лише повторили б поточні пороги. Пороги
+    підбираються покоординатним спуском по квантилях ознак з максимізацією
+    F-beta (beta > 1 цінує повноту, < 1 - точність); результат записується
+    у CLASSIFIER_MODEL_FILE і підхоплюється наступними запусками.
+
+    Returns:
+        int: код завершення
+    """
+    ensure_configured()
+    if not RUN_MANIFEST:
+        print("✗ Калібрування потребує маніфесту (resume.enabled)")
+        return EXIT_USAGE
+
+    rows = RUN_MANIFEST.labelled_images()
+    labels = [row[6] for row in rows]
+    if not rows:
+        print("✗ У маніфесті немає ручних міток - калібрувати нема на чому.")
+        print("  → python webtoons_scraper.py --export-labels labels.csv")
+        print("  → заповніть стовпець label (1 - скан, 0 - ні)")
+        print("  → python webtoons_scraper.py --import-labels labels.csv --calibrate")
+        return EXIT_USAGE
+    if len(set(labels)) < 2:
+        print(f"✗ Усі {len(rows)} розмічених зображень одного класу - "
+              f"потрібні і скани, і не-скани")
+        return EXIT_USAGE
+
+    urls = [row[0] for row in rows]
+    index = [row[1] for row in rows]
+    total = [row[2] for row in rows]
+    width = [row[3] for row in rows]
+    height = [row[4] for row in rows]
+    size_kb = [row[5] / 1024 for row in rows]
+    aspect = [h / w if w else 0 for w, h in zip(width, height)]
+
+    def score(classifier):
+        return _f_score(classifier.predict(width, height, size_kb, urls, index, total), labels, beta)
+
+    candidates = {
+        'min_width': _threshold_candidates(width, SCAN_CLASSIFIER.min_width),
+        'min_height': _threshold_candidates(height, SCAN_CLASSIFIER.min_height),
+        'min_aspect_ratio': _threshold_candidates([round(a, 2) for a in aspect], SCAN_CLASSIFIER.min_aspect_ratio),
+        'min_file_size_kb': _threshold_candidates([round(s) for s in size_kb], SCAN_CLASSIFIER.min_file_size_kb),
+        'skip_leading': list(range(6)),
+        'skip_trailing': list(range(6)),
+    }
+
+    print(f"Калібрування класифікатора: {len(rows)} розмічених зображень, "
+          f"{sum(labels)} сканів, beta={beta}")
+    baseline = score(SCAN_CLASSIFIER)
+    best, best_score = SCAN_CLASSIFIER, baseline
+    for _ in range(rounds):
+        improved = False
+        for name in ScanClassifier.PARAMS:
+            for value in candidates[name]:
+                candidate = best.with_params(**{name: value})
+                candidate_score = score(candidate)
+                if candidate_score[2] > best_score[2]:
+                    best, best_score = candidate, candidate_score
+                    improved = True
+        if not improved:
+            break
+
+    print(f"  Поточні пороги:  точність {baseline[0]:.3f}, повнота {baseline[1]:.3f}, F {baseline[2]:.3f}")
+    print(f"  Підібрані пороги: точність {best_score[0]:.3f}, повнота {best_score[1]:.3f}, F {best_score[2]:.3f}")
+    for name, value in best.params().items():
+        old = getattr(SCAN_CLASSIFIER, name)
+        if value != old:
+            print(f"    {name}: {old} → {value}")
+
+    predicted = best.predict(width, height, size_kb, urls, index, total)
+    wrong = [(url, label) for url, p, label in zip(urls, predicted, labels) if bool(p) != bool(label)]
+    if wrong:
+        print(f"  Помилки класифікації: {len(wrong)}")
+        for url, label in wrong[:10]:
+            print(f"    {'пропущено скан' if label else 'зайве зображення'}: {url}")
+
+    model = {
+        'params': best.params(),
+        'beta': beta,
+        'samples': len(rows),
+        'precision': round(best_score[0], 4),
+        'recall': round(best_score[1], 4),
+        'f_score': round(best_score[2], 4),
+        'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    tmp_file = f"{CLASSIFIER_MODEL_FILE}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(model, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, CLASSIFIER_MODEL_FILE)
+    except OSError as e:
+        print(f"✗ Не вдалося зберегти {CLASSIFIER_MODEL_FILE}: {e}")
+        return EXIT_USAGE
+
+    print(f"✓ Пороги збережено у {CLASSIFIER_MODEL_FILE}")
+    return EXIT_OK
+
+
+LABEL_COLUMNS = ('url', 'label', 'predicted', 'webtoon_no', 'episode_no', 'idx', 'width', 'height', 'size_kb')
+
+
+def export_labels(path):
+    """
+    Записує зображення маніфесту в CSV для ручної розмітки.
+
+    predicted - рішення запусків (1 - скан), label - ручна мітка (порожня,
+    якщо її ще немає). Заповнений label повертається через import_labels.
+
+    Returns:
+        int: код завершення
+    """
+    ensure_configured()
+    if not RUN_MANIFEST:
+        print("✗ Розмітка потребує маніфесту (resume.enabled)")
+        return EXIT_USAGE
+
+    rows = RUN_MANIFEST.image_features()
+    try:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(LABEL_COLUMNS)
+            for webtoon_no, episode_no, idx, url, width, height, source_size, status, label in rows:
+                writer.writerow([
+                    url, '' if label is None else label,
+                    1 if status in ('uploaded', 'duplicate') else 0,
+                    webtoon_no, episode_no, idx, width, height, round(source_size / 1024, 1)
+                ])
+    except OSError as e:
+        print(f"✗ Не вдалося записати {path}: {e}")
+        return EXIT_USAGE
+
+    print(f"✓ {len(rows)} зображень записано у {path}")
+    print("  Заповніть стовпець label (1 - скан, 0 - ні) і завантажте: --import-labels")
+    return EXIT_OK
+
+
+def import_labels(path):
+    """
+    Читає ручні мітки з CSV (стовпці url, label) у маніфест.
+
+    Рядки з порожнім label пропускаються; "-" знімає мітку.
+
+    Returns:
+        int: код завершення
+    """
+    ensure_configured()
+    if not RUN_MANIFEST:
+        print("✗ Розмітка потребує маніфесту (resume.enabled)")
+        return EXIT_USAGE
+
+    labels = {}
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for line_no, row in enumerate(csv.DictReader(f), 2):
+                value = (row.get('label') or '').strip()
+                if not value:
+                    continue
+                if value not in ('0', '1', '-'):
+                    raise ValueError(f"рядок {line_no}: label має бути 0, 1 або -, а не {value!r}")
+                labels[row['url']] = None if value == '-' else int(value)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"✗ Не вдалося прочитати мітки з {path}: {e}")
+        return EXIT_USAGE
+
+    updated = RUN_MANIFEST.set_labels(labels)
+    print(f"✓ Мітки: {len(labels)} з файлу, оновлено {updated} зображень маніфесту")
+    if updated < len(labels):
+        print("⚠ Частини URL немає в маніфесті - ці мітки пропущено")
+    return EXIT_OK
+
+
+# ============================================================================
+# WEB SCRAPING FUNCTIONS
+# ============================================================================
+
+# Прапорці Chrome для легкого профілю: без фонових служб, розширень і синхронізації
+LEAN_CHROME_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    "--no-first-run",
+    "--mute-audio",
+]
+
+# Прихований скан не малюється, а отже й не декодується; запит при цьому
+# відбувається як завжди, тож NetworkTracker бачить усі зображення
+HIDE_IMAGES_SCRIPT = """
+document.addEventListener('DOMContentLoaded', () => {
+    const style = document.createElement('style');
+    style.textContent = 'img, canvas { visibility: hidden !important; }';
+    document.head.appendChild(style);
+});
+"""
+
+
+def setup_selenium_driver(user_data_dir=None, profile=None, port=None, headless=False):
+    """
+    Налаштування Selenium WebDriver.
+
+    Без аргументів запускає основний браузер з профілем користувача;
+    воркери DriverPool передають власний профіль і порт налагодження.
+    З CAPTURE_LEAN браузер запускається з легким профілем (apply_lean_profile).
+    """
+    user_data_dir = user_data_dir or CHROME_USER_DATA_DIR
+    profile = profile or CHROME_PROFILE
+    port = port or CHROME_DEBUG_PORT
+
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+
+    chrome_options.add_argument(f"user-data-dir={user_data_dir}")
+    chrome_options.add_argument(f"profile-directory={profile}")
+
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument(f"--remote-debugging-port={port}")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_argument("--window-size=1920,1080")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    if CAPTURE_LEAN:
+        for argument in LEAN_CHROME_ARGS:
+            chrome_options.add_argument(argument)
+        # У performance log потрібні лише події Network - без Page/Tracing
+        chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    service = get_chrome_service()
+
+    print(f"Використання Chrome профілю: {user_data_dir}/{profile}")
+    print("Запуск Chrome драйвера...")
+
+    try:
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    except SessionNotCreatedException:
+        # Явно вказаний chrome.driver_path не перевстановлюємо
+        if CHROME_DRIVER_PATH:
+            raise
+        print("⚠ Збережений ChromeDriver не підходить до цієї версії Chrome, перевстановлюємо...")
+        reset_chrome_service(service)
+        driver = webdriver.Chrome(service=get_chrome_service(), options=chrome_options)
+    print("✓ Chrome драйвер запущено успішно")
+    if CAPTURE_LEAN:
+        apply_lean_profile(driver, hide_images=headless)
+    return driver
+
+
+def apply_lean_profile(driver, hide_images=False):
+    """
+    ⭐ Легкий профіль збору: блокує запити, не потрібні для URL зображень.
+
+    Network.setBlockedURLs діє на всі наступні завантаження вкладки.
+    Вимкнути зображення повністю не можна - тоді браузер не запитає
+    й скани; натомість з hide_images (лише для браузерів без вікна)
+    зображення приховуються і Chrome не витрачає час на їх декодування.
+    """
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        if CAPTURE_BLOCKED_URLS:
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(CAPTURE_BLOCKED_URLS)})
+        if hide_images:
+            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': HIDE_IMAGES_SCRIPT})
+    except Exception as e:
+        print(f"⚠ Легкий профіль не застосовано: {e}")
+        return
+    print(f"✓ Легкий профіль: заблоковано шаблонів URL: {len(CAPTURE_BLOCKED_URLS)}")
+
+
+# Поля Network.Cookie, які приймає Network.setCookies
+COOKIE_PARAM_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly',
+                       'sameSite', 'expires', 'priority', 'sourceScheme', 'sourcePort')
+
+
+class DriverPool:
+    """
+    ⭐ Пул браузерів для паралельного збору епізодів.
+
+    Основний браузер (профіль користувача, вхід в акаунт) доповнюється
+    воркерами, кожен на власному порту налагодження та з власним
+    тимчасовим профілем. Після входу cookies основного браузера
+    переносяться у воркери через CDP, тож вхід потрібен лише один раз.
+    """
+
+    def __init__(self, main_driver, size):
+        self.main_driver = main_driver
+        self.size = max(1, size)
+        self.drivers = [main_driver]
+        self.profile_dirs = []
+
+    def start(self):
+        """Запускає воркери; викликати після входу в акаунт в основному браузері."""
+        if self.size <= 1 or len(self.drivers) > 1:
+            return
+
+        cookies = self.main_driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+        cookie_params = []
+        for cookie in cookies:
+            param = {key: cookie[key] for key in COOKIE_PARAM_FIELDS if key in cookie}
+            if cookie.get('session'):
+                param.pop('expires', None)
+            cookie_params.append(param)
+
+        if CHROME_WORKER_PROFILES_DIR:
+            os.makedirs(CHROME_WORKER_PROFILES_DIR, exist_ok=True)
+
+        for worker_no in range(1, self.size):
+            profile_dir = tempfile.mkdtemp(prefix='webtoons_chrome_', dir=CHROME_WORKER_PROFILES_DIR)
+            self.profile_dirs.append(profile_dir)
+            try:
+                driver = setup_selenium_driver(
+                    user_data_dir=profile_dir,
+                    profile='Default',
+                    port=CHROME_DEBUG_PORT + worker_no,
+                    headless=CHROME_WORKERS_HEADLESS
+                )
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookie_params})
+            except Exception as e:
+                print(f"⚠ Не вдалося запустити браузер-воркер {worker_no}: {e}")
+                continue
+            self.drivers.append(driver)
+
+        print(f"✓ Браузерів у пулі: {len(self.drivers)} (cookies: {len(cookie_params)})")
+
+    def close(self):
+        """Закриває воркери та видаляє їхні профілі (основний браузер не чіпає)."""
+        for driver in self.drivers[1:]:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self.drivers = [self.main_driver]
+
+        for profile_dir in self.profile_dirs:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        self.profile_dirs = []
+
+
+def wait_for_network_idle_and_collect_images(driver, timeout=30, idle_time=2):
+    """Очікує завершення Network запитів та збирає URLs зображень."""
+    print(f"Очікування завершення завантаження (макс {timeout}с)...", end=" ", flush=True)
+
+    import json
+
+    start_time = time.time()
+    last_request_time = start_time
+
+    image_urls = []
+    seen_urls = set()
+
+    while time.time() - start_time < timeout:
+        logs = driver.get_log('performance')
+
+        for entry in logs:
+            try:
+                log = entry.get('message', '')
+
+                # Тишу рахуємо лише за запитами pstatic.net - аналітика та шрифти її не скидають
+                if 'pstatic.net' in log:
+                    last_request_time = time.time()
+
+                if 'Network.responseReceived' in log:
+                    log_data = json.loads(log)
+                    response = log_data.get('message', {}).get('params', {}).get('response', {})
+                    url = response.get('url', '')
+                    mime_type = response.get('mimeType', '')
+
+                    if 'image' in mime_type and 'pstatic.net' in url:
+                        if url not in seen_urls:
+                            seen_urls.add(url)
+                            image_urls.append(url)
+
+            except:
+                continue
+
+        if time.time() - last_request_time >= idle_time:
+            elapsed = time.time() - start_time
+            print(f"✓ Завершено за {elapsed:.1f}с (знайдено {len(image_urls)} зображень)")
+            return image_urls
+
+        time.sleep(0.5)
+
+    elapsed = time.time() - start_time
+    print(f"⚠ Timeout через {elapsed:.1f}с (знайдено {len(image_urls)} зображень)")
+    return image_urls
+
+
+class NetworkTracker:
+    """
+    ⭐ Відстежує CDP-події домену Network (з performance log Chrome).
+
+    На відміну від wait_for_network_idle_and_collect_images, рахує точну
+    кількість незавершених запитів зображень pstatic.net
+    (requestWillBeSent -> loadingFinished/loadingFailed) і вважає сторінку
+    завантаженою, щойно їх стає 0, а не після фіксованого вікна тиші.
+    JSON розбирається лише для подій, що стосуються pstatic.net.
+    """
+
+    REQUEST_ID_RE = re.compile(r'"requestId":\s*"([^"]+)"')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.inflight = set()
+        self.image_urls = []
+        self.seen_urls = set()
+        self.request_urls = {}  # requestId -> URL зображення
+        self.response_headers = {}  # requestId -> заголовки відповіді (для кешу зображень)
+        self.json_responses = []  # (requestId, URL) JSON-відповідей webtoons.com
+        self.requests_seen = 0
+        self.last_activity = time.time()
+
+        if CAPTURE_REUSE_BODIES:
+            # Типовий буфер Chrome (~100 МБ) витісняє ранні скани довгого епізоду
+            driver.execute_cdp_cmd('Network.enable', {
+                'maxTotalBufferSize': CAPTURE_BODY_BUFFER,
+                'maxResourceBufferSize': min(CAPTURE_BODY_BUFFER, 64 * 1024 * 1024)
+            })
+
+        # Події попередньої сторінки нас не цікавлять
+        driver.get_log('performance')
+
+    def drain(self):
+        """Обробляє всі нові події з performance log."""
+        for entry in self.driver.get_log('performance'):
+            self._handle(entry.get('message', ''))
+
+    def _handle(self, message):
+        if 'Network.loadingFinished' in message or 'Network.loadingFailed' in message:
+            # Для завершення запиту достатньо requestId - без json.loads
+            match = self.REQUEST_ID_RE.search(message)
+            if match and match.group(1) in self.inflight:
+                self.inflight.discard(match.group(1))
+                self.last_activity = time.time()
+            return
+
+        if 'pstatic.net' not in message:
+            if 'Network.responseReceived' in message and 'json' in message and 'webtoons.com' in message:
+                self._handle_json_response(message)
+            return
+
+        if 'Network.requestWillBeSent' in message:
+            params = self._params(message)
+            if params is None or params.get('type') != 'Image':
+                return
+            self.inflight.add(params['requestId'])
+            self.requests_seen += 1
+            self.last_activity = time.time()
+
+        elif 'Network.responseReceived' in message and 'image' in message:
+            params = self._params(message)
+            if params is None:
+                return
+            response = params.get('response', {})
+            url = response.get('url', '')
+            if 'image' in response.get('mimeType', '') and 'pstatic.net' in url:
+                self.request_urls[params.get('requestId')] = url
+                self.response_headers[params.get('requestId')] = response.get('headers', {})
+                if url not in self.seen_urls:
+                    self.seen_urls.add(url)
+                    self.image_urls.append(url)
+                self.last_activity = time.time()
+
+    def _handle_json_response(self, message):
+        """Запам'ятовує XHR з JSON - кандидати для швидкого шляху (FastPathResolver)."""
+        params = self._params(message)
+        if params is None:
+            return
+        response = params.get('response', {})
+        url = response.get('url', '')
+        if 'json' in response.get('mimeType', '') and urlparse(url).netloc.endswith('webtoons.com'):
+            self.json_responses.append((params.get('requestId'), url))
+
+    @staticmethod
+    def _params(message):
+        try:
+            return json.loads(message).get('message', {}).get('params', {})
+        except ValueError:
+            return None
+
+    def response_bodies(self, urls):
+        """
+        ⭐ Забирає з браузера вже завантажені зображення (Network.getResponseBody).
+
+        Кожне тіло одразу розбирається як звичайна відповідь сервера
+        (ImageProbe, кеш зображень), тож analyze_images лише підхоплює
+        готовий результат. Тіла, які Chrome уже витіснив з буфера,
+        у результат не потрапляють і завантажуються з CDN як завжди.
+
+        Returns:
+            dict: URL -> (width, height, size_kb, scan_file, filename)
+        """
+        wanted = set(urls)
+        request_ids = {}
+        for request_id, url in self.request_urls.items():
+            if url in wanted:
+                request_ids[url] = request_id  # остання відповідь на URL
+
+        bodies = {}
+        for url, request_id in request_ids.items():
+            with METRICS.span('browser_body', url=url) as span:
+                try:
+                    body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                except Exception:
+                    span['error'] = 'evicted'
+                    continue
+
+                if not body.get('base64Encoded'):
+                    # Текстові тіла (SVG тощо) Chrome віддає вже декодованими -
+                    # початкові байти з них не відновити, тож цей URL піде в CDN
+                    span['error'] = 'text_body'
+                    continue
+                try:
+                    data = base64.b64decode(body.get('body', ''))
+                except ValueError:
+                    span['error'] = 'decode'
+                    continue
+                span['bytes'] = len(data)
+
+                probe = ImageProbe(early_abort=False)
+                probe.feed(data)
+                del data
+                try:
+                    with METRICS.span('classify'):
+                        width, height, size, scan_file = probe.finish()
+                except Exception:
+                    continue
+
+                if IMAGE_CACHE:
+                    headers = requests.structures.CaseInsensitiveDict(self.response_headers.get(request_id, {}))
+                    IMAGE_CACHE.store(url, width, height, size, scan_file, headers)
+                bodies[url] = (width, height, size / 1024, scan_file, extract_filename_from_url(url))
+
+        return bodies
+
+    def wait_for_idle(self, timeout=30):
+        """
+        Чекає, поки всі запити зображень pstatic.net завершаться.
+
+        Тиша CAPTURE_SETTLE_TIME рахується не раніше за початок виклику:
+        після прокрутки запити лінивих зображень з'являються в лозі не одразу,
+        і активність до прокрутки не повинна завершити очікування.
+
+        Returns:
+            bool: True - сторінка завантажилась, False - timeout
+        """
+        print(f"Очікування завантаження зображень (макс {timeout}с)...", end=" ", flush=True)
+        start_time = time.time()
+
+        while True:
+            self.drain()
+            now = time.time()
+            elapsed = now - start_time
+
+            quiet = now - max(self.last_activity, start_time)
+            if self.requests_seen and not self.inflight and quiet >= CAPTURE_SETTLE_TIME:
+                print(f"✓ Завершено за {elapsed:.1f}с (знайдено {len(self.image_urls)} зображень)")
+                return True
+
+            if not self.requests_seen and elapsed >= CAPTURE_FIRST_IMAGE_TIMEOUT:
+                print(f"⚠ Запитів зображень немає за {elapsed:.1f}с")
+                return False
+
+            if elapsed >= timeout:
+                print(f"⚠ Timeout через {elapsed:.1f}с ({len(self.inflight)} запитів не завершено, "
+                      f"знайдено {len(self.image_urls)} зображень)")
+                return False
+
+            time.sleep(CAPTURE_POLL_INTERVAL)
+
+
+def extract_filename_from_url(url):
+    """Витягує оригінальну назву файлу з URL."""
+    parsed = urlparse(url)
+    filename = os.path.basename(parsed.path)
+
+    if not filename or len(filename) < 5:
+        match = re.search(r'/([a-zA-Z0-9_-]{10,})\.(jpg|jpeg|png|gif)', url, re.IGNORECASE)
+        if match:
+            filename = f"{match.group(1)}.{match.group(2)}"
+        else:
+            import hashlib
+            url_hash = hashlib.md5(url.encode()).hexdigest()[:12]
+            filename = f"scan_{url_hash}.jpg"
+
+    return filename
+
+
+def parse_image_header(data):
+    """
+    ⭐ Визначає розміри зображення за першими байтами файлу.
+
+    Підтримує JPEG (маркер SOF), PNG (IHDR), GIF та WebP (VP8/VP8L/VP8X).
+
+    Returns:
+        tuple або None: (width, height); None - формат невідомий або даних замало
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(data) >= 24 and data[12:16] == b'IHDR':
+            return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+        return None
+
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) >= 10:
+            return int.from_bytes(data[6:8], 'little'), int.from_bytes(data[8:10], 'little')
+        return None
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        chunk = data[12:16]
+        if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+            return (int.from_bytes(data[26:28], 'little') & 0x3FFF,
+                    int.from_bytes(data[28:30], 'little') & 0x3FFF)
+        if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+            b0, b1, b2, b3 = data[21:25]
+            return (1 + (((b1 & 0x3F) << 8) | b0),
+                    1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6)))
+        if chunk == b'VP8X' and len(data) >= 30:
+            return (1 + int.from_bytes(data[24:27], 'little'),
+                    1 + int.from_bytes(data[27:30], 'little'))
+        return None
+
+    if data[:2] == b'\xff\xd8':
+        # Ідемо по сегментах до SOFn (пропускаючи EXIF, ICC тощо)
+        i = 2
+        while i + 4 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                i += 2
+                continue
+
+            length = int.from_bytes(data[i + 2:i + 4], 'big')
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                if i + 9 > len(data):
+                    return None
+                height = int.from_bytes(data[i + 5:i + 7], 'big')
+                width = int.from_bytes(data[i + 7:i + 9], 'big')
+                return width, height
+            i += 2 + length
+
+    return None
+
+
+class ImageProbe:
+    """
+    Потокове читання зображення частинами (feed), незалежно від HTTP-клієнта.
+
+    Спершу дані накопичуються лише до розбору заголовка (або PROBE_MAX_BYTES).
+    Якщо за розмірами та Content-Length це не скан, feed повертає False -
+    завантаження треба перервати. Скани (і невідомі формати) дочитуються
+    одразу в ScanFile (RAM у межах ліміту або диск).
+    """
+
+    def __init__(self, content_length=None, early_abort=True):
+        self.content_length = int(content_length) if str(content_length or '').isdigit() else None
+        self.early_abort = early_abort
+        self.buffer = bytearray()
+        self.dims = None
+        self.scan_file = None
+        self.result = None
+        self.bytes_received = 0
+
+    def feed(self, chunk):
+        """Returns: False, якщо далі читати не потрібно."""
+        self.bytes_received += len(chunk)
+        if self.scan_file is not None:
+            self.scan_file.write(chunk)
+            return True
+
+        self.buffer.extend(chunk)
+        self.dims = parse_image_header(bytes(self.buffer))
+        if not self.dims and len(self.buffer) < PROBE_MAX_BYTES:
+            return True
+
+        if self.early_abort and self.dims and self.content_length is not None:
+            width, height = self.dims
+            if not is_likely_scan(width, height, self.content_length / 1024):
+                self.result = (width, height, self.content_length, None)
+                return False
+
+        self._start_body()
+        return True
+
+    def discard(self):
+        """Звільняє частково прочитані дані (обірване з'єднання перед повтором)."""
+        if self.scan_file is not None:
+            self.scan_file.release()
+            self.scan_file = None
+
+    def _start_body(self):
+        self.scan_file = ScanFile()
+        self.scan_file.write(bytes(self.buffer))
+        self.buffer = bytearray()
+
+    def finish(self):
+        """
+        Returns:
+            tuple: (width, height, size_bytes, scan_file); scan_file=None для не-сканів
+        """
+        if self.result:
+            return self.result
+
+        if self.scan_file is None:
+            self._start_body()
+        scan_file = self.scan_file.finish()
+
+        dims = self.dims
+        if not dims:
+            from PIL import Image
+
+            try:
+                with scan_file.open() as fileobj:
+                    dims = Image.open(fileobj).size
+            except Exception:
+                scan_file.release()
+                raise
+
+        if not is_likely_scan(dims[0], dims[1], scan_file.size / 1024):
+            scan_file.release()
+            return dims[0], dims[1], scan_file.size, None
+
+        return dims[0], dims[1], scan_file.size, scan_file
+
+
+class ImageFetch:
+    """
+    Стан завантаження одного URL: кеш, умовний запит та збереження результату.
+
+    Спільний для потокового (requests) та asyncio (httpx) рушіїв.
+    Результат - кортеж (width, height, size_kb, scan_file, filename).
+    """
+
+    def __init__(self, img_url, span=None):
+        self.url = img_url
+        self.span = span if span is not None else {}
+        self.filename = extract_filename_from_url(img_url)
+        self.entry = IMAGE_CACHE.lookup(img_url) if IMAGE_CACHE else None
+        self.cached_file = None
+        self.headers = {}
+        # Готовий результат, якщо запит до сервера не потрібен
+        self.result = None
+
+        if not self.entry:
+            return
+
+        entry = self.entry
+        self.span['source'] = 'cache'
+        size_kb = entry['size'] / 1024
+        if not is_likely_scan(entry['width'], entry['height'], size_kb):
+            self.result = (entry['width'], entry['height'], size_kb, None, self.filename)
+            return
+
+        self.cached_file = IMAGE_CACHE.read_body(entry)
+        if self.cached_file is None:
+            return
+        if not IMAGE_CACHE_REVALIDATE:
+            self.result = (entry['width'], entry['height'], size_kb, self.cached_file, self.filename)
+            return
+
+        if entry['etag']:
+            self.headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            self.headers['If-Modified-Since'] = entry['last_modified']
+
+    def not_modified(self):
+        """Результат для відповіді 304 (None, якщо в кеші немає вмісту)."""
+        if self.cached_file is None:
+            return None
+        self.span['source'] = 'not_modified'
+        entry = self.entry
+        return entry['width'], entry['height'], entry['size'] / 1024, self.cached_file, self.filename
+
+    def discard_cached(self):
+        if self.cached_file is not None:
+            self.cached_file.release()
+            self.cached_file = None
+
+    def make_probe(self, response_headers):
+        self.span['source'] = 'network'
+        return ImageProbe(response_headers.get('Content-Length'), early_abort=HEADER_PROBE_ENABLED)
+
+    def complete(self, probe, response_headers):
+        """Завершує читання, зберігає результат у кеш та повертає його."""
+        self.span['bytes'] = probe.bytes_received
+        with METRICS.span('classify'):
+            width, height, size, scan_file = probe.finish()
+
+        if IMAGE_CACHE:
+            IMAGE_CACHE.store(self.url, width, height, size, scan_file, response_headers)
+
+        return width, height, size / 1024, scan_file, self.filename
+
+
+def get_image_dimensions_and_size(img_url, cookies_dict):
+    """
+    Завантажує зображення та отримує його властивості.
+
+    Дані скану повертаються як ScanFile; для не-сканів - None.
+    З HEADER_PROBE_ENABLED не-скани розпізнаються за заголовком файлу
+    і не завантажуються повністю.
+    З IMAGE_CACHE: не-скани з кешу не завантажуються взагалі,
+    а скани перевіряються умовним запитом (If-None-Match/If-Modified-Since)
+    і при 304 беруться з диска.
+    """
+    with METRICS.span('image_fetch', url=img_url) as span:
+        fetch = ImageFetch(img_url, span)
+        if fetch.result:
+            return fetch.result
+
+        try:
+            result = call_with_retry(partial(_fetch_image_once, fetch, cookies_dict),
+                                     img_url, MAX_PARALLEL_DOWNLOADS, span)
+        except Exception:
+            result = None
+        if result:
+            return result
+
+        fetch.discard_cached()
+        span['error'] = 'failed'
+        return None
+
+
+def _fetch_image_once(fetch, cookies_dict):
+    """
+    Одна спроба завантаження для get_image_dimensions_and_size.
+
+    429/5xx та обриви з'єднання піднімають виняток, і call_with_retry
+    повторює запит; інші невдалі статуси повертають None.
+    """
+    response = requests.get(fetch.url, cookies=cookies_dict, headers=fetch.headers, timeout=20, stream=True)
+
+    with response:
+        if response.status_code == 304 and fetch.cached_file is not None:
+            return fetch.not_modified()
+        if response.status_code != 200:
+            check_response(response)
+            return None
+
+        fetch.discard_cached()
+        probe = fetch.make_probe(response.headers)
+        try:
+            for chunk in response.iter_content(chunk_size=PROBE_CHUNK_SIZE):
+                if not probe.feed(chunk):
+                    break
+            return fetch.complete(probe, response.headers)
+        except Exception:
+            probe.discard()
+            raise
+
+
+def make_analysis_result(img_url, index, result, total=None):
+    """
+    Формує результат аналізу зображення для analyze_images.
+
+    Остаточне рішення приймає SCAN_CLASSIFIER з усіма ознаками (URL, позиція
+    index з total); дані зображення, яке він відкинув, звільняються.
+    """
+    if not result:
+        return None
+
+    width, height, size_kb, scan_file, filename = result
+    is_scan = scan_file is not None and SCAN_CLASSIFIER.is_scan(width, height, size_kb, img_url, index, total)
+    if scan_file is not None and not is_scan:
+        scan_file.release()
+        scan_file = None
+
+    return {
+        'url': img_url,
+        'width': width,
+        'height': height,
+        'size_kb': size_kb,
+        'scan_file': scan_file,
+        'filename': filename,
+        'is_scan': is_scan,
+        'index': index
+    }
+
+
+def analyze_single_image(img_url, cookies_dict, index, total):
+    """Аналізує одне зображення (для паралельної обробки)."""
+    result = get_image_dimensions_and_size(img_url, cookies_dict)
+    return make_analysis_result(img_url, index, result, total)
+
+
+def is_likely_scan(width, height, size_kb):
+    """
+    Визначає, чи є зображення сканом, лише за розмірами та вагою файлу.
+
+    Правила за URL і позицією можуть лише відкинути зображення, тож
+    False тут остаточне - на ньому ґрунтується переривання завантаження.
+    """
+    return SCAN_CLASSIFIER.is_scan(width, height, size_kb)
+
+
+def collect_image_urls(driver, url, wait_for_login=False, tracker=None):
+    """
+    Завантажує сторінку епізоду та збирає URL зображень і cookies сесії.
+
+    tracker - NetworkTracker, створений до виклику (щоб потім прочитати
+    з нього JSON-відповіді); за замовчуванням створюється тут.
+
+    Returns:
+        tuple: (список URL, словник cookies)
+    """
+    print(f"Завантаження сторінки: {url}")
+    if tracker is None and CAPTURE_MODE == 'events':
+        tracker = NetworkTracker(driver)
+    with METRICS.span('page_load', url=url):
+        driver.get(url)
+
+    if wait_for_login and INTERACTIVE:
+        print("\n" + "=" * 70)
+        print("⚠️  НЕОБХІДНИЙ ВХІД В АКАУНТ")
+        print("=" * 70)
+        print("1. Має відкритися вікно Chrome")
+        print("2. Увійдіть в акаунт на translate.webtoons.com")
+        print("3. Переконайтесь, що інтерфейс перекладу завантажився")
+        print("4. Натисніть Enter тут після входу")
+        print("=" * 70)
+        input("👉 Натисніть Enter після входу...")
+        print("✓ Продовжуємо...\n")
+
+    with METRICS.span('network_idle', url=url) as span:
+        if tracker:
+            tracker.wait_for_idle(timeout=30)
+
+            print("Прокручування для завантаження всіх зображень...")
+            if tracker.requests_seen:
+                # Ліниві зображення підвантажуються після прокрутки - чекаємо саме на них
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                tracker.wait_for_idle(timeout=15)
+                driver.execute_script("window.scrollTo(0, 0);")
+
+            all_urls = list(tracker.image_urls)
+        else:
+            image_urls = wait_for_network_idle_and_collect_images(driver, timeout=30, idle_time=2)
+
+            print("Прокручування для завантаження всіх зображень...")
+            for i in range(2):
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                time.sleep(1)
+
+            driver.execute_script("window.scrollTo(0, 0);")
+
+            additional_urls = wait_for_network_idle_and_collect_images(driver, timeout=15, idle_time=1.5)
+
+            all_urls = image_urls + [url for url in additional_urls if url not in image_urls]
+
+        span['images'] = len(all_urls)
+
+    if not all_urls:
+        if wait_for_login and not INTERACTIVE:
+            # Без користувача порожня перша сторінка означає прострочену сесію профілю
+            raise SessionExpiredError(
+                f"Зображення не знайдено ({driver.current_url}) - ймовірно, сесія в профілі Chrome прострочена"
+            )
+        print("⚠ Зображення не знайдено. Переконайтесь, що ви увійшли в акаунт!")
+        return [], {}
+
+    print(f"Всього унікальних зображень: {len(all_urls)}")
+
+    selenium_cookies = driver.get_cookies()
+    cookies_dict = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
+
+    return all_urls, cookies_dict
+
+
+def analyze_images(all_urls, cookies_dict, pending_urls=None, webtoon_no=None, episode_no=None,
+                   on_scan=None, folder_id=None, bodies=None):
+    """
+    Паралельно завантажує зображення та відбирає скани (впорядковані за index).
+
+    pending_urls - підмножина all_urls для аналізу (решту вже оброблено);
+    index зображення завжди рахується за позицією в all_urls.
+    З webtoon_no/episode_no результати записуються в маніфест запуску.
+    on_scan(scan) викликається для кожного скану одразу після класифікації,
+    щоб завантаження на Drive починалося, не чекаючи решти епізоду.
+    З folder_id скани, які вже є в папці (DEDUP_INDEX), відкидаються як дублікати.
+    bodies - зображення, вже отримані браузером (NetworkTracker.response_bodies):
+    вони не завантажуються повторно, а невикористані звільняються (словник спорожнюється).
+    """
+    ensure_configured()
+    bodies = bodies if bodies is not None else {}
+    engine = get_async_engine()
+    if engine:
+        print(f"Аналіз зображень (asyncio, до {engine.max_in_flight} запитів одночасно)...")
+    else:
+        print(f"Аналіз зображень (паралельний режим, {MAX_PARALLEL_DOWNLOADS} потоків)...")
+
+    record = RUN_MANIFEST and webtoon_no is not None
+    dedup = DEDUP_INDEX and webtoon_no is not None and folder_id is not None
+    transform_pool = get_transform_pool()
+    transforms = []
+    scan_images = []
+
+    # З адаптивним режимом потоків більше: скільки з них качає одночасно, вирішує AdaptiveLimiter
+    pool_size = max(MAX_PARALLEL_DOWNLOADS, ADAPTIVE_MAX_CONCURRENCY) if ADAPTIVE_CONCURRENCY else MAX_PARALLEL_DOWNLOADS
+    claimed = []
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            # Потоки створюються лише при submit, тож з asyncio-рушієм executor простоює
+            submit = engine.submit_analysis if engine else partial(executor.submit, analyze_single_image)
+            futures = {}
+            for idx, url in enumerate(all_urls, 1):
+                if pending_urls is not None and url not in pending_urls:
+                    continue
+                if url in bodies:
+                    future = executor.submit(make_analysis_result, url, idx, bodies.pop(url), len(all_urls))
+                else:
+                    future = submit(url, cookies_dict, idx, len(all_urls))
+                futures[future] = (idx, url)
+            release_browser_bodies(bodies)
+
+            for future in as_completed(futures):
+                result = future.result()
+
+                if result:
+                    idx = result['index']
+                    width = result['width']
+                    height = result['height']
+                    size_kb = result['size_kb']
+                    filename = result['filename']
+                    is_scan = result['is_scan']
+                    features = {'width': width, 'height': height, 'source_size': int(size_kb * 1024)}
+
+                    original = None
+                    if is_scan and dedup:
+                        original = DEDUP_INDEX.claim(result['scan_file'], filename, webtoon_no, folder_id)
+                        if not original:
+                            claimed.append(result['scan_file'].md5)
+                        if original and SYNC_ENABLED and original['filename'] == filename:
+                            # Той самий файл на своєму місці - синхронізація позначить його як незмінений
+                            original = None
+
+                    if webtoon_no is not None:
+                        METRICS.episode_add(webtoon_no, episode_no, images=1, scans=int(is_scan),
+                                            duplicates=int(bool(original)), bytes_downloaded=int(size_kb * 1024))
+                    METRICS.progress(images=1, scans=int(is_scan), nbytes=int(size_kb * 1024))
+
+                    if not PROGRESS_LINE:
+                        display_name = filename[:30] if len(filename) > 30 else filename
+                        if original:
+                            status = f"≡ Дублікат {original['filename']}"
+                        else:
+                            status = "✓ СКАН" if is_scan else "✗ Пропуск"
+                        print(f"[{idx}/{len(all_urls)}] {display_name:30s} {width}x{height}, {size_kb:.1f}KB", status)
+
+                    if original:
+                        if record:
+                            RUN_MANIFEST.record_image(
+                                webtoon_no, episode_no, result['url'], 'duplicate',
+                                index=idx, filename=filename, md5=result['scan_file'].md5,
+                                size=result['scan_file'].size, drive_file_id=original['drive_file_id'],
+                                features=features
+                            )
+                        result['scan_file'].release()
+                    elif is_scan:
+                        scan = {
+                            'file': result['scan_file'],
+                            'filename': filename,
+                            'index': idx,
+                            'url': result['url'],
+                            'features': features
+                        }
+                        scan_images.append(scan)
+                        if transform_pool:
+                            transforms.append(submit_transform(transform_pool, scan, on_scan))
+                        elif on_scan:
+                            on_scan(scan)
+                    elif record:
+                        RUN_MANIFEST.record_image(
+                            webtoon_no, episode_no, result['url'], 'skipped',
+                            index=idx, filename=filename, features=features
+                        )
+
+                elif record:
+                    idx, url = futures[future]
+                    RUN_MANIFEST.record_image(
+                        webtoon_no, episode_no, url, 'failed',
+                        index=idx, error='download'
+                    )
+
+        # Послідовний режим завантажує скани одразу після повернення - чекаємо перекодування
+        for future in transforms:
+            future.result()
+    except BaseException:
+        # Скани, зарезервовані в індексі, так і не завантажено - інакше наступні
+        # такі самі скани вважалися б дублікатами файлу, якого немає у сховищі
+        for md5 in claimed:
+            DEDUP_INDEX.release(folder_id, md5)
+        raise
+
+    if PROGRESS_LINE:
+        print()
+
+    scan_images.sort(key=lambda x: x['index'])
+
+    return scan_images
+
+
+def release_dedup_claims(scan_images, folder_id):
+    """Знімає резерви DEDUP_INDEX сканів, що не дійшли до record_episode_uploads."""
+    if not DEDUP_INDEX or folder_id is None:
+        return
+    for scan in scan_images:
+        DEDUP_INDEX.release(folder_id, scan.get('original_md5', scan['file'].md5))
+
+
+def release_browser_bodies(bodies):
+    """Звільняє скани з браузера, які так і не пішли на аналіз, та спорожнює словник."""
+    if not bodies:
+        return
+    for result in bodies.values():
+        if result[3] is not None:
+            result[3].release()
+    bodies.clear()
+
+
+# ============================================================================
+# FAST PATH (JSON API)
+# ============================================================================
+
+IMAGE_URL_IN_JSON_RE = re.compile(
+    r'https?:(?:\\?/){2}[^"\s\\]*?pstatic\.net(?:\\?/[^"\s\\]*)*?\.(?:jpe?g|png|gif|webp)(?:\?[^"\s\\]*)?',
+    re.IGNORECASE
+)
+
+
+def extract_image_urls_from_json(text):
+    """Витягує URL зображень pstatic.net з тексту JSON у порядку появи."""
+    urls = []
+    seen = set()
+    for match in IMAGE_URL_IN_JSON_RE.finditer(text):
+        url = match.group(0).replace('\\/', '/').replace('\\u0026', '&')
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def make_endpoint_template(url, webtoon_no, episode_no):
+    """
+    Перетворює URL JSON-запиту епізоду на шаблон з {webtoon_no}/{episode_no}.
+
+    Returns:
+        str або None: None, якщо номер епізоду в URL не знайдено
+    """
+    parsed = urlparse(url)
+
+    query = []
+    for key, value in parse_qsl(parsed.query, keep_blank_values=True):
+        if value == str(episode_no) and 'episode' in key.lower():
+            value = '{episode_no}'
+        elif value == str(webtoon_no) and 'webtoon' in key.lower():
+            value = '{webtoon_no}'
+        query.append((key, value))
+
+    # Номер епізоду може бути й частиною шляху: .../episodes/130/...
+    segments = ['{episode_no}' if segment == str(episode_no) else segment
+                for segment in parsed.path.split('/')]
+    if '{episode_no}' not in segments and not any(value == '{episode_no}' for _, value in query):
+        return None
+
+    query_string = urlencode(query, safe='{}')
+    return urlunparse(parsed._replace(path='/'.join(segments), query=query_string))
+
+
+class FastPathResolver:
+    """
+    ⭐ Швидкий шлях: список зображень епізоду напряму з JSON API інструменту.
+
+    Під час першого завантаження сторінки через Selenium серед XHR-відповідей
+    шукається JSON, що містить URL зображень епізоду, і його URL
+    перетворюється на шаблон. Наступні епізоди отримуються одним запитом
+    requests з cookies сесії браузера (без сторінки, прокрутки та очікувань).
+    Шаблон зберігається у FAST_PATH_CACHE_FILE між запусками.
+    При будь-якій помилці викликач повертається до Selenium - так само, як
+    і коли отриманий список не дав жодного скану (див. confirm).
+    """
+
+    def __init__(self, cache_file, template=None):
+        self.cache_file = cache_file
+        self.template = template
+        self.session = requests.Session()
+        self.has_cookies = False
+        self.failures = 0
+        # Епізоди, список яких отримано швидким шляхом і ще не перевірено аналізом
+        self._unconfirmed = set()
+        self._lock = threading.Lock()
+
+        if not self.template and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self.template = json.load(f).get('endpoint_template')
+            except (OSError, ValueError):
+                pass
+
+    @property
+    def ready(self):
+        return bool(self.template) and self.has_cookies and self.failures < FAST_PATH_MAX_FAILURES
+
+    def set_cookies(self, cookies_dict):
+        """Оновлює cookies сесії (після кожного завантаження сторінки браузером)."""
+        if cookies_dict:
+            self.session.cookies.update(cookies_dict)
+            self.has_cookies = True
+
+    def discover(self, driver, tracker, webtoon_no, episode_no, image_urls):
+        """
+        Шукає серед JSON-відповідей сторінки ту, що містить найбільше
+        зібраних браузером URL зображень.
+
+        Returns:
+            bool: True, якщо шаблон знайдено
+        """
+        captured = set(image_urls)
+        best_url, best_matches = None, 0
+
+        for request_id, url in tracker.json_responses:
+            try:
+                body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            except Exception:
+                continue
+            if body.get('base64Encoded'):
+                continue
+
+            matches = len(captured.intersection(extract_image_urls_from_json(body.get('body', ''))))
+            if matches > best_matches:
+                best_url, best_matches = url, matches
+
+        template = best_url and make_endpoint_template(best_url, webtoon_no, episode_no)
+        if not template:
+            return False
+
+        with self._lock:
+            self.template = template
+            self.failures = 0
+        print(f"✓ Швидкий шлях: знайдено JSON API епізоду ({best_matches} зображень)")
+
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'endpoint_template': template}, f, indent=2)
+        except OSError as e:
+            print(f"⚠ Не вдалося зберегти шаблон швидкого шляху: {e}")
+        return True
+
+    def resolve(self, webtoon_no, episode_no):
+        """
+        Returns:
+            list або None: URL зображень епізоду; None - використати Selenium
+        """
+        url = self.template.format(webtoon_no=webtoon_no, episode_no=episode_no)
+        with METRICS.span('api_resolve', url=url) as span:
+            try:
+                response = self.session.get(url, timeout=15, headers={'Accept': 'application/json'})
+                response.raise_for_status()
+                span['bytes'] = len(response.content)
+                image_urls = extract_image_urls_from_json(response.text)
+            except Exception as e:
+                print(f"⚠ Швидкий шлях недоступний: {e}")
+                span['error'] = type(e).__name__
+                image_urls = []
+
+        if not image_urls:
+            with self._lock:
+                self.failures += 1
+                disabled = self.failures >= FAST_PATH_MAX_FAILURES
+            if disabled:
+                print("⚠ Швидкий шлях вимкнено до кінця запуску")
+            return None
+
+        with self._lock:
+            self._unconfirmed.add((str(webtoon_no), episode_no))
+        return image_urls
+
+    def confirm(self, webtoon_no, episode_no, found_scans):
+        """
+        Перевіряє список епізоду, отриманий швидким шляхом, за результатом аналізу.
+
+        JSON без жодного скану (лише мініатюри, аватари) - це промах швидкого
+        шляху, а не порожній епізод: такий епізод треба зібрати браузером.
+
+        Returns:
+            bool: True - промах, епізод слід зібрати заново через Selenium
+        """
+        key = (str(webtoon_no), episode_no)
+        with self._lock:
+            if key not in self._unconfirmed:
+                return False
+            self._unconfirmed.discard(key)
+            if found_scans:
+                self.failures = 0
+                return False
+            self.failures += 1
+            disabled = self.failures >= FAST_PATH_MAX_FAILURES
+
+        print(f"⚠ Швидкий шлях: у списку епізоду {episode_no} немає сканів")
+        if disabled:
+            print("⚠ Швидкий шлях вимкнено до кінця запуску")
+        return True
+
+
+
+def fast_path_missed(webtoon_no, episode_no, scan_images):
+    """
+    True, якщо список зображень епізоду зі швидкого шляху не дав жодного скану
+    (ні зараз, ні в попередніх запусках за маніфестом).
+    """
+    if not FAST_PATH:
+        return False
+    found_scans = bool(scan_images) or bool(RUN_MANIFEST and RUN_MANIFEST.scan_count(webtoon_no, episode_no))
+    return FAST_PATH.confirm(webtoon_no, episode_no, found_scans)
+
+
+def resolve_episode_images(driver, webtoon_no, episode_no, wait_for_login=False, use_fast_path=True):
+    """
+    Отримує URL зображень епізоду: спершу швидким шляхом (JSON API),
+    а якщо він недоступний - через сторінку в Selenium.
+
+    use_fast_path=False - одразу через браузер (після промаху швидкого шляху,
+    див. fast_path_missed).
+
+    З CAPTURE_REUSE_BODIES зображення, які браузер уже отримав, забираються
+    з нього (крім уже оброблених за маніфестом) - див. analyze_images(bodies=...).
+
+    Returns:
+        tuple: (список URL, словник cookies, словник URL -> результат з браузера)
+    """
+    ensure_configured()
+    if use_fast_path and FAST_PATH and FAST_PATH.ready and not wait_for_login:
+        image_urls = FAST_PATH.resolve(webtoon_no, episode_no)
+        if image_urls:
+            print(f"⚡ Епізод {episode_no}: {len(image_urls)} зображень через JSON API")
+            return image_urls, dict(FAST_PATH.session.cookies), {}
+        print("↩ Повертаємось до завантаження сторінки в браузері")
+
+    tracker = NetworkTracker(driver) if CAPTURE_MODE == 'events' else None
+    url = get_episode_url(webtoon_no, episode_no)
+    all_urls, cookies_dict = collect_image_urls(driver, url, wait_for_login, tracker)
+
+    if FAST_PATH and all_urls:
+        FAST_PATH.set_cookies(cookies_dict)
+        if tracker and not FAST_PATH.ready:
+            FAST_PATH.discover(driver, tracker, webtoon_no, episode_no, all_urls)
+
+    bodies = {}
+    if tracker and CAPTURE_REUSE_BODIES and all_urls:
+        wanted = all_urls
+        if RUN_MANIFEST and not ARCHIVE_OUTPUT:
+            finished = RUN_MANIFEST.finished_urls(webtoon_no, episode_no)
+            wanted = [image_url for image_url in all_urls if image_url not in finished]
+        bodies = tracker.response_bodies(wanted)
+        if wanted:
+            print(f"♻ З браузера: {len(bodies)}/{len(wanted)} зображень, решта - з CDN")
+
+    return all_urls, cookies_dict, bodies
+
+
+# ============================================================================
+# MAIN EXECUTION
+# ============================================================================
+
+def get_episode_url(webtoon_no, episode_no):
+    """Повертає URL інструменту перекладу для епізоду."""
+    return f"https://translate.webtoons.com/translate/tool?webtoonNo={webtoon_no}&episodeNo={episode_no}&language=UKR&teamVersion=0"
+
+
+def report_no_scans():
+    """Пояснює, чому в епізоді могло не знайтися сканів."""
+    print("⚠ Скани не знайдено.")
+    print("  → Переконайтесь, що ви увійшли в акаунт")
+    print("  → Перевірте, чи є скани в цьому епізоді")
+
+
+def submit_scan(storage, scan, folder_id, remote_files=None):
+    """Ставить скан у чергу сховища; з SYNC_ENABLED - з порівнянням з файлом у папці."""
+    if SYNC_ENABLED:
+        return storage.sync(scan, folder_id, (remote_files or {}).get(scan['filename']))
+    return storage.submit(scan, folder_id)
+
+
+def upload_episode_scans(storage, episode_no, scan_images, folder_id=None, webtoon_no=None, remote_files=None):
+    """
+    Паралельно завантажує скани епізоду в сховище (StorageBackend).
+
+    З webtoon_no результат кожного файлу записується в маніфест запуску.
+    remote_files - вміст папки для синхронізації (SYNC_ENABLED).
+
+    Returns:
+        int: кількість успішно завантажених файлів
+    """
+    ensure_configured()
+    if folder_id is None:
+        folder_id = storage.episode_folder(episode_no)
+        print(f"✓ Папка готова ({storage.name}): {FOLDER_PATH}/{episode_no}/\n")
+
+    print(f"Завантаження у сховище {storage.name} (епізод {episode_no})...")
+
+    file_ids = collect_upload_results([submit_scan(storage, scan, folder_id, remote_files) for scan in scan_images])
+
+    return record_episode_uploads(webtoon_no, episode_no, scan_images, file_ids, folder_id)
+
+
+def record_episode_uploads(webtoon_no, episode_no, scan_images, file_ids, folder_id=None):
+    """
+    Записує результати завантаження (у порядку index) та звільняє дані сканів.
+
+    З folder_id успішні завантаження додаються в індекс дедуплікації.
+
+    Returns:
+        int: кількість успішно завантажених файлів
+    """
+    results = sorted(zip(scan_images, file_ids), key=lambda item: item[0]['index'])
+    successful_uploads = sum(1 for _, file_id in results if file_id)
+
+    if webtoon_no is not None:
+        METRICS.episode_add(
+            webtoon_no, episode_no, uploaded=successful_uploads,
+            bytes_uploaded=sum(scan['file'].size for scan, file_id in results
+                               if file_id and scan.get('sync') != 'unchanged')
+        )
+
+    for scan, file_id in results:
+        if DEDUP_INDEX and folder_id is not None:
+            DEDUP_INDEX.record(folder_id, scan.get('original_md5', scan['file'].md5), file_id)
+        if RUN_MANIFEST and webtoon_no is not None:
+            RUN_MANIFEST.record_image(
+                webtoon_no, episode_no, scan['url'], 'uploaded' if file_id else 'failed',
+                index=scan['index'], filename=scan['filename'],
+                md5=scan['file'].md5, size=scan['file'].size,
+                drive_file_id=file_id, error=None if file_id else 'upload',
+                features=scan.get('features')
+            )
+        scan['file'].release()
+
+    print(f"\n✓ Епізод {episode_no}: завантажено {successful_uploads}/{len(scan_images)} файлів")
+    if SYNC_ENABLED:
+        actions = [scan.get('sync') for scan, file_id in results if file_id]
+        print(f"🔄 Синхронізація: без змін {actions.count('unchanged')}, "
+              f"оновлено {actions.count('updated')}, нових {actions.count('created')}")
+    return successful_uploads
+
+
+def prune_episode_folder(storage, webtoon_no, episode_no, folder_id, all_urls):
+    """
+    SYNC_PRUNE: видаляє з папки епізоду файли, що не належать його зображенням.
+
+    Потрібен маніфест (саме з нього видно, які файли, включно з оригіналами
+    дублікатів, належать поточному набору) і повністю успішний епізод -
+    інакше відсутній у наборі файл може бути просто не обробленим.
+
+    Returns:
+        int: кількість видалених файлів
+    """
+    if not (SYNC_ENABLED and SYNC_PRUNE and RUN_MANIFEST) or ARCHIVE_OUTPUT:
+        return 0
+    if RUN_MANIFEST.episode_status(webtoon_no, episode_no) != 'done':
+        print("⚠ Епізод оброблено не повністю - зайві файли не видаляються")
+        return 0
+
+    keep_names, keep_ids = RUN_MANIFEST.stored_files(webtoon_no, episode_no, all_urls)
+    with METRICS.span('prune', episode=f"{webtoon_no}/{episode_no}") as span:
+        removed = storage.prune(folder_id, keep_names, keep_ids)
+        span['files'] = removed
+    if removed:
+        print(f"🧹 Видалено зайвих файлів: {removed}")
+    return removed
+
+
+def finish_episode(webtoon_no, episode_no, scans_total, scans_uploaded):
+    """Записує підсумковий статус епізоду в маніфест."""
+    METRICS.episode_finished(webtoon_no, episode_no)
+
+    if not RUN_MANIFEST:
+        return
+
+    if scans_uploaded < scans_total or RUN_MANIFEST.failed_count(webtoon_no, episode_no):
+        status = 'failed'
+    elif not RUN_MANIFEST.scan_count(webtoon_no, episode_no):
+        # Жодного скану - можливо, сесія не авторизована або список неповний;
+        # не пропускаємо при перезапуску
+        status = 'empty'
+    else:
+        status = 'done'
+
+    RUN_MANIFEST.set_episode(
+        webtoon_no, episode_no, status,
+        scans_total=scans_total, scans_uploaded=scans_uploaded
+    )
+
+
+def process_episode(driver, storage, webtoon_no, episode_no, is_first_episode=False):
+    """Обробляє один епізод."""
+    ensure_configured()
+    METRICS.episode_started(webtoon_no, episode_no)
+    print("\n" + "=" * 70)
+    print(f"ОБРОБКА ЕПІЗОДУ {episode_no}")
+    print("=" * 70)
 
-    driver = None
     try:
-        driver = setup_selenium_driver()
+        folder_id, remote_files = prepare_episode_folder(storage, webtoon_no, episode_no)
+    except Exception as e:
+        print(f"✗ Помилка налаштування папок: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
 
-        print("\n" + "=" * 70)
-        print(f"ПАКЕТНЕ ЗАВАНТАЖЕННЯ: Епізоди {start_episode}-{end_episode}")
-        print("=" * 70)
+    archive = None
+    bodies = None
+    scan_images = []
+    try:
+        use_fast_path = True
+        while True:
+            all_urls, cookies_dict, bodies = resolve_episode_images(
+                driver, webtoon_no, episode_no, is_first_episode, use_fast_path
+            )
+
+            if ARCHIVE_OUTPUT and all_urls:
+                # Архів перезбирається повністю, тож аналізуються всі зображення епізоду
+                archive = EpisodeArchive(len(all_urls))
+                scan_images = analyze_images(all_urls, cookies_dict, None, webtoon_no, episode_no, archive.add,
+                                             bodies=bodies)
+            else:
+                pending_urls = filter_pending_urls(webtoon_no, episode_no, all_urls, remote_files)
+                scan_images = []
+                if pending_urls:
+                    scan_images = analyze_images(all_urls, cookies_dict, pending_urls, webtoon_no, episode_no,
+                                                 folder_id=folder_id, bodies=bodies)
+                else:
+                    release_browser_bodies(bodies)
+
+            if not fast_path_missed(webtoon_no, episode_no, scan_images):
+                break
+            print("↩ Повертаємось до завантаження сторінки в браузері")
+            if archive:
+                archive.discard()
+                archive = None
+            use_fast_path = False
+
+        print(f"\n✓ Знайдено {len(scan_images)} скан(ів)")
+
+        if not scan_images:
+            if archive:
+                archive.discard()
+            if not all_urls:
+                report_no_scans()
+            finish_episode(webtoon_no, episode_no, 0, 0)
+            return True
+
+        if archive:
+            uploaded = upload_episode_archive(storage, episode_no, scan_images, archive, folder_id, webtoon_no)
+        else:
+            uploaded = upload_episode_scans(storage, episode_no, scan_images, folder_id, webtoon_no, remote_files)
+        finish_episode(webtoon_no, episode_no, len(scan_images), uploaded)
+        if not archive:
+            prune_episode_folder(storage, webtoon_no, episode_no, folder_id, all_urls)
+        return True
+
+    except SessionExpiredError:
+        if archive:
+            archive.discard()
+        raise
+
+    except Exception as e:
+        print(f"✗ Помилка: {e}")
+        import traceback
+        traceback.print_exc()
+        if archive:
+            archive.discard()
+        release_browser_bodies(bodies)
+        release_dedup_claims(scan_images, folder_id)
+        if RUN_MANIFEST:
+            RUN_MANIFEST.set_episode(webtoon_no, episode_no, 'failed')
+        return False
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+# Маркер завершення роботи для потоків конвеєра
+_STOP = object()
+
+
+def _analysis_worker(storage, analysis_queue, upload_queue, results, retry_queue):
+    """
+    Стадія 2: готує папку епізоду, завантажує та фільтрує зображення з черги.
+
+    Кожен скан ставиться в чергу сховища одразу після класифікації,
+    а Future завантаження зберігається в scan['upload']. Епізоди, список
+    яких зі швидкого шляху не дав сканів, передаються в retry_queue -
+    стадія 1 збере їх браузером.
+    """
+    while True:
+        item = analysis_queue.get()
+        if item is _STOP:
+            analysis_queue.task_done()
+            return
+
+        try:
+            _analyze_episode(storage, item, upload_queue, results, retry_queue)
+        finally:
+            analysis_queue.task_done()
+
+
+def _analyze_episode(storage, item, upload_queue, results, retry_queue):
+    """Аналіз одного епізоду для _analysis_worker."""
+    webtoon_no, episode_no, all_urls, cookies_dict, bodies = item
+    archive = None
+    folder_id = None
+    scan_images = []
+    try:
+        print(f"\n▶ Аналіз епізоду {episode_no} ({len(all_urls)} зображень)")
+        folder_id, remote_files = prepare_episode_folder(storage, webtoon_no, episode_no)
+
+        if ARCHIVE_OUTPUT:
+            archive = EpisodeArchive(len(all_urls))
+            scan_images = analyze_images(all_urls, cookies_dict, None, webtoon_no, episode_no, archive.add,
+                                         bodies=bodies)
+        else:
+            pending_urls = filter_pending_urls(webtoon_no, episode_no, all_urls, remote_files)
+
+            def on_scan(scan):
+                scan['upload'] = submit_scan(storage, scan, folder_id, remote_files)
+
+            scan_images = []
+            if pending_urls:
+                scan_images = analyze_images(
+                    all_urls, cookies_dict, pending_urls, webtoon_no, episode_no, on_scan, folder_id, bodies
+                )
+            else:
+                release_browser_bodies(bodies)
+        print(f"\n✓ Епізод {episode_no}: знайдено {len(scan_images)} скан(ів)")
+
+        if fast_path_missed(webtoon_no, episode_no, scan_images):
+            if archive:
+                archive.discard()
+            retry_queue.put(episode_no)
+            return
+
+        if not scan_images:
+            if archive:
+                archive.discard()
+            finish_episode(webtoon_no, episode_no, 0, 0)
+            results[episode_no] = True
+            return
+
+        # Блокується, якщо стадія завантаження не встигає (обмежена черга)
+        upload_queue.put((webtoon_no, episode_no, folder_id, scan_images, archive, all_urls, remote_files))
+
+    except Exception as e:
+        print(f"✗ Помилка аналізу епізоду {episode_no}: {e}")
+        import traceback
+        traceback.print_exc()
+        if archive:
+            archive.discard()
+        release_browser_bodies(bodies)
+        release_dedup_claims(scan_images, folder_id)
+        if RUN_MANIFEST:
+            RUN_MANIFEST.set_episode(webtoon_no, episode_no, 'failed')
+        results[episode_no] = False
+
+
+def _upload_worker(storage, upload_queue, results):
+    """Стадія 3: завершує завантаження сканів епізоду у сховище."""
+    while True:
+        item = upload_queue.get()
+        if item is _STOP:
+            return
+
+        webtoon_no, episode_no, folder_id, scan_images, archive, all_urls, remote_files = item
+        try:
+            if archive:
+                uploaded = upload_episode_archive(storage, episode_no, scan_images, archive, folder_id, webtoon_no)
+            elif all('upload' in scan for scan in scan_images):
+                # Скани вже завантажуються з моменту класифікації - чекаємо
+                file_ids = collect_upload_results([scan['upload'] for scan in scan_images])
+                uploaded = record_episode_uploads(webtoon_no, episode_no, scan_images, file_ids, folder_id)
+            else:
+                uploaded = upload_episode_scans(storage, episode_no, scan_images, folder_id, webtoon_no, remote_files)
+            finish_episode(webtoon_no, episode_no, len(scan_images), uploaded)
+            if not archive:
+                prune_episode_folder(storage, webtoon_no, episode_no, folder_id, all_urls)
+            results[episode_no] = True
+        except Exception as e:
+            print(f"✗ Помилка завантаження епізоду {episode_no}: {e}")
+            import traceback
+            traceback.print_exc()
+            release_dedup_claims(scan_images, folder_id)
+            if RUN_MANIFEST:
+                RUN_MANIFEST.set_episode(webtoon_no, episode_no, 'failed')
+            results[episode_no] = False
+
+
+def _collect_episode(driver, webtoon_no, episode_no, wait_for_login, analysis_queue, results, use_fast_path=True):
+    """Стадія 1 конвеєра: збір URL одного епізоду та передача його на аналіз."""
+    METRICS.episode_started(webtoon_no, episode_no)
+    print("\n" + "=" * 70)
+    print(f"ЗБІР ЗОБРАЖЕНЬ ЕПІЗОДУ {episode_no}")
+    print("=" * 70)
+
+    try:
+        all_urls, cookies_dict, bodies = resolve_episode_images(
+            driver, webtoon_no, episode_no, wait_for_login, use_fast_path
+        )
+    except SessionExpiredError:
+        raise
+    except Exception as e:
+        print(f"✗ Помилка збору епізоду {episode_no}: {e}")
+        import traceback
+        traceback.print_exc()
+        results[episode_no] = False
+        return
+
+    if not all_urls:
+        report_no_scans()
+        finish_episode(webtoon_no, episode_no, 0, 0)
+        results[episode_no] = True
+    else:
+        analysis_queue.put((webtoon_no, episode_no, all_urls, cookies_dict, bodies))
+
+
+def _collect_worker(driver, webtoon_no, episode_queue, analysis_queue, results):
+    """Браузер пулу: бере епізоди з черги, доки вона не спорожніє."""
+    while True:
+        try:
+            episode_no = episode_queue.get_nowait()
+        except queue.Empty:
+            return
+
+        _collect_episode(driver, webtoon_no, episode_no, False, analysis_queue, results)
+        time.sleep(1)
+
+
+def run_pipeline(driver, storage, webtoon_no, episodes, pool=None, wait_for_login=True):
+    """
+    ⭐ Конвеєрна обробка епізодів: збір URL -> аналіз -> завантаження.
+
+    Поки браузер збирає URL епізоду N+1, епізод N аналізується та
+    зберігається у сховище. Черги між стадіями обмежені, тож швидка стадія
+    чекає на повільну замість накопичення даних у пам'яті.
+
+    З pool (DriverPool) перший епізод збирається основним браузером
+    (вхід в акаунт), після чого решта епізодів розподіляється між
+    усіма браузерами пулу через спільну чергу.
+
+    Епізоди, список яких зі швидкого шляху не дав сканів, після збору решти
+    збираються ще раз основним браузером (див. fast_path_missed).
+
+    Returns:
+        dict: {episode_no: True/False}
+    """
+    ensure_configured()
+    analysis_queue = queue.Queue(maxsize=PIPELINE_ANALYSIS_QUEUE_SIZE)
+    upload_queue = queue.Queue(maxsize=PIPELINE_UPLOAD_QUEUE_SIZE)
+    retry_queue = queue.Queue()
+    results = {}
+
+    print(f"Конвеєр: аналіз {PIPELINE_ANALYSIS_WORKERS} потік(и), "
+          f"завантаження {PIPELINE_UPLOAD_WORKERS} потік(и)")
+
+    analysis_threads = [
+        threading.Thread(target=_analysis_worker,
+                         args=(storage, analysis_queue, upload_queue, results, retry_queue), daemon=True)
+        for _ in range(PIPELINE_ANALYSIS_WORKERS)
+    ]
+    upload_threads = [
+        threading.Thread(target=_upload_worker, args=(storage, upload_queue, results), daemon=True)
+        for _ in range(PIPELINE_UPLOAD_WORKERS)
+    ]
+    for thread in analysis_threads + upload_threads:
+        thread.start()
+
+    try:
+        # Стадія 1: перший епізод - в головному потоці (потрібен input() для входу)
+        _collect_episode(driver, webtoon_no, episodes[0], wait_for_login, analysis_queue, results)
+
+        if pool and len(episodes) > 1:
+            pool.start()
+
+            episode_queue = queue.Queue()
+            for episode_no in episodes[1:]:
+                episode_queue.put(episode_no)
+
+            collect_threads = [
+                threading.Thread(target=_collect_worker, args=(pool_driver, webtoon_no, episode_queue, analysis_queue, results), daemon=True)
+                for pool_driver in pool.drivers
+            ]
+            for thread in collect_threads:
+                thread.start()
+            for thread in collect_threads:
+                thread.join()
+        else:
+            for episode_no in episodes[1:]:
+                time.sleep(1)
+                _collect_episode(driver, webtoon_no, episode_no, False, analysis_queue, results)
+
+        # Промахи швидкого шляху стають відомі лише після аналізу
+        while True:
+            analysis_queue.join()
+            retries = []
+            while not retry_queue.empty():
+                retries.append(retry_queue.get_nowait())
+            if not retries:
+                break
+            for episode_no in retries:
+                print(f"↩ Епізод {episode_no}: збираємо через браузер")
+                _collect_episode(driver, webtoon_no, episode_no, False, analysis_queue, results, use_fast_path=False)
+
+    finally:
+        # Навіть при SessionExpiredError дочекаємось уже зібраних епізодів
+        for _ in analysis_threads:
+            analysis_queue.put(_STOP)
+        for thread in analysis_threads:
+            thread.join()
+
+        for _ in upload_threads:
+            upload_queue.put(_STOP)
+        for thread in upload_threads:
+            thread.join()
+
+    return results
+
+
+def parse_episode_spec(spec):
+    """
+    Розбирає список епізодів: "130-135", "130,131,140" або "130-132,140".
+
+    Returns:
+        list: номери епізодів без повторів, у порядку запису
+    """
+    episodes = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+            if start <= 0 or end < start:
+                raise ValueError(f"Невалідний діапазон епізодів: {part}")
+            numbers = range(start, end + 1)
+        else:
+            numbers = [int(part)]
+            if numbers[0] <= 0:
+                raise ValueError(f"Невалідний номер епізоду: {part}")
+        episodes.extend(number for number in numbers if number not in episodes)
+
+    if not episodes:
+        raise ValueError(f"Порожній список епізодів: {spec!r}")
+    return episodes
+
+
+def parse_job(text):
+    """Розбирає завдання CLI виду "174:130-135" у (webtoon_no, [епізоди])."""
+    webtoon_no, sep, spec = text.partition(':')
+    if not sep or not webtoon_no.strip():
+        raise ValueError(f"Невалідне завдання '{text}', очікується НОМЕР_ВЕБТУНА:ЕПІЗОДИ")
+    return webtoon_no.strip(), parse_episode_spec(spec)
+
+
+def load_jobs_file(path):
+    """
+    Читає завдання з JSON-файлу:
+
+        [{"webtoon_no": "174", "episodes": "130-135"},
+         {"webtoon_no": "1096", "start": 1, "end": 10},
+         {"webtoon_no": "2001", "episodes": [5, 7, 9]}]
+
+    Returns:
+        list: [(webtoon_no, [епізоди]), ...]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs', [])
+
+    jobs = []
+    for entry in data:
+        webtoon_no = str(entry['webtoon_no']).strip()
+        if 'episodes' in entry:
+            episodes = entry['episodes']
+            if isinstance(episodes, list):
+                episodes = ','.join(str(episode) for episode in episodes)
+        else:
+            episodes = f"{entry['start']}-{entry.get('end', entry['start'])}"
+        jobs.append((webtoon_no, parse_episode_spec(episodes)))
+    return jobs
+
+
+def prompt_job():
+    """Інтерактивний ввід одного завдання (як у попередніх версіях)."""
+    try:
+        webtoon_no = input("Введіть номер Webtoon (напр. 174): ").strip()
+        start_episode = int(input("Введіть ПОЧАТКОВИЙ епізод (напр. 130): ").strip())
+        end_episode = int(input("Введіть КІНЦЕВИЙ епізод (напр. 135): ").strip())
+
+        if not webtoon_no or start_episode <= 0 or end_episode < start_episode:
+            print("✗ Невалідні дані")
+            return None
+
+    except (ValueError, KeyboardInterrupt, EOFError):
+        print("\n✗ Скасовано")
+        return None
+
+    return webtoon_no, list(range(start_episode, end_episode + 1))
+
+
+def run_job(driver, storage, pool, webtoon_no, episodes, wait_for_login):
+    """
+    Обробляє епізоди одного вебтуна спільними браузером і сховищем.
+
+    Returns:
+        tuple: (успішно, з помилками)
+    """
+    ensure_configured()
+    # ⭐ Пропускаємо епізоди, повністю завершені в попередніх запусках
+    pending = []
+    for ep_num in episodes:
+        if is_episode_done(webtoon_no, ep_num):
+            print(f"⏭ Епізод {ep_num} вже завантажено (маніфест), пропускаємо")
+        else:
+            pending.append(ep_num)
 
-        total_success = 0
-        total_failed = 0
+    if not pending:
+        print(f"✓ Усі епізоди вебтуна {webtoon_no} вже завантажено")
+        return 0, 0
 
-        for idx, ep_num in enumerate(range(start_episode, end_episode + 1)):
-            is_first = (idx == 0)
+    if PREFETCH_FOLDERS and not ARCHIVE_OUTPUT:
+        try:
+            found = storage.prefetch(pending)
+            print(f"✓ Знайдено {found} існуючих папок епізодів\n")
+        except Exception as e:
+            print(f"⚠ Не вдалося отримати список папок: {e}")
+
+    print("\n" + "=" * 70)
+    print(f"ПАКЕТНЕ ЗАВАНТАЖЕННЯ: Webtoon {webtoon_no}, епізоди {pending[0]}-{pending[-1]}")
+    print("=" * 70)
+
+    total_success = 0
+    total_failed = 0
+
+    if PIPELINE_ENABLED:
+        results = run_pipeline(driver, storage, webtoon_no, pending, pool, wait_for_login)
+
+        for ep_num in pending:
+            if results.get(ep_num):
+                total_success += 1
+            else:
+                total_failed += 1
+                print(f"⚠ Помилка обробки епізоду {ep_num}")
+    else:
+        for idx, ep_num in enumerate(pending):
+            is_first = wait_for_login and idx == 0
 
             success = process_episode(
                 driver,
-                drive_service,
+                storage,
                 webtoon_no,
                 ep_num,
                 is_first_episode=is_first
@@ -585,9 +5414,76 @@ def main():
                 total_failed += 1
                 print(f"⚠ Помилка обробки епізоду {ep_num}, продовжуємо...")
 
-            if ep_num < end_episode:
+            if idx < len(pending) - 1:
                 time.sleep(1)
 
+    return total_success, total_failed
+
+
+def run_jobs(jobs, headless=False):
+    """
+    Виконує завдання одне за одним в одному процесі: браузер, пул
+    і сховище створюються один раз на весь запуск.
+
+    Returns:
+        int: код завершення (EXIT_*)
+    """
+    ensure_configured()
+    creds = None
+    if 'drive' in STORAGE_BACKENDS:
+        from google.auth.exceptions import RefreshError, TransportError
+
+        try:
+            creds = get_google_credentials(interactive=INTERACTIVE)
+            print("✓ Google Drive автентифіковано")
+        except (SessionExpiredError, RefreshError) as e:
+            # Токен прострочений або відкликаний - потрібен новий вхід
+            print(f"✗ Сесія Google недійсна: {e}")
+            return EXIT_SESSION_EXPIRED
+        except (TransportError, requests.RequestException) as e:
+            # Тимчасова проблема мережі - запуск можна повторити пізніше
+            print(f"✗ Google недоступний: {e}")
+            return EXIT_FAILURE
+        except (OSError, ValueError) as e:
+            # Немає або пошкоджено credentials.json / token.json
+            print(f"✗ Облікові дані Google: {e}")
+            return EXIT_USAGE
+        except Exception as e:
+            print(f"✗ Помилка Google Drive: {e}")
+            return EXIT_FAILURE
+
+    try:
+        storage = create_storage(creds)
+        print(f"✓ Сховище: {storage.name}, структура папок: {FOLDER_PATH}/[номер_епізоду]/\n")
+    except ImportError as e:
+        print(f"✗ Сховище недоступне: {e} (для S3: pip install boto3)")
+        return EXIT_USAGE
+    except (KeyError, ValueError) as e:
+        print(f"✗ Помилка налаштування сховища: {e}")
+        return EXIT_USAGE
+
+    driver = None
+    pool = None
+    total_success = 0
+    total_failed = 0
+    exit_code = EXIT_OK
+    try:
+        driver = setup_selenium_driver(headless=headless)
+
+        if CHROME_WORKERS > 1:
+            if PIPELINE_ENABLED:
+                pool = DriverPool(driver, CHROME_WORKERS)
+            else:
+                print("⚠ Кілька браузерів працюють лише з конвеєром (performance.pipeline.enabled)")
+
+        # Вхід (або перевірка сесії в пакетному режимі) - лише на першому епізоді запуску
+        wait_for_login = True
+        for webtoon_no, episodes in jobs:
+            success, failed = run_job(driver, storage, pool, webtoon_no, episodes, wait_for_login)
+            total_success += success
+            total_failed += failed
+            wait_for_login = wait_for_login and not (success or failed)
+
         print("\n" + "=" * 70)
         print("✓ ПАКЕТНЕ ЗАВАНТАЖЕННЯ ЗАВЕРШЕНО!")
         print("=" * 70)
@@ -595,19 +5491,142 @@ def main():
         print(f"З помилками: {total_failed}")
         print(f"Всього: {total_success + total_failed}")
 
+        if METRICS_REPORT_FILE:
+            try:
+                METRICS.print_summary(METRICS.write_report(METRICS_REPORT_FILE))
+                print(f"\n📊 Звіт запуску: {METRICS_REPORT_FILE}")
+            except OSError as e:
+                print(f"⚠ Не вдалося зберегти звіт: {e}")
+
+        if total_failed:
+            exit_code = EXIT_EPISODES_FAILED
+
+    except SessionExpiredError as e:
+        print(f"\n✗ Сесія недійсна: {e}")
+        exit_code = EXIT_SESSION_EXPIRED
+
     except KeyboardInterrupt:
         print("\n\n⚠ Перервано користувачем (Ctrl+C)")
+        exit_code = EXIT_INTERRUPTED
 
     except Exception as e:
         print(f"\n✗ Критична помилка: {e}")
         import traceback
         traceback.print_exc()
+        exit_code = EXIT_FAILURE
 
     finally:
+        storage.close()
+        shutdown_async_engine()
+        shutdown_transform_pool()
+
+        if pool:
+            pool.close()
+
         if driver:
             print("\nЗакриття браузера...")
             driver.quit()
 
+    return exit_code
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Завантаження сканів з translate.webtoons.com на Google Drive. "
+                    "Без завдань запускається в інтерактивному режимі."
+    )
+    parser.add_argument(
+        '-j', '--job', action='append', default=[], metavar='WEBTOON:EPISODES',
+        help='завдання, напр. 174:130-135 або 174:130,131,140 (можна повторювати)'
+    )
+    parser.add_argument(
+        '--jobs-file', metavar='PATH',
+        help='JSON-файл зі списком завдань'
+    )
+    parser.add_argument(
+        '--config', default='config.json', metavar='PATH',
+        help='файл конфігурації (за замовчуванням config.json)'
+    )
+    parser.add_argument(
+        '--headless', action='store_true',
+        help='запускати Chrome без вікна (профіль має бути вже авторизований)'
+    )
+    parser.add_argument(
+        '--calibrate', action='store_true',
+        help='підібрати пороги класифікатора сканів за маніфестом і вийти'
+    )
+    parser.add_argument(
+        '--export-labels', metavar='PATH',
+        help='записати зображення маніфесту в CSV для ручної розмітки і вийти'
+    )
+    parser.add_argument(
+        '--import-labels', metavar='PATH',
+        help='завантажити ручні мітки (стовпці url, label) з CSV у маніфест'
+    )
+    parser.add_argument(
+        '--beta', type=float, default=1.0, metavar='B',
+        help='вага повноти при калібруванні: >1 - менше пропущених сканів, <1 - менше зайвих (за замовчуванням 1)'
+    )
+    return parser
+
+
+def main(argv=None):
+    """
+    Головна функція виконання.
+
+    Returns:
+        int: код завершення - 0 успіх, 1 є епізоди з помилками,
+             2 невалідні аргументи чи облікові дані (або невдале калібрування
+             чи розмітка), 3 прострочена сесія, 4 збій запуску, 130 Ctrl+C
+    """
+    global INTERACTIVE
+
+    args = build_arg_parser().parse_args(argv)
+
+    print("=" * 70)
+    print("WEBTOONS SCRAPER v3.1")
+    print("=" * 70)
+    print()
+
+    labelling = args.calibrate or args.export_labels or args.import_labels
+    if args.job or args.jobs_file or labelling:
+        # Пакетний режим: без input(), для cron і планувальників
+        INTERACTIVE = False
+
+    try:
+        configure(args.config, interactive=None if INTERACTIVE else False)
+    except (OSError, ValueError) as e:
+        print(f"✗ Помилка конфігурації: {e}")
+        return EXIT_USAGE
+
+    if labelling:
+        if args.export_labels:
+            return export_labels(args.export_labels)
+        if args.import_labels:
+            code = import_labels(args.import_labels)
+            if code != EXIT_OK or not args.calibrate:
+                return code
+        return calibrate_classifier(args.beta)
+
+    if not INTERACTIVE:
+        try:
+            jobs = [parse_job(job) for job in args.job]
+            if args.jobs_file:
+                jobs.extend(load_jobs_file(args.jobs_file))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"✗ Невалідні завдання: {e}")
+            return EXIT_USAGE
+        if not jobs:
+            print("✗ Список завдань порожній")
+            return EXIT_USAGE
+    else:
+        job = prompt_job()
+        if job is None:
+            return EXIT_USAGE
+        jobs = [job]
+
+    return run_jobs(jobs, headless=args.headless)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file